@@ -1,775 +1,197 @@
 import os
 from dotenv import load_dotenv
-import json
-import requests
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
-from werkzeug.utils import secure_filename
-import pdfplumber
-from pdf2image import convert_from_path
-import pytesseract
-from quizpasa import handle_chat_message, get_welcome_message
-from flask import session
-
-
-import docx2txt
-from docx import Document
-from pptx import Presentation
-import tempfile
-import shutil
-from PIL import Image, ImageEnhance, ImageFilter
-import io
-import subprocess
-import sys
-import fitz  # PyMuPDF - better for image extraction from PDFs
-import zipfile
-from io import BytesIO
-import base64
-
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your-secret-key-here'
-app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-
-# Configure session for temporary storage
-app.config['SESSION_TYPE'] = 'filesystem'
-app.config['SESSION_PERMANENT'] = False
-app.config['SESSION_USE_SIGNER'] = True
-app.config['SESSION_KEY_PREFIX'] = 'studypasa:'
-
 
+# Load .env before the modules below read their settings
+load_dotenv()
 
-# Ensure uploads directory exists
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
-ALLOWED_EXTENSIONS = {'pdf', 'docx', 'doc', 'pptx', 'png', 'jpg', 'jpeg', 'tiff', 'bmp'}
-
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-
-
-def validate_file_content(file_path, file_ext):
-    """Validate file content before processing"""
-    try:
-        # Check if file is empty
-        if os.path.getsize(file_path) == 0:
-            return False, 'The file is empty'
-            
-        # Basic validation based on file type
-        if file_ext in ['doc', 'docx']:
-            try:
-                if file_ext == 'doc':
-                    # Use docx2txt for .doc files
-                    text = docx2txt.process(file_path)
-                    if not text or not text.strip():
-                        return False, 'The document contains no readable text'
-                else:
-                    # Use python-docx for .docx files
-                    doc = Document(file_path)
-                    has_content = False
-                    
-                    # Check paragraphs
-                    for paragraph in doc.paragraphs:
-                        if paragraph.text.strip():
-                            has_content = True
-                            break
-                    
-                    # Check tables if no paragraph content
-                    if not has_content:
-                        for table in doc.tables:
-                            for row in table.rows:
-                                for cell in row.cells:
-                                    if cell.text.strip():
-                                        has_content = True
-                                        break
-                                if has_content:
-                                    break
-                            if has_content:
-                                break
-                    
-                    if not has_content:
-                        return False, 'The document contains no readable text'
-                        
-                return True, ''
-                
-            except Exception as e:
-                return False, f'The document appears to be corrupted or invalid: {str(e)}'
-                
-        elif file_ext == 'pdf':
-            try:
-                with pdfplumber.open(file_path) as pdf:
-                    if len(pdf.pages) == 0:
-                        return False, 'The PDF contains no pages'
-                    return True, ''
-            except Exception as e:
-                return False, f'The PDF appears to be corrupted or password protected: {str(e)}'
-                
-        elif file_ext == 'pptx':
-            try:
-                prs = Presentation(file_path)
-                if len(prs.slides) == 0:
-                    return False, 'The presentation contains no slides'
-                # Check if any slide has text
-                has_text = False
-                for slide in prs.slides:
-                    for shape in slide.shapes:
-                        if hasattr(shape, 'text') and shape.text.strip():
-                            has_text = True
-                            break
-                    if has_text:
-                        break
-                if not has_text:
-                    return False, 'The presentation contains no readable text'
-                return True, ''
-            except Exception as e:
-                return False, f'The presentation appears to be corrupted or invalid: {str(e)}'
-                    
-        elif file_ext in ['png', 'jpg', 'jpeg', 'tiff', 'bmp']:
-            try:
-                with Image.open(file_path) as img:
-                    # Check if image is not completely blank or black
-                    extrema = img.convert('L').getextrema()
-                    if extrema[0] == extrema[1]:  # All pixels are the same value
-                        return False, 'The image appears to be blank or contains no content'
-                    # Check if image is too small for reliable OCR
-                    if img.size[0] < 50 or img.size[1] < 50:
-                        return False, 'The image is too small for text extraction'
-                    # For images, allow validation to pass so OCR can be applied
-                    return True, ''
-            except Exception as e:
-                return False, f'The image appears to be corrupted or in an invalid format: {str(e)}'
-                
-    except Exception as e:
-        return False, f'Error validating file: {str(e)}'
-
-
-def setup_tesseract():
-    """Enhanced Tesseract setup with better path detection"""
-    try:
-        # First try the default command
-        result = subprocess.run(['tesseract', '--version'], 
-                              capture_output=True, text=True, timeout=10)
-        if result.returncode == 0:
-            print(f"Tesseract found: {result.stdout.split()[1]}")
-            return True
-    except:
-        pass
+import json
+from flask import Blueprint, Flask, Response, current_app, render_template, request, redirect, url_for, flash, jsonify, session, stream_with_context
+from werkzeug.utils import secure_filename
+from quizpasa import handle_chat_message, stream_chat_message, get_welcome_message
+from ocr_engine import ocr_engine
+from extraction import ExtractionPipeline, extraction_cache_version, setup_tesseract, validate_document
+from extraction_cache import extraction_cache
+from uploads import save_upload
+from generation import generate_study_material
+from jobs import job_queue, JobError, JobQueueFull
+from session_store import session_store
+from conversation import load_history, append_turn
+from study_context import build_context
+from retrieval import retrieval_store
+from metrics import metrics
+
+bp = Blueprint('studypasa', __name__)
+
+
+def create_app(config=None):
+    """Create the Flask application
+
+    Used by the WSGI entry point (wsgi.py) and the development server;
+    `config` overrides the defaults, e.g. for tests.
+    """
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
+    app.config['UPLOAD_FOLDER'] = 'uploads'
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
     
-    # Try common installation paths
-    possible_paths = [
-        r'C:\Program Files\Tesseract-OCR\tesseract.exe',
-        r'C:\Program Files (x86)\Tesseract-OCR\tesseract.exe',
-        r'C:\Users\{}\AppData\Local\Tesseract-OCR\tesseract.exe'.format(os.getenv('USERNAME', '')),
-        '/usr/bin/tesseract',
-        '/usr/local/bin/tesseract',
-        '/opt/homebrew/bin/tesseract',
-        '/usr/local/Cellar/tesseract/*/bin/tesseract'  # Homebrew on macOS
-    ]
+    # The session cookie only holds an opaque ID; study material is kept
+    # server-side in session_store
+    app.config['SESSION_PERMANENT'] = False
     
-    for path in possible_paths:
-        if os.path.exists(path):
-            try:
-                pytesseract.pytesseract.tesseract_cmd = path
-                result = subprocess.run([path, '--version'], 
-                                      capture_output=True, text=True, timeout=10)
-                if result.returncode == 0:
-                    print(f"Tesseract found at: {path}")
-                    return True
-            except:
-                continue
+    if config:
+        app.config.update(config)
     
-    print("Tesseract not found. Please install it:")
-    print("Windows: Download from https://github.com/UB-Mannheim/tesseract/wiki")
-    print("Linux: sudo apt-get install tesseract-ocr")
-    print("macOS: brew install tesseract")
-    return False
-
-def preprocess_image_for_ocr(image):
-    """Enhance image for better OCR results"""
-    try:
-        # Convert to grayscale
-        if image.mode != 'L':
-            image = image.convert('L')
-        
-        # Enhance contrast
-        enhancer = ImageEnhance.Contrast(image)
-        image = enhancer.enhance(2.0)
-        
-        # Enhance sharpness
-        enhancer = ImageEnhance.Sharpness(image)
-        image = enhancer.enhance(2.0)
-        
-        # Apply slight blur to reduce noise
-        image = image.filter(ImageFilter.MedianFilter(size=3))
-        
-        return image
-    except Exception as e:
-        print(f"Error preprocessing image: {e}")
-        return image
-
-def extract_text_from_image(file_path):
-    """Enhanced image text extraction with better OCR"""
-    try:
-        print(f"Extracting text from image: {file_path}")
-        
-        if not setup_tesseract():
-            flash("Tesseract OCR is not installed. Please install it to process images.", 'error')
-            return ""
-        
-        with Image.open(file_path) as img:
-            print(f"Original image - Mode: {img.mode}, Size: {img.size}")
-            
-            # Convert to RGB if necessary
-            if img.mode not in ['L', 'RGB']:
-                img = img.convert('RGB')
-            
-            # Preprocess image for better OCR
-            processed_img = preprocess_image_for_ocr(img)
-            
-            # Try multiple OCR configurations
-            ocr_configs = [
-                '--psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,!?;: ',
-                '--psm 4 --oem 3',
-                '--psm 3 --oem 3',
-                '--psm 6 --oem 3',
-                '--psm 1 --oem 3',
-                '--psm 8 --oem 3',
-                '--psm 13 --oem 3'
-            ]
-            
-            best_text = ""
-            best_length = 0
-            
-            for config in ocr_configs:
-                try:
-                    text = pytesseract.image_to_string(processed_img, lang='eng', config=config)
-                    if len(text.strip()) > best_length:
-                        best_text = text
-                        best_length = len(text.strip())
-                        print(f"Better result with config '{config}': {best_length} chars")
-                except Exception as e:
-                    print(f"OCR config '{config}' failed: {e}")
-                    continue
-            
-            # If still no good result, try with original image
-            if best_length < 10:
-                try:
-                    text = pytesseract.image_to_string(img, lang='eng')
-                    if len(text.strip()) > best_length:
-                        best_text = text
-                        print(f"Better result with original image: {len(text.strip())} chars")
-                except Exception as e:
-                    print(f"Original image OCR failed: {e}")
-            
-            print(f"Final OCR result: {len(best_text)} characters")
-            return best_text.strip()
-    
-    except Exception as e:
-        print(f"Error in extract_text_from_image: {e}")
-        return ""
-
-def extract_images_from_pdf(file_path):
-    """Extract images from PDF and perform OCR"""
-    text = ""
+    # Ensure uploads directory exists
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
-    try:
-        doc = fitz.open(file_path)
-        print(f"PDF has {len(doc)} pages")
-        
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            image_list = page.get_images()
-            
-            print(f"Page {page_num + 1} has {len(image_list)} images")
-            
-            for img_index, img in enumerate(image_list):
-                try:
-                    # Get image data
-                    xref = img[0]
-                    pix = fitz.Pixmap(doc, xref)
-                    
-                    # Convert to PIL Image
-                    if pix.n - pix.alpha < 4:  # GRAY or RGB
-                        img_data = pix.tobytes("ppm")
-                        pil_image = Image.open(io.BytesIO(img_data))
-                        
-                        # Preprocess and OCR
-                        processed_img = preprocess_image_for_ocr(pil_image)
-                        
-                        # Extract text from image
-                        img_text = pytesseract.image_to_string(processed_img, lang='eng', config='--psm 6')
-                        
-                        if img_text.strip():
-                            text += f"\n[Image {img_index + 1} from Page {page_num + 1}]:\n{img_text}\n"
-                            print(f"Extracted {len(img_text)} chars from image {img_index + 1} on page {page_num + 1}")
-                    
-                    pix = None
-                    
-                except Exception as e:
-                    print(f"Error processing image {img_index + 1} on page {page_num + 1}: {e}")
-                    continue
-        
-        doc.close()
-        
-    except Exception as e:
-        print(f"Error extracting images from PDF: {e}")
+    # Probe for Tesseract once at startup; requests reuse the cached result
+    ocr_engine.probe()
     
-    return text
+    app.register_blueprint(bp)
+    return app
 
-def extract_images_from_docx(file_path):
-    """Extract images from DOCX and perform OCR"""
-    text = ""
-    
-    try:
-        # DOCX is essentially a ZIP file
-        with zipfile.ZipFile(file_path, 'r') as docx_zip:
-            # Look for image files in the media folder
-            image_files = [f for f in docx_zip.namelist() if f.startswith('word/media/')]
-            
-            print(f"Found {len(image_files)} images in DOCX")
-            
-            for img_file in image_files:
-                try:
-                    # Extract image data
-                    img_data = docx_zip.read(img_file)
-                    
-                    # Convert to PIL Image
-                    pil_image = Image.open(io.BytesIO(img_data))
-                    
-                    # Preprocess and OCR
-                    processed_img = preprocess_image_for_ocr(pil_image)
-                    
-                    # Extract text
-                    img_text = pytesseract.image_to_string(processed_img, lang='eng', config='--psm 6')
-                    
-                    if img_text.strip():
-                        text += f"\n[Image from DOCX: {img_file}]:\n{img_text}\n"
-                        print(f"Extracted {len(img_text)} chars from {img_file}")
-                
-                except Exception as e:
-                    print(f"Error processing image {img_file}: {e}")
-                    continue
-    
-    except Exception as e:
-        print(f"Error extracting images from DOCX: {e}")
-    
-    return text
+ALLOWED_EXTENSIONS = {'pdf', 'docx', 'doc', 'pptx', 'png', 'jpg', 'jpeg', 'tiff', 'bmp'}
 
-def extract_images_from_pptx(file_path):
-    """Extract images from PPTX and perform OCR"""
-    text = ""
-    
-    try:
-        # PPTX is also a ZIP file
-        with zipfile.ZipFile(file_path, 'r') as pptx_zip:
-            # Look for image files in the media folder
-            image_files = [f for f in pptx_zip.namelist() if f.startswith('ppt/media/')]
-            
-            print(f"Found {len(image_files)} images in PPTX")
-            
-            for img_file in image_files:
-                try:
-                    # Extract image data
-                    img_data = pptx_zip.read(img_file)
-                    
-                    # Convert to PIL Image
-                    pil_image = Image.open(io.BytesIO(img_data))
-                    
-                    # Preprocess and OCR
-                    processed_img = preprocess_image_for_ocr(pil_image)
-                    
-                    # Extract text
-                    img_text = pytesseract.image_to_string(processed_img, lang='eng', config='--psm 6')
-                    
-                    if img_text.strip():
-                        text += f"\n[Image from PPTX: {img_file}]:\n{img_text}\n"
-                        print(f"Extracted {len(img_text)} chars from {img_file}")
-                
-                except Exception as e:
-                    print(f"Error processing image {img_file}: {e}")
-                    continue
-    
-    except Exception as e:
-        print(f"Error extracting images from PPTX: {e}")
-    
-    return text
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def extract_text_from_pdf(file_path):
-    """Enhanced PDF text extraction with image OCR"""
-    text = ""
-    
-    try:
-        print(f"Processing PDF: {file_path}")
-        
-        # First, extract regular text with pdfplumber
-        with pdfplumber.open(file_path) as pdf:
-            for page_num, page in enumerate(pdf.pages):
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-                    print(f"Page {page_num + 1}: Extracted {len(page_text)} characters with pdfplumber")
-        
-        # Then extract text from images in the PDF
-        if setup_tesseract():
-            image_text = extract_images_from_pdf(file_path)
-            if image_text:
-                text += "\n=== TEXT FROM IMAGES ===\n" + image_text
-        
-        # If still no text, try OCR on the entire PDF pages
-        if not text.strip() or len(text.strip()) < 50:
-            print("Minimal text found, trying full page OCR...")
-            
-            if setup_tesseract():
-                try:
-                    images = convert_from_path(file_path, dpi=300)
-                    ocr_text = ""
-                    
-                    for i, image in enumerate(images):
-                        processed_img = preprocess_image_for_ocr(image)
-                        page_text = pytesseract.image_to_string(processed_img, lang='eng', config='--psm 6')
-                        ocr_text += f"\n[Page {i + 1} OCR]:\n{page_text}\n"
-                        print(f"OCR Page {i + 1}: Extracted {len(page_text)} characters")
-                    
-                    if ocr_text.strip():
-                        text = ocr_text
-                        
-                except Exception as e:
-                    print(f"Full page OCR failed: {e}")
-    
-    except Exception as e:
-        print(f"Error processing PDF: {e}")
-    
-    return text
 
 
-def extract_text_from_docx(file_path):
-    """Enhanced DOCX/DOC text extraction with image OCR"""
+@bp.route('/')
+def index():
+    return render_template('index.html')
+
+def process_upload(job, upload):
+    """Validate, extract and generate study material for a stored upload
+
+    Runs on the background job queue. Progress is reported through `job`;
+    user-facing failures are raised as JobError.
+    """
+    # Extract text based on file type
     text = ""
+    filename, file_ext = upload.filename, upload.file_ext
+    document = upload.open_document()
     
     try:
-        file_ext = file_path.rsplit('.', 1)[1].lower()
-        print(f"Processing {file_ext.upper()}: {file_path}")
-        
-        if file_ext == 'doc':
-            # Handle .doc files using docx2txt
-            text = docx2txt.process(file_path)
-            print(f"DOC text extracted: {len(text)} characters")
-        elif file_ext == 'docx':
-            # Handle .docx files using python-docx (for better table support)
-            doc = Document(file_path)
+        print(f"Processing file: {filename} (type: {file_ext})")
+        print(f"File size: {document.size/1024:.2f} KB")
+        
+        # Repeat uploads of the same bytes reuse the cached extraction; the
+        # digest was computed while the upload was stored
+        digest = upload.digest
+        cache_version = extraction_cache_version()
+        cached = extraction_cache.get(digest, cache_version)
+        metrics.inc('uploads_total', file_type=file_ext)
+        metrics.inc('cache_requests_total', cache='extraction', result='miss' if cached is None else 'hit')
+        
+        if cached is not None:
+            text = cached['text']
+            print("Using cached extraction result")
+        else:
+            # Validate file content before processing
+            job.update(stage='validate')
+            with metrics.span('validate', file_type=file_ext):
+                is_valid, validation_error = validate_document(document)
+            if not is_valid:
+                raise JobError(validation_error)
             
-            # Extract text from paragraphs
-            for paragraph in doc.paragraphs:
-                if paragraph.text.strip():  # Only add non-empty paragraphs
-                    text += paragraph.text + "\n"
+            if file_ext in ['png', 'jpg', 'jpeg', 'tiff', 'bmp'] and not setup_tesseract():
+                raise JobError('Tesseract OCR is not installed. Please install it to process images.')
             
-            # Extract text from tables
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        if cell.text.strip():  # Only add non-empty cells
-                            text += cell.text + "\n"
+            # Each extraction stage runs at most once; the pipeline reuses
+            # earlier outputs (e.g. full-page OCR of scanned PDFs)
+            job.update(stage='extract')
+            pipeline = ExtractionPipeline(document, progress=job.progress)
+            with metrics.span('extract', file_type=file_ext) as span:
+                text = pipeline.extract()
+                span.set(chars=len(text))
             
-            print(f"DOCX text extracted: {len(text)} characters")
-        
-        # Extract text from images in DOCX (only for .docx files)
-        if file_ext == 'docx' and setup_tesseract():
-            try:
-                image_text = extract_images_from_docx(file_path)
+            # If minimal text was found, fall back to the OCR'd images alone
+            if file_ext in ['docx', 'pptx'] and pipeline.is_minimal(text):
+                image_text = pipeline.image_text()
                 if image_text:
-                    text += "\n=== TEXT FROM IMAGES ===\n" + image_text
-            except Exception as e:
-                print(f"Error extracting images from DOCX: {e}")
+                    text = image_text
+            
+            # Partial text from a timed-out or failed OCR run is used once, never cached
+            if pipeline.incomplete:
+                print("OCR timed out or failed on some pages, not caching the partial extraction")
+            elif text.strip():
+                extraction_cache.put(digest, cache_version, {
+                    'file_ext': file_ext,
+                    'text': text,
+                    'stages': pipeline.stages
+                })
+        
+        document.close()
+        print(f"Total extracted text length: {len(text)} characters")
         
-        # If no text was extracted, provide a helpful message
         if not text.strip():
-            print(f"No text extracted from {file_ext.upper()} file")
-            return ""
-        
-        return text.strip()
-        
-    except Exception as e:
-        print(f"Error extracting text from DOCX/DOC: {e}")
-        return ""
-
-    
-def extract_text_from_pptx(file_path):
-    """Enhanced PPTX text extraction with image OCR"""
-    text = ""
-    
-    try:
-        print(f"Processing PPTX: {file_path}")
-        
-        # Extract regular text
-        prs = Presentation(file_path)
-        for slide_num, slide in enumerate(prs.slides):
-            text += f"\n=== SLIDE {slide_num + 1} ===\n"
-            for shape in slide.shapes:
-                if hasattr(shape, "text") and shape.text:
-                    text += shape.text + "\n"
-        
-        print(f"PPTX text extracted: {len(text)} characters")
-        
-        # Extract text from images
-        if setup_tesseract():
-            image_text = extract_images_from_pptx(file_path)
-            if image_text:
-                text += "\n=== TEXT FROM IMAGES ===\n" + image_text
-    
-    except Exception as e:
-        print(f"Error extracting text from PPTX: {e}")
-    
-    return text
-
-def generate_mcqs_with_groq(text, num_questions=10):
-    """Generate MCQs using GROQ API"""
-    # Load environment variables
-    load_dotenv()
-    # GROQ API configuration
-    GROQ_API_KEY = os.getenv("GROQ_API_KEY", "your-groq-api-key-here")
-    GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
-    # If no API key is provided, use fallback
-    if not GROQ_API_KEY or GROQ_API_KEY == "your-groq-api-key-here":
-        print("No GROQ API key provided, using fallback MCQ generation")
-        return create_content_based_mcqs(text, num_questions)
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    # Extract key topics and themes from the text
-    text_preview = text[:4000] if len(text) > 4000 else text
-    
-    prompt = f"""
-    You are an expert question generator. Based on the following text content, create {num_questions} high-quality multiple choice questions (MCQs).
-
-    CONTENT TO ANALYZE:
-    {text_preview}
-
-    REQUIREMENTS:
-    1. Questions must be directly related to the content above
-    2. Cover different topics and concepts from the text
-    3. Mix of difficulty levels (easy, medium, hard)
-    4. Each question has exactly 4 options
-    5. Only ONE correct answer per question
-    6. Distractors should be plausible but clearly wrong
-    7. Focus on key concepts, facts, and important details
-
-    RESPONSE FORMAT (JSON only):
-    {{
-        "questions": [
-            {{
-                "question": "What is the main concept discussed regarding [specific topic]?",
-                "options": [
-                    "Correct answer based on text",
-                    "Plausible but incorrect option",
-                    "Another plausible but incorrect option",
-                    "Third plausible but incorrect option"
-                ],
-                "correct_answer": 0
-            }}
-        ]
-    }}
-
-    Generate {num_questions} questions now. Return ONLY the JSON response, no additional text.
-    """
-    
-    payload = {
-        "model": "llama3-8b-8192",
-        "messages": [
-            {
-                "role": "system",
-                "content": "You are an expert educational content creator specializing in generating high-quality multiple choice questions from text content. Always respond with valid JSON format only."
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        "temperature": 0.3,
-        "max_tokens": 2500
-    }
-    
-    try:
-        print(f"Calling GROQ API to generate {num_questions} MCQs...")
-        response = requests.post(GROQ_API_URL, headers=headers, json=payload)
+            error_msg = 'No text could be extracted from the file. This might be because:\n'
+            error_msg += '- The file is password protected\n'
+            error_msg += '- The file contains scanned images without OCR\n'
+            error_msg += '- The file is corrupted or empty\n'
+            error_msg += '- The file contains only non-text content (like images)\n\n'
+            error_msg += 'Please ensure the file contains readable text and try again.'
+            raise JobError(error_msg)
+        
+        # Generate MCQs and flashcards concurrently
+        job.update(stage='generate')
+        with metrics.span('generate'):
+            mcqs, flashcards = generate_study_material(text, num_questions=10, num_flashcards=10)
+        
+        # Render the chat context once; every QuizPasa turn reuses it
+        context = build_context(mcqs, flashcards)
+        
+        # Index the source text so chat answers can quote the document
+        try:
+            retrieval_id = retrieval_store.build(text)
+        except Exception as e:
+            print(f"Error building retrieval index: {e}")
+            retrieval_id = None
+        
+        return {
+            'mcqs': mcqs,
+            'flashcards': flashcards,
+            'filename': filename,
+            'context': context,
+            'retrieval_id': retrieval_id
+        }
         
-        if response.status_code == 200:
-            result = response.json()
-            content = result['choices'][0]['message']['content'].strip()
-            
-            # Clean up the response
-            if content.startswith('```json'):
-                content = content.replace('```json', '').replace('```', '').strip()
-            
-            try:
-                mcq_data = json.loads(content)
-                if 'questions' in mcq_data and len(mcq_data['questions']) > 0:
-                    print(f"Successfully generated {len(mcq_data['questions'])} MCQs")
-                    return mcq_data['questions']
-                else:
-                    print("No questions found in API response")
-                    return create_content_based_mcqs(text, num_questions)
-            except json.JSONDecodeError as e:
-                print(f"JSON parsing error: {e}")
-                return create_content_based_mcqs(text, num_questions)
-        else:
-            print(f"GROQ API error: {response.status_code} - {response.text}")
-            return create_content_based_mcqs(text, num_questions)
-            
-    except Exception as e:
-        print(f"Error calling GROQ API: {e}")
-        return create_content_based_mcqs(text, num_questions)
-
-def create_content_based_mcqs(text, num_questions=10):
-    """Create MCQs based on actual text content"""
-    
-    words = text.split()
-    sentences = [s.strip() for s in text.split('.') if s.strip()]
-    paragraphs = [p.strip() for p in text.split('\n') if p.strip()]
-    
-    questions = []
-    
-    # Question 1: About document content
-    if len(sentences) > 0:
-        first_sentence = sentences[0][:100] + "..." if len(sentences[0]) > 100 else sentences[0]
-        questions.append({
-            "question": f"According to the document, what is mentioned in the opening section?",
-            "options": [
-                f"Content related to: {first_sentence}",
-                "Financial planning strategies",
-                "Sports team statistics",
-                "Weather forecast data"
-            ],
-            "correct_answer": 0
-        })
-    
-    # Question 2: About document length
-    word_count = len(words)
-    questions.append({
-        "question": f"Approximately how many words does this document contain?",
-        "options": [
-            f"Around {word_count} words",
-            f"Around {word_count//2} words",
-            f"Around {word_count*2} words",
-            "Less than 100 words"
-        ],
-        "correct_answer": 0
-    })
-    
-    # Add more questions following the same pattern...
-    # (Include the rest of the original create_content_based_mcqs function here)
-    
-    return questions[:num_questions]
-
-def generate_flashcards_with_groq(text, num_flashcards=10):
-    load_dotenv()
-    GROQ_API_KEY = os.getenv("GROQ_API_KEY", "your-groq-api-key-here")
-    GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
-
-    if not GROQ_API_KEY or GROQ_API_KEY == "your-groq-api-key-here":
-        print("No GROQ API key provided for flashcards, using fallback generation")
-        return create_content_based_flashcards(text, num_flashcards)
-
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
-    text_preview = text[:4000] if len(text) > 4000 else text
-
-    prompt = f"""
-    You are an expert flashcard generator. Based on the following text content, create {num_flashcards} high-quality flashcards.
-
-    CONTENT TO ANALYZE:
-    {text_preview}
-
-    REQUIREMENTS:
-    1. Each flashcard must have a clear 'front' (question/term) and 'back' (answer/definition).
-    2. Flashcards must be directly related to the content above.
-    3. Cover different topics and concepts from the text.
-    4. Focus on key concepts, facts, and important details.
-
-    RESPONSE FORMAT (JSON only):
-    {{
-        "flashcards": [
-            {{
-                "front": "What is [key concept]?",
-                "back": "[Definition/Explanation of key concept]"
-            }}
-        ]
-    }}
-
-    Generate {num_flashcards} flashcards now. Return ONLY the JSON response, no additional text.
-    """
-
-    payload = {
-        "model": "llama3-8b-8192",
-        "messages": [
-            {
-                "role": "system",
-                "content": "You are an expert educational content creator specializing in generating high-quality flashcards from text content. Always respond with valid JSON format only."
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        "temperature": 0.3,
-        "max_tokens": 2500
-    }
-
-    try:
-        print(f"Calling GROQ API to generate {num_flashcards} flashcards...")
-        response = requests.post(GROQ_API_URL, headers=headers, json=payload)
-
-        if response.status_code == 200:
-            result = response.json()
-            content = result['choices'][0]['message']['content'].strip()
-
-            if content.startswith('```json'):
-                content = content.replace('```json', '').replace('```', '').strip()
-
-            try:
-                flashcard_data = json.loads(content)
-                if 'flashcards' in flashcard_data and len(flashcard_data['flashcards']) > 0:
-                    print(f"Successfully generated {len(flashcard_data['flashcards'])} flashcards")
-                    return flashcard_data['flashcards']
-                else:
-                    print("No flashcards found in API response")
-                    return create_content_based_flashcards(text, num_flashcards)
-            except json.JSONDecodeError as e:
-                print(f"JSON parsing error for flashcards: {e}")
-                return create_content_based_flashcards(text, num_flashcards)
-        else:
-            print(f"GROQ API error for flashcards: {response.status_code} - {response.text}")
-            return create_content_based_flashcards(text, num_flashcards)
-
+    except JobError:
+        raise
+    except (PermissionError, OSError) as e:
+        print(f"File access error: {e}")
+        raise JobError('Unable to access the file. The file might be in use or you may not have permission to read it.')
     except Exception as e:
-        print(f"Error calling GROQ API for flashcards: {e}")
-        return create_content_based_flashcards(text, num_flashcards)
-
-def create_content_based_flashcards(text, num_flashcards=10):
-    """Fallback: Create simple flashcards based on text content"""
-    flashcards = []
-    sentences = [s.strip() for s in text.split('.') if s.strip()]
-
-    for i in range(min(num_flashcards, len(sentences) // 2)):
-        front = sentences[i * 2]
-        back = sentences[i * 2 + 1] if (i * 2 + 1) < len(sentences) else "No further content."
-        flashcards.append({"front": front, "back": back})
-
-    if not flashcards and sentences:
-        # If not enough pairs, create single flashcard from first sentence
-        flashcards.append({"front": sentences[0], "back": "Key point from the text."})
-
-    return flashcards[:num_flashcards]
-
-@app.route('/')
-def index():
-    return render_template('index.html')
-
-@app.route('/upload', methods=['GET', 'POST'])
+        print(f"Exception during processing: {e}")
+        error_msg = 'Error processing file. Please check that:\n'
+        error_msg += '- The file is not corrupted\n'
+        error_msg += '- The file format matches its extension\n'
+        error_msg += '- The file is not encrypted or password protected'
+        raise JobError(error_msg)
+    finally:
+        # Clean up uploaded file
+        document.close()
+        upload.cleanup()
+
+def current_study_material():
+    """Study material of the current browser session, or an empty dict"""
+    return session_store.get(session.get('study_id')) or {}
+
+def chat_session_id():
+    """Session-store ID holding this browser's chat history, created if missing"""
+    session_id = session.get('study_id')
+    if session_store.get(session_id) is None:
+        session_id = session_store.create({})
+        session['study_id'] = session_id
+    return session_id
+
+def wants_json():
+    """Check whether the client expects a JSON response (fetch/XHR)"""
+    return (request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+            or request.accept_mimetypes.best == 'application/json')
+
+@bp.route('/upload', methods=['GET', 'POST'])
 def upload():
     if request.method == 'POST':
         # Check if file is present
@@ -785,130 +207,95 @@ def upload():
         
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            
-            # Extract text based on file type
-            file_ext = filename.rsplit('.', 1)[1].lower()
-            text = ""
-            print(f"Processing file: {filename} (type: {file_ext})")
-            file_size = os.path.getsize(file_path)
-            print(f"File size: {file_size/1024:.2f} KB")
             
-            # Validate file content before processing
-            is_valid, validation_error = validate_file_content(file_path, file_ext)
-            if not is_valid:
-                flash(validation_error, 'error')
-                os.remove(file_path)
-                return redirect(request.url)
+            # Each upload gets its own storage: small files stay in memory,
+            # larger ones go to a private temp directory
+            job_id = job_queue.new_id()
+            stored = save_upload(file.stream, filename, current_app.config['UPLOAD_FOLDER'])
             
             try:
-                if file_ext == 'pdf':
-                    # First try to extract text normally
-                    text = extract_text_from_pdf(file_path)
-                    
-                    # If minimal text was extracted, try full page OCR
-                    if not text.strip() or len(text.strip()) < 50:
-                        print("Minimal text found in PDF, attempting full page OCR...")
-                        if setup_tesseract():
-                            try:
-                                images = convert_from_path(file_path, dpi=300)
-                                ocr_text = ""
-                                
-                                for i, image in enumerate(images):
-                                    processed_img = preprocess_image_for_ocr(image)
-                                    page_text = pytesseract.image_to_string(processed_img, lang='eng', config='--psm 6')
-                                    if page_text.strip():
-                                        ocr_text += f"\n[Page {i + 1}]:\n{page_text}\n"
-                                        print(f"OCR Page {i + 1}: Extracted {len(page_text)} characters")
-                                
-                                if ocr_text.strip():
-                                    text = ocr_text
-                                    print("Successfully extracted text using full page OCR")
-                            except Exception as e:
-                                print(f"Full page OCR failed: {e}")
-                
-                elif file_ext in ['docx', 'doc']:
-                    text = extract_text_from_docx(file_path)
-                    # If minimal text was found, try OCR on any images in the document
-                    if not text.strip() or len(text.strip()) < 50:
-                        if setup_tesseract() and file_ext == 'docx':
-                            image_text = extract_images_from_docx(file_path)
-                            if image_text:
-                                text = image_text
-                
-                elif file_ext == 'pptx':
-                    text = extract_text_from_pptx(file_path)
-                    # If minimal text was found, try OCR on any images in the presentation
-                    if not text.strip() or len(text.strip()) < 50:
-                        if setup_tesseract():
-                            image_text = extract_images_from_pptx(file_path)
-                            if image_text:
-                                text = image_text
-                
-                elif file_ext in ['png', 'jpg', 'jpeg', 'tiff', 'bmp']:
-                    if setup_tesseract():
-                        text = extract_text_from_image(file_path)
-                    else:
-                        flash('Tesseract OCR is not installed. Please install it to process images.', 'error')
-                        os.remove(file_path)
-                        return redirect(request.url)
-                
-                print(f"Total extracted text length: {len(text)} characters")
-                
-                if not text.strip():
-                    error_msg = 'No text could be extracted from the file. This might be because:\n'
-                    error_msg += '- The file is password protected\n'
-                    error_msg += '- The file contains scanned images without OCR\n'
-                    error_msg += '- The file is corrupted or empty\n'
-                    error_msg += '- The file contains only non-text content (like images)\n\n'
-                    error_msg += 'Please ensure the file contains readable text and try again.'
-                    flash(error_msg, 'error')
-                    os.remove(file_path)
-                    return redirect(request.url)
-                
-                # Generate MCQs
-                mcqs = generate_mcqs_with_groq(text, num_questions=10)
-                
-                # Generate Flashcards
-                flashcards = generate_flashcards_with_groq(text, num_flashcards=10)
-                
-                # Store generated content in session for temporary access
-                # This overwrites any previous session data with new content
-                session['mcqs'] = mcqs
-                session['flashcards'] = flashcards
-                session['filename'] = filename
-                
-                print(f"Stored {len(mcqs)} MCQs and {len(flashcards)} flashcards in session")
-                
-                # Clean up uploaded file
-                os.remove(file_path)
-                
-                return render_template('quizmc.html', mcqs=mcqs, flashcards=flashcards, filename=filename)
-                
-            except (PermissionError, OSError) as e:
-                print(f"File access error: {e}")
-                flash('Unable to access the file. The file might be in use or you may not have permission to read it.', 'error')
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                return redirect(request.url)
-            except Exception as e:
-                print(f"Exception during processing: {e}")
-                error_msg = 'Error processing file. Please check that:\n'
-                error_msg += '- The file is not corrupted\n'
-                error_msg += '- The file format matches its extension\n'
-                error_msg += '- The file is not encrypted or password protected'
-                flash(error_msg, 'error')
-                if os.path.exists(file_path):
-                    os.remove(file_path)
+                job_queue.submit(process_upload, stored, job_id=job_id)
+            except JobQueueFull as e:
+                stored.cleanup()
+                if wants_json():
+                    return jsonify({'success': False, 'error': str(e)}), 503
+                flash(str(e), 'error')
                 return redirect(request.url)
+            
+            if wants_json():
+                return jsonify({
+                    'success': True,
+                    'job_id': job_id,
+                    'status_url': url_for('.job_status', job_id=job_id),
+                    'result_url': url_for('.job_result', job_id=job_id)
+                }), 202
+            return redirect(url_for('.job_result', job_id=job_id))
         
         else:
             flash('Invalid file type. Please upload PDF, DOC, DOCX, PPTX, or image files.', 'error')
     
     return render_template('upload.html')
 
-@app.route('/check_answer', methods=['POST'])
+@bp.route('/jobs/<job_id>')
+def job_status(job_id):
+    """API endpoint reporting the stage and progress of an upload job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    response = {
+        'success': True,
+        'job_id': job_id,
+        'status': job['status'],
+        'stage': job['stage'],
+        'pages_done': job['pages_done'],
+        'pages_total': job['pages_total'],
+        'error': job['error']
+    }
+    if job['status'] == 'done':
+        response['result'] = job['result']
+        response['result_url'] = url_for('.job_result', job_id=job_id)
+    return jsonify(response)
+
+@bp.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    """Render a finished job's study material, or a progress page while it runs"""
+    job = job_queue.get(job_id)
+    if job is None:
+        flash('Upload not found or expired. Please upload the file again.', 'error')
+        return redirect(url_for('.upload'))
+    
+    if job['status'] == 'failed':
+        flash(job['error'], 'error')
+        return redirect(url_for('.upload'))
+    
+    if job['status'] != 'done':
+        return render_template('upload.html', job=job)
+    
+    result = job['result']
+    mcqs = result['mcqs']
+    flashcards = result['flashcards']
+    filename = result['filename']
+    
+    # Store generated content server-side; the cookie only keeps its ID.
+    # Reloading the page keeps the stored material and chat history of the
+    # same job; a different job's result replaces the previous session data
+    stored = session_store.get(session.get('study_id'))
+    if stored is None or stored.get('job_id') != job_id:
+        session_store.delete(session.get('study_id'))
+        session['study_id'] = session_store.create({
+            'job_id': job_id,
+            'mcqs': mcqs,
+            'flashcards': flashcards,
+            'filename': filename,
+            'context': result.get('context'),
+            'retrieval_id': result.get('retrieval_id')
+        })
+        print(f"Stored {len(mcqs)} MCQs and {len(flashcards)} flashcards in session")
+    
+    return render_template('quizmc.html', mcqs=mcqs, flashcards=flashcards, filename=filename)
+
+@bp.route('/check_answer', methods=['POST'])
 def check_answer():
     """API endpoint to check if selected answer is correct"""
     data = request.json
@@ -925,14 +312,15 @@ def check_answer():
 
 
 
-@app.route('/session_data')
+@bp.route('/session_data')
 def get_session_data():
     """API endpoint to retrieve current session's MCQs and flashcards"""
     try:
         # Get data from session storage
-        mcqs = session.get('mcqs', [])
-        flashcards = session.get('flashcards', [])
-        filename = session.get('filename', 'No file')
+        material = current_study_material()
+        mcqs = material.get('mcqs', [])
+        flashcards = material.get('flashcards', [])
+        filename = material.get('filename', 'No file')
         
         return jsonify({
             'success': True,
@@ -948,12 +336,22 @@ def get_session_data():
             'error': str(e)
         }), 500
 
-@app.route('/clear_session')
+@bp.route('/metrics')
+def metrics_endpoint():
+    """Counters and stage timings of this worker, in the Prometheus text format"""
+    if not metrics.enabled:
+        return Response("Metrics are disabled (METRICS=off)\n", status=404, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/retrieval_stats')
+def retrieval_stats():
+    """Retrieval index build and query latency of this worker"""
+    return jsonify(retrieval_store.stats())
+
+@bp.route('/clear_session')
 def clear_session_data():
     """Clear all session data"""
-    session.pop('mcqs', None)
-    session.pop('flashcards', None)
-    session.pop('filename', None)
+    session_store.delete(session.pop('study_id', None))
     
     return jsonify({
         'success': True,
@@ -961,22 +359,31 @@ def clear_session_data():
     })
 
 # 🧠 Main chat with session data (unchanged)
-@app.route('/quizpasa_chat', methods=['POST'])
+@bp.route('/quizpasa_chat', methods=['POST'])
 def quizpasa_chat():
     """Handle chat messages and provide responses with session context"""
     try:
         data = request.get_json()
         user_message = data.get('message', '')
-        conversation_history = data.get('conversation_history', [])
+        
+        # Conversation history is kept server-side; the client only sends
+        # the new message
+        session_id = chat_session_id()
+        conversation_history = load_history(session_id)
         
         # Get current session data
+        material = current_study_material()
         session_data = {
-            'mcqs': session.get('mcqs', []),
-            'flashcards': session.get('flashcards', [])
+            'mcqs': material.get('mcqs', []),
+            'flashcards': material.get('flashcards', []),
+            'context': material.get('context'),
+            'retrieval_id': material.get('retrieval_id')
         }
         
         # Get response from QuizPasa with session context
         response = handle_chat_message(user_message, conversation_history, session_data)
+        if response.get('success'):
+            append_turn(session_id, user_message, response['message'])
         return jsonify(response)
         
     except Exception as e:
@@ -987,14 +394,55 @@ def quizpasa_chat():
         }), 500
 
 
+# ⚡ Streaming chat: relays tokens as server-sent events
+@bp.route('/quizpasa_chat_stream', methods=['POST'])
+def quizpasa_chat_stream():
+    """Stream a chat reply as server-sent events
+
+    Emits `token` events ({"content": ...}) as the reply is generated and
+    a final `done` event with the full message. Clients that cannot read
+    streams should use /quizpasa_chat instead.
+    """
+    data = request.get_json() or {}
+    user_message = data.get('message', '')
+    
+    # Read session state up front, before the response starts streaming
+    session_id = chat_session_id()
+    conversation_history = load_history(session_id)
+    material = current_study_material()
+    session_data = {
+        'mcqs': material.get('mcqs', []),
+        'flashcards': material.get('flashcards', []),
+        'context': material.get('context'),
+        'retrieval_id': material.get('retrieval_id')
+    }
+    
+    def events():
+        try:
+            for event in stream_chat_message(user_message, conversation_history, session_data):
+                if event['type'] == 'done' and event.get('success') and event.get('message'):
+                    append_turn(session_id, user_message, event['message'])
+                yield f"event: {event.pop('type')}\ndata: {json.dumps(event)}\n\n"
+        except Exception as e:
+            print(f"Chat stream error: {e}")
+            error = {'success': False, 'message': 'An error occurred while processing your message.', 'error': str(e)}
+            yield f"event: done\ndata: {json.dumps(error)}\n\n"
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # stop proxies from buffering the stream
+    })
+
+
 # 🤖 Simpler fallback chat route (renamed)
-@app.route('/quizpasa_chat_simple', methods=['POST'])
+@bp.route('/quizpasa_chat_simple', methods=['POST'])
 def quizpasa_chat_simple():
     """Handle basic chatbot messages"""
     try:
         data = request.get_json()
         user_message = data.get('message', '').strip()
-        conversation_history = data.get('history', [])
+        session_id = chat_session_id()
+        conversation_history = load_history(session_id)
         
         if not user_message:
             return jsonify({
@@ -1008,6 +456,8 @@ def quizpasa_chat_simple():
         else:
             # Get response from QuizPasa
             response = handle_chat_message(user_message, conversation_history)
+            if response.get('success'):
+                append_turn(session_id, user_message, response['message'])
         
         return jsonify(response)
         
@@ -1020,10 +470,8 @@ def quizpasa_chat_simple():
 
 
 
-# if __name__ == '__main__':
-#     port = int(os.environ.get('PORT', 5000))
-#     app.run(host='0.0.0.0', port=port)
-
+# Development server only; production runs wsgi:app under gunicorn
+# (see gunicorn.conf.py)
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=True)
+    create_app().run(host='0.0.0.0', port=port, debug=True)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark: PDF text backends (PyMuPDF fast path vs. pdfplumber)
+
+Usage:
+    python bench_pdf_text.py [file.pdf | directory ...]
+
+Reports pages per second for each backend and how closely the PyMuPDF
+output matches pdfplumber (word overlap per document). Without arguments
+a small synthetic corpus is generated.
+"""
+
+import os
+import sys
+import time
+import tempfile
+from collections import Counter
+import fitz
+from documents import ParsedDocument
+from pdf_text import PDF_TEXT_BACKENDS
+
+
+def find_pdfs(paths):
+    """Expand directories into the PDFs they contain"""
+    pdfs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                pdfs.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith('.pdf'))
+        else:
+            pdfs.append(path)
+    return pdfs
+
+
+def synthetic_corpus(directory, documents=3, pages=40):
+    """Write a few text PDFs with paragraphs and a two-column page each"""
+    words = "lecture notes photosynthesis converts light energy into chemical energy stored in glucose".split()
+    paths = []
+    for d in range(documents):
+        doc = fitz.open()
+        for p in range(pages):
+            page = doc.new_page()
+            y = 72
+            for line in range(40):
+                sentence = " ".join(words[(line + p + d + i) % len(words)] for i in range(12))
+                if p % 10 == 9:
+                    # Two columns
+                    page.insert_text((50, y), sentence[:40])
+                    page.insert_text((320, y), sentence[40:80])
+                else:
+                    page.insert_text((50, y), sentence)
+                y += 17
+        path = os.path.join(directory, f"synthetic_{d + 1}.pdf")
+        doc.save(path)
+        doc.close()
+        paths.append(path)
+    return paths
+
+
+def word_overlap(a, b):
+    """Share of words the two texts have in common (1.0 = same words)"""
+    words_a, words_b = Counter(a.split()), Counter(b.split())
+    total = max(sum(words_a.values()), sum(words_b.values()))
+    if total == 0:
+        return 1.0
+    return sum((words_a & words_b).values()) / total
+
+
+def run_backend(name, path):
+    """Extract every page of path with a fresh document handle"""
+    start = time.perf_counter()
+    with ParsedDocument(path, 'pdf') as document:
+        page_texts = PDF_TEXT_BACKENDS[name].page_texts(document)
+    return page_texts, time.perf_counter() - start
+
+
+def main():
+    paths = find_pdfs(sys.argv[1:])
+    tmp_dir = None
+    if not paths:
+        tmp_dir = tempfile.TemporaryDirectory()
+        paths = synthetic_corpus(tmp_dir.name)
+        print(f"No PDFs given, using {len(paths)} synthetic documents")
+
+    totals = {'pymupdf': 0.0, 'pdfplumber': 0.0}
+    total_pages = 0
+    overlaps = []
+
+    for path in paths:
+        try:
+            fast_pages, fast_time = run_backend('pymupdf', path)
+            layout_pages, layout_time = run_backend('pdfplumber', path)
+        except Exception as e:
+            print(f"  {os.path.basename(path)}: skipped ({e})")
+            continue
+        totals['pymupdf'] += fast_time
+        totals['pdfplumber'] += layout_time
+        total_pages += len(fast_pages)
+        overlap = word_overlap("\n".join(fast_pages), "\n".join(layout_pages))
+        overlaps.append(overlap)
+        print(f"  {os.path.basename(path):<40} {len(fast_pages):4d} pages  "
+              f"pymupdf {fast_time * 1000:8.1f} ms  pdfplumber {layout_time * 1000:8.1f} ms  "
+              f"word overlap {overlap:.3f}")
+
+    if total_pages:
+        print(f"\n{total_pages} pages in {len(overlaps)} documents")
+        for name, elapsed in totals.items():
+            print(f"  {name:<11} {total_pages / elapsed:10.1f} pages/s")
+        print(f"  speedup     {totals['pdfplumber'] / totals['pymupdf']:10.1f}x")
+        print(f"  mean word overlap {sum(overlaps) / len(overlaps):.3f}, min {min(overlaps):.3f}")
+
+    if tmp_dir:
+        tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: NumPy preprocessing engine vs. the old PIL chain
+
+Usage:
+    python bench_preprocess.py [scan.png ...] [--runs N]
+
+Without arguments a synthetic 300 DPI letter-size page is used.
+"""
+
+import sys
+import time
+import tracemalloc
+from PIL import Image, ImageDraw, ImageEnhance, ImageFilter
+from preprocessing import ImagePreprocessor
+
+
+def pil_chain(image):
+    """The preprocessing chain used before the NumPy engine"""
+    if image.mode != 'L':
+        image = image.convert('L')
+    image = ImageEnhance.Contrast(image).enhance(2.0)
+    image = ImageEnhance.Sharpness(image).enhance(2.0)
+    return image.filter(ImageFilter.MedianFilter(size=3))
+
+
+def synthetic_page(width=2550, height=3300):
+    """A noisy grayscale page of text lines at 300 DPI"""
+    image = Image.new('RGB', (width, height), (235, 232, 225))
+    draw = ImageDraw.Draw(image)
+    for y in range(150, height - 150, 60):
+        draw.text((150, y), "The quick brown fox jumps over the lazy dog. 0123456789 " * 3, fill=(40, 40, 40))
+    noise = Image.effect_noise((width, height), 20).convert('RGB')
+    return Image.blend(image, noise, 0.15).rotate(1.5, fillcolor=(235, 232, 225))
+
+
+def measure(label, func, image, runs):
+    """Time func(image) and record its peak traced allocation"""
+    func(image)  # warm up
+    start = time.perf_counter()
+    for _ in range(runs):
+        func(image)
+    elapsed = (time.perf_counter() - start) / runs
+
+    tracemalloc.start()
+    func(image)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"  {label:<28} {elapsed * 1000:8.1f} ms   peak {peak / 1024 / 1024:7.1f} MB")
+    return elapsed
+
+
+def main():
+    args = sys.argv[1:]
+    runs = 5
+    if '--runs' in args:
+        index = args.index('--runs')
+        runs = int(args[index + 1])
+        del args[index:index + 2]
+
+    samples = [(path, Image.open(path)) for path in args] or [("synthetic 300 DPI page", synthetic_page())]
+
+    engines = [
+        ("PIL chain", pil_chain),
+        # target_dpi=0: the PIL chain never resized, so compare like for like
+        ("NumPy (no downscale)", ImagePreprocessor(binarize=False, deskew=False, target_dpi=0)),
+        ("NumPy + binarize", ImagePreprocessor(binarize=True, deskew=False, target_dpi=0)),
+        ("NumPy + binarize + deskew", ImagePreprocessor(binarize=True, deskew=True, target_dpi=0)),
+    ]
+    # PIL does not record peak memory with tracemalloc; NumPy buffers are traced
+    print("Note: peak memory covers NumPy buffers only, PIL allocations are not traced")
+
+    for name, image in samples:
+        image.load()
+        print(f"\n{name} ({image.width}x{image.height}, mode {image.mode}), {runs} runs")
+        baseline = None
+        for label, func in engines:
+            elapsed = measure(label, func, image, runs)
+            if baseline is None:
+                baseline = elapsed
+            else:
+                print(f"  {'':<28} {baseline / elapsed:8.2f}x vs PIL chain")
+
+
+if __name__ == "__main__":
+    main()
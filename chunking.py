@@ -0,0 +1,74 @@
+import re
+
+# Section markers emitted by the extractors: PPTX slides, PDF pages
+# (native and OCR'd) and the embedded-image block
+SECTION_MARKER = re.compile(
+    r'^[ \t]*(?:=== SLIDE \d+ ===|=== TEXT FROM IMAGES ===|\[Page \d+(?: OCR)?\]:?)[ \t]*$',
+    re.MULTILINE
+)
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token for English text)"""
+    return len(text) // 4 + 1
+
+
+def split_sections(text):
+    """Split extracted text at page/slide markers, keeping each marker with its section"""
+    starts = [m.start() for m in SECTION_MARKER.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    starts.append(len(text))
+    sections = [text[start:end].strip() for start, end in zip(starts, starts[1:])]
+    return [section for section in sections if section]
+
+
+def _split_long(section, max_chars):
+    """Split an oversized section on paragraph, then line, then hard boundaries"""
+    pieces = []
+    current = ""
+    for line in section.splitlines():
+        while len(line) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if current and len(current) + len(line) + 1 > max_chars:
+            pieces.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current.strip():
+        pieces.append(current)
+    return pieces
+
+
+def chunk_text(text, chunk_tokens=1000):
+    """Group consecutive sections into chunks of at most ~chunk_tokens tokens
+
+    Sections are never merged across a chunk boundary; a single section
+    larger than a chunk is split on line boundaries.
+    """
+    max_chars = chunk_tokens * 4
+    chunks = []
+    current = ""
+    for section in split_sections(text):
+        parts = _split_long(section, max_chars) if len(section) > max_chars else [section]
+        for part in parts:
+            if current and len(current) + len(part) + 2 > max_chars:
+                chunks.append(current)
+                current = ""
+            current = f"{current}\n\n{part}" if current else part
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def spread(items, count):
+    """Pick `count` items evenly spaced across the list, keeping order"""
+    if count >= len(items):
+        return list(items)
+    if count <= 1:
+        return list(items[:count])
+    step = (len(items) - 1) / (count - 1)
+    return [items[round(i * step)] for i in range(count)]
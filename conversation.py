@@ -0,0 +1,74 @@
+import os
+from chunking import estimate_tokens
+from session_store import session_store
+
+# Token budget for past turns sent with each chat request
+CHAT_HISTORY_TOKENS = int(os.getenv('CHAT_HISTORY_TOKENS', 1500))
+
+# Messages kept per session; older ones are folded into the summary
+CHAT_HISTORY_MAX_MESSAGES = int(os.getenv('CHAT_HISTORY_MAX_MESSAGES', 20))
+
+# Maximum length of the running summary of dropped turns
+CHAT_SUMMARY_CHARS = int(os.getenv('CHAT_SUMMARY_CHARS', 600))
+
+
+def summarize(summary, messages):
+    """Fold dropped messages into a short running summary
+
+    Keeps the gist of what the student asked (the first words of each
+    question), newest last, within CHAT_SUMMARY_CHARS. No LLM call.
+    """
+    topics = [summary] if summary else []
+    for message in messages:
+        if message.get('role') == 'user':
+            question = " ".join(message.get('content', '').split())
+            topics.append(question[:80] + ("..." if len(question) > 80 else ""))
+    text = "; ".join(topic for topic in topics if topic)
+    if len(text) > CHAT_SUMMARY_CHARS:
+        text = "..." + text[-(CHAT_SUMMARY_CHARS - 3):]
+    return text
+
+
+def history_window(messages, summary="", budget=None):
+    """Most recent messages that fit the token budget, oldest first
+
+    Messages that do not fit are folded into the summary, which leads
+    the window as a system message.
+    """
+    budget = budget or CHAT_HISTORY_TOKENS
+    window = []
+    used = 0
+    for message in reversed(messages):
+        tokens = estimate_tokens(message.get('content', ''))
+        if used + tokens > budget:
+            break
+        window.insert(0, message)
+        used += tokens
+
+    summary = summarize(summary, messages[:len(messages) - len(window)])
+    if summary:
+        window.insert(0, {"role": "system", "content": f"Earlier in this conversation the student asked about: {summary}"})
+    return window
+
+
+def load_history(session_id):
+    """Prompt-ready conversation history for a session, within the token budget"""
+    entry = session_store.get(session_id) or {}
+    return history_window(entry.get('history', []), entry.get('history_summary', ""))
+
+
+def append_turn(session_id, user_message, reply):
+    """Record a finished exchange; stored history stays bounded"""
+    entry = session_store.get(session_id)
+    if entry is None:
+        return
+    history = entry.get('history', []) + [
+        {"role": "user", "content": user_message},
+        {"role": "assistant", "content": reply}
+    ]
+    summary = entry.get('history_summary', "")
+    if len(history) > CHAT_HISTORY_MAX_MESSAGES:
+        dropped = history[:-CHAT_HISTORY_MAX_MESSAGES]
+        history = history[-CHAT_HISTORY_MAX_MESSAGES:]
+        summary = summarize(summary, dropped)
+    session_store.update(session_id, history=history, history_summary=summary)
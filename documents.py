@@ -0,0 +1,132 @@
+import io
+import os
+import tempfile
+import zipfile
+import docx2txt
+import pdfplumber
+import fitz  # PyMuPDF - better for image extraction from PDFs
+from docx import Document
+from pptx import Presentation
+from PIL import Image
+from metrics import metrics
+
+
+class ParsedDocument:
+    """An uploaded file that is parsed at most once per backend
+
+    Validation and extraction share the same parsed objects instead of
+    re-opening the file from disk. Backends are opened lazily on first
+    access and released by close().
+
+    Small uploads can be passed as `data` bytes instead of a path; every
+    backend then reads from memory and the file only touches disk if a
+    path is needed (see local_path).
+    """
+
+    def __init__(self, file_path=None, file_ext=None, data=None, name=None):
+        self.file_path = file_path
+        self.data = data
+        self.name = name or file_path or 'upload'
+        self.file_ext = (file_ext or self.name.rsplit('.', 1)[1]).lower()
+        self._parsed = {}
+        self._spilled_path = None
+
+    def _get(self, name, opener):
+        if name not in self._parsed:
+            with metrics.span('parse', backend=name, file_type=self.file_ext):
+                self._parsed[name] = opener()
+        return self._parsed[name]
+
+    def _source(self):
+        """A path or a fresh in-memory stream for a backend to open"""
+        if self.data is not None:
+            return io.BytesIO(self.data)
+        return self.file_path
+
+    @property
+    def local_path(self):
+        """Path of the file on disk, written to a temp file for in-memory documents
+
+        Needed by code that re-opens the file elsewhere, e.g. page OCR in
+        the process pool.
+        """
+        if self.file_path:
+            return self.file_path
+        if self._spilled_path is None:
+            fd, self._spilled_path = tempfile.mkstemp(suffix=f".{self.file_ext}")
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self.data)
+        return self._spilled_path
+
+    @property
+    def size(self):
+        """File size in bytes"""
+        if self.data is not None:
+            return len(self.data)
+        return self._get('size', lambda: os.path.getsize(self.file_path))
+
+    @property
+    def pdf(self):
+        """pdfplumber handle, used by the layout-accurate PDF text backend"""
+        return self._get('pdf', lambda: pdfplumber.open(self._source()))
+
+    @property
+    def fitz(self):
+        """PyMuPDF handle, used for the PDF text layer, embedded images and page rendering"""
+        def open_fitz():
+            if self.data is not None:
+                return fitz.open(stream=self.data, filetype=self.file_ext)
+            return fitz.open(self.file_path)
+        return self._get('fitz', open_fitz)
+
+    @property
+    def docx(self):
+        """python-docx Document for .docx files"""
+        return self._get('docx', lambda: Document(self._source()))
+
+    @property
+    def doc_text(self):
+        """Plain text of a .doc file, via docx2txt"""
+        return self._get('doc_text', lambda: docx2txt.process(self._source()))
+
+    @property
+    def pptx(self):
+        """python-pptx Presentation for .pptx files"""
+        return self._get('pptx', lambda: Presentation(self._source()))
+
+    @property
+    def zip(self):
+        """ZIP container of a .docx/.pptx file, used for embedded media"""
+        return self._get('zip', lambda: zipfile.ZipFile(self._source(), 'r'))
+
+    @property
+    def image(self):
+        """Decoded PIL image for image uploads"""
+        def open_image():
+            img = Image.open(self._source())
+            img.load()
+            return img
+        return self._get('image', open_image)
+
+    def close(self):
+        """Release every backend that was opened"""
+        for name in ['pdf', 'fitz', 'zip', 'image']:
+            handle = self._parsed.pop(name, None)
+            if handle is not None:
+                try:
+                    handle.close()
+                except Exception as e:
+                    print(f"Error closing {name} handle for {self.name}: {e}")
+        self._parsed.clear()
+        if self._spilled_path is not None:
+            try:
+                os.remove(self._spilled_path)
+            except OSError:
+                pass
+            self._spilled_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
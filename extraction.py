@@ -0,0 +1,598 @@
+import json
+import hashlib
+import pytesseract
+import fitz  # PyMuPDF - better for image extraction from PDFs
+from documents import ParsedDocument
+from ocr_engine import ocr_engine
+from image_ocr import OCR_MODE, MIN_IMAGE_SIDE, MIN_IMAGE_ENTROPY, MIN_EDGE_DENSITY
+from image_ocr import preprocess_image_for_ocr, search_best_config, extract_text_fast, ocr_images, EmbeddedImageFilter
+from pdf_ocr import MIN_PAGE_TEXT_CHARS, MIN_SCAN_COVERAGE, ocr_pdf_pages, classify_pages
+from preprocessing import image_preprocessor
+from pdf_text import PDF_TEXT_BACKEND, get_pdf_text_backend
+from metrics import metrics
+
+# Bump whenever extraction output changes, so cached results are not reused
+# (6: images above OCR_TARGET_DPI are downscaled before OCR)
+EXTRACTOR_VERSION = 6
+
+
+def extraction_settings():
+    """Runtime settings that change extraction output for the same file"""
+    return {
+        'ocr_available': ocr_engine.is_available(),
+        'ocr_version': ocr_engine.version,
+        'pdf_text_backend': PDF_TEXT_BACKEND.lower(),
+        'ocr_mode': OCR_MODE,
+        'preprocessing': vars(image_preprocessor),
+        'image_filter': [MIN_IMAGE_SIDE, MIN_IMAGE_ENTROPY, MIN_EDGE_DENSITY],
+        'scan_detection': [MIN_PAGE_TEXT_CHARS, MIN_SCAN_COVERAGE]
+    }
+
+
+def extraction_cache_version():
+    """Cache version of extraction results: EXTRACTOR_VERSION plus a settings fingerprint
+
+    A result extracted while Tesseract was missing, or with another PDF
+    text backend, OCR mode or preprocessing setup, is not reused once
+    those change.
+    """
+    settings = json.dumps(extraction_settings(), sort_keys=True, default=str)
+    return f"{EXTRACTOR_VERSION}-{hashlib.sha256(settings.encode('utf-8')).hexdigest()[:12]}"
+
+
+def validate_document(document):
+    """Validate a parsed document before processing
+
+    The parsed handles are kept on the document and reused by extraction.
+    """
+    file_ext = document.file_ext
+    try:
+        # Check if file is empty
+        if document.size == 0:
+            return False, 'The file is empty'
+            
+        # Basic validation based on file type
+        if file_ext in ['doc', 'docx']:
+            try:
+                if file_ext == 'doc':
+                    # Use docx2txt for .doc files
+                    text = document.doc_text
+                    if not text or not text.strip():
+                        return False, 'The document contains no readable text'
+                else:
+                    # Use python-docx for .docx files
+                    doc = document.docx
+                    has_content = False
+                    
+                    # Check paragraphs
+                    for paragraph in doc.paragraphs:
+                        if paragraph.text.strip():
+                            has_content = True
+                            break
+                    
+                    # Check tables if no paragraph content
+                    if not has_content:
+                        for table in doc.tables:
+                            for row in table.rows:
+                                for cell in row.cells:
+                                    if cell.text.strip():
+                                        has_content = True
+                                        break
+                                if has_content:
+                                    break
+                            if has_content:
+                                break
+                    
+                    if not has_content:
+                        return False, 'The document contains no readable text'
+                        
+                return True, ''
+                
+            except Exception as e:
+                return False, f'The document appears to be corrupted or invalid: {str(e)}'
+                
+        elif file_ext == 'pdf':
+            try:
+                # PyMuPDF is already needed for images and rendering; opening
+                # it does not run any layout analysis
+                doc = document.fitz
+                if doc.needs_pass:
+                    return False, 'The PDF is password protected'
+                if len(doc) == 0:
+                    return False, 'The PDF contains no pages'
+                return True, ''
+            except Exception as e:
+                return False, f'The PDF appears to be corrupted or password protected: {str(e)}'
+                
+        elif file_ext == 'pptx':
+            try:
+                prs = document.pptx
+                if len(prs.slides) == 0:
+                    return False, 'The presentation contains no slides'
+                # Check if any slide has text
+                has_text = False
+                for slide in prs.slides:
+                    for shape in slide.shapes:
+                        if hasattr(shape, 'text') and shape.text.strip():
+                            has_text = True
+                            break
+                    if has_text:
+                        break
+                if not has_text:
+                    return False, 'The presentation contains no readable text'
+                return True, ''
+            except Exception as e:
+                return False, f'The presentation appears to be corrupted or invalid: {str(e)}'
+                    
+        elif file_ext in ['png', 'jpg', 'jpeg', 'tiff', 'bmp']:
+            try:
+                img = document.image
+                # Check if image is not completely blank or black
+                extrema = img.convert('L').getextrema()
+                if extrema[0] == extrema[1]:  # All pixels are the same value
+                    return False, 'The image appears to be blank or contains no content'
+                # Check if image is too small for reliable OCR
+                if img.size[0] < 50 or img.size[1] < 50:
+                    return False, 'The image is too small for text extraction'
+                # For images, allow validation to pass so OCR can be applied
+                return True, ''
+            except Exception as e:
+                return False, f'The image appears to be corrupted or in an invalid format: {str(e)}'
+                
+    except Exception as e:
+        return False, f'Error validating file: {str(e)}'
+
+
+def validate_file_content(file_path, file_ext):
+    """Validate file content before processing"""
+    with ParsedDocument(file_path, file_ext) as document:
+        return validate_document(document)
+
+
+def setup_tesseract():
+    """Check Tesseract availability using the cached engine probe"""
+    return ocr_engine.is_available()
+
+def extract_text_from_image(document, mode=None):
+    """Enhanced image text extraction with better OCR
+
+    In "thorough" mode all OCR configs are scored in parallel with early
+    exit; "fast" mode runs a single pass with the PSM picked by OSD.
+    """
+    try:
+        print(f"Extracting text from image: {document.name}")
+        
+        if not setup_tesseract():
+            print("Tesseract OCR is not installed. Please install it to process images.")
+            return ""
+        
+        mode = mode or OCR_MODE
+        
+        img = document.image
+        print(f"Original image - Mode: {img.mode}, Size: {img.size}")
+        
+        # Convert to RGB if necessary
+        if img.mode not in ['L', 'RGB']:
+            img = img.convert('RGB')
+        
+        # Preprocess image for better OCR
+        processed_img = preprocess_image_for_ocr(img)
+        
+        if mode == 'fast':
+            best_text = extract_text_fast(processed_img)
+        else:
+            best_text = search_best_config(processed_img)
+        best_length = len(best_text.strip())
+        
+        # If still no good result, try with original image
+        if best_length < 10:
+            try:
+                text = pytesseract.image_to_string(img, lang='eng')
+                if len(text.strip()) > best_length:
+                    best_text = text
+                    print(f"Better result with original image: {len(text.strip())} chars")
+            except Exception as e:
+                print(f"Original image OCR failed: {e}")
+        
+        print(f"Final OCR result: {len(best_text)} characters")
+        return best_text.strip()
+    
+    except Exception as e:
+        print(f"Error in extract_text_from_image: {e}")
+        return ""
+
+def _pdf_images(doc, image_filter, skip_pages=()):
+    """Yield ((page_num, img_index), image_bytes) for every image in a PDF
+
+    Pages in `skip_pages` (e.g. scans that get full-page OCR) are skipped.
+    """
+    for page_num in range(len(doc)):
+        if page_num in skip_pages:
+            continue
+        page = doc[page_num]
+        image_list = page.get_images()
+        
+        print(f"Page {page_num + 1} has {len(image_list)} images")
+        
+        for img_index, img in enumerate(image_list):
+            try:
+                # Get image data; an xref reused across pages is OCR'd once
+                xref = img[0]
+                if image_filter.seen_before(('xref', xref)):
+                    continue
+                pix = fitz.Pixmap(doc, xref)
+                
+                # Convert to PPM bytes for the OCR workers
+                if pix.n - pix.alpha < 4:  # GRAY or RGB
+                    yield (page_num, img_index), pix.tobytes("ppm")
+                
+                pix = None
+                
+            except Exception as e:
+                print(f"Error processing image {img_index + 1} on page {page_num + 1}: {e}")
+                continue
+
+def extract_images_from_pdf(document, image_filter=None, skip_pages=(), status=None):
+    """Extract images from PDF and perform OCR"""
+    text = ""
+    image_filter = image_filter or EmbeddedImageFilter()
+    
+    try:
+        doc = document.fitz
+        print(f"PDF has {len(doc)} pages")
+        
+        # Images are filtered, then OCR'd in parallel; results come back in document order
+        images = image_filter.filter(_pdf_images(doc, image_filter, skip_pages))
+        for (page_num, img_index), img_text in ocr_images(images, status=status):
+            if img_text.strip():
+                text += f"\n[Image {img_index + 1} from Page {page_num + 1}]:\n{img_text}\n"
+                print(f"Extracted {len(img_text)} chars from image {img_index + 1} on page {page_num + 1}")
+        
+    except Exception as e:
+        print(f"Error extracting images from PDF: {e}")
+    
+    image_filter.log_report('PDF')
+    return text
+
+def _zip_media(container, prefix, kind):
+    """Yield (name, image_bytes) for the media files of a DOCX/PPTX container"""
+    # Look for image files in the media folder
+    image_files = [f for f in container.namelist() if f.startswith(prefix)]
+    
+    print(f"Found {len(image_files)} images in {kind}")
+    
+    for img_file in image_files:
+        try:
+            yield img_file, container.read(img_file)
+        except Exception as e:
+            print(f"Error processing image {img_file}: {e}")
+            continue
+
+def extract_images_from_docx(document, image_filter=None, status=None):
+    """Extract images from DOCX and perform OCR"""
+    text = ""
+    image_filter = image_filter or EmbeddedImageFilter()
+    
+    try:
+        # DOCX is essentially a ZIP file
+        images = image_filter.filter(_zip_media(document.zip, 'word/media/', 'DOCX'))
+        for img_file, img_text in ocr_images(images, status=status):
+            if img_text.strip():
+                text += f"\n[Image from DOCX: {img_file}]:\n{img_text}\n"
+                print(f"Extracted {len(img_text)} chars from {img_file}")
+    
+    except Exception as e:
+        print(f"Error extracting images from DOCX: {e}")
+    
+    image_filter.log_report('DOCX')
+    return text
+
+def extract_images_from_pptx(document, image_filter=None, status=None):
+    """Extract images from PPTX and perform OCR"""
+    text = ""
+    image_filter = image_filter or EmbeddedImageFilter()
+    
+    try:
+        # PPTX is also a ZIP file
+        images = image_filter.filter(_zip_media(document.zip, 'ppt/media/', 'PPTX'))
+        for img_file, img_text in ocr_images(images, status=status):
+            if img_text.strip():
+                text += f"\n[Image from PPTX: {img_file}]:\n{img_text}\n"
+                print(f"Extracted {len(img_text)} chars from {img_file}")
+    
+    except Exception as e:
+        print(f"Error extracting images from PPTX: {e}")
+    
+    image_filter.log_report('PPTX')
+    return text
+
+def extract_pdf_page_texts(document, backend=None):
+    """Extract the embedded text layer of each PDF page
+
+    `backend` names a pdf_text backend; PDF_TEXT_BACKEND is used by default.
+    """
+    backend = get_pdf_text_backend(backend)
+    page_texts = backend.page_texts(document)
+    for page_num, page_text in enumerate(page_texts):
+        if page_text:
+            print(f"Page {page_num + 1}: Extracted {len(page_text)} characters with {backend.name}")
+    return page_texts
+
+
+def extract_native_text_from_pdf(document, backend=None):
+    """Extract the embedded text layer of a PDF"""
+    return "".join(page_text + "\n" for page_text in extract_pdf_page_texts(document, backend) if page_text)
+
+
+def ocr_full_pages_of_pdf(document, pages=None, progress=None, status=None):
+    """OCR pages of a PDF (all by default), for scans without a usable text layer
+
+    Returns a list of [page_index, text] pairs in page order. Pages that
+    could not be OCR'd are listed in status['failed_pages'].
+    """
+    try:
+        # Pages are rendered and OCR'd in a bounded window, in parallel
+        results = ocr_pdf_pages(document.local_path, pages=pages, dpi=300, progress=progress, status=status)
+        return [[i, page_text] for i, page_text in results]
+    except Exception as e:
+        print(f"Full page OCR failed: {e}")
+        if status is not None:
+            status['failed_pages'] = list(pages) if pages is not None else list(range(len(document.fitz)))
+        return []
+
+
+def extract_native_text_from_docx(document):
+    """Extract paragraph and table text from a DOCX/DOC file"""
+    text = ""
+    if document.file_ext == 'doc':
+        # Handle .doc files using docx2txt
+        text = document.doc_text
+        print(f"DOC text extracted: {len(text)} characters")
+    elif document.file_ext == 'docx':
+        # Handle .docx files using python-docx (for better table support)
+        doc = document.docx
+        
+        # Extract text from paragraphs
+        for paragraph in doc.paragraphs:
+            if paragraph.text.strip():  # Only add non-empty paragraphs
+                text += paragraph.text + "\n"
+        
+        # Extract text from tables
+        for table in doc.tables:
+            for row in table.rows:
+                for cell in row.cells:
+                    if cell.text.strip():  # Only add non-empty cells
+                        text += cell.text + "\n"
+        
+        print(f"DOCX text extracted: {len(text)} characters")
+    return text
+
+
+def extract_native_text_from_pptx(document):
+    """Extract shape text from every slide of a PPTX file"""
+    text = ""
+    prs = document.pptx
+    for slide_num, slide in enumerate(prs.slides):
+        text += f"\n=== SLIDE {slide_num + 1} ===\n"
+        for shape in slide.shapes:
+            if hasattr(shape, "text") and shape.text:
+                text += shape.text + "\n"
+    
+    print(f"PPTX text extracted: {len(text)} characters")
+    return text
+
+
+class ExtractionPipeline:
+    """Text extraction for a single uploaded file
+
+    Each stage (native text, page layout, embedded image OCR, full-page
+    OCR, image OCR) runs at most once; its output is recorded in `stages` and reused by
+    later steps, so a file is never rasterized or OCR'd twice per request.
+    """
+
+    # Below this many characters the extracted text is treated as "minimal"
+    MIN_TEXT_LENGTH = 50
+
+    def __init__(self, document, stages=None, progress=None):
+        self.document = document
+        self.file_ext = document.file_ext
+        # Stage outputs may be seeded, e.g. from the extraction cache
+        self.stages = dict(stages or {})
+        # Optional progress(stage, pages_done=None, pages_total=None) callback
+        self.progress = progress
+
+    def _report(self, stage, pages_done=None, pages_total=None):
+        if self.progress:
+            self.progress(stage, pages_done, pages_total)
+
+    def has_run(self, stage):
+        """Check whether a stage has already produced output"""
+        return stage in self.stages
+
+    def _run_stage(self, stage, func, *args):
+        if stage not in self.stages:
+            with metrics.span(stage, file_type=self.file_ext):
+                self.stages[stage] = func(*args)
+        return self.stages[stage]
+
+    def native_text(self):
+        """Text layer of the document, without any OCR"""
+        if self.file_ext == 'pdf':
+            return "".join(page_text + "\n" for page_text in self.pdf_page_texts() if page_text)
+        if self.file_ext in ['docx', 'doc']:
+            return self._run_stage('native_text', extract_native_text_from_docx, self.document)
+        if self.file_ext == 'pptx':
+            return self._run_stage('native_text', extract_native_text_from_pptx, self.document)
+        return ""
+
+    def pdf_page_texts(self):
+        """Text layer of each PDF page"""
+        return self._run_stage('page_text', extract_pdf_page_texts, self.document)
+
+    def page_layout(self):
+        """Per-page classification of a PDF: 'text', 'scan' or 'blank'"""
+        if not self.has_run('page_layout'):
+            for kind in self._run_stage('page_layout', classify_pages, self.document.fitz, self.pdf_page_texts()):
+                metrics.inc('pdf_pages_total', kind=kind)
+        return self.stages['page_layout']
+
+    def scanned_pages(self):
+        """Indexes of PDF pages without a usable text layer"""
+        return [i for i, kind in enumerate(self.page_layout()) if kind == 'scan']
+
+    def image_text(self):
+        """OCR text of the images embedded in the document"""
+        if not setup_tesseract():
+            return ""
+        extractors = {
+            'pdf': extract_images_from_pdf,
+            'docx': extract_images_from_docx,
+            'pptx': extract_images_from_pptx
+        }
+        if self.file_ext not in extractors:
+            return ""
+        if not self.has_run('image_ocr'):
+            self._report('ocr')
+            image_filter = EmbeddedImageFilter()
+            status = {}
+            skip_pages = set(self.scanned_pages()) if self.file_ext == 'pdf' else None
+            with metrics.span('image_ocr', file_type=self.file_ext) as span:
+                if self.file_ext == 'pdf':
+                    # Scanned pages are covered by full-page OCR
+                    self.stages['image_ocr'] = extract_images_from_pdf(self.document, image_filter, skip_pages, status)
+                else:
+                    self.stages['image_ocr'] = extractors[self.file_ext](self.document, image_filter, status)
+                # Set when the OCR deadline cut image OCR short
+                self.stages['image_ocr_timed_out'] = status.get('timed_out', False)
+                # How many embedded images were skipped before OCR, and why
+                self.stages['image_filter'] = image_filter.report()
+                span.set(images=self.stages['image_filter']['checked'],
+                         skipped=self.stages['image_filter']['skipped'])
+            metrics.inc('images_total', self.stages['image_filter']['checked'], file_type=self.file_ext)
+            metrics.inc('images_skipped_total', self.stages['image_filter']['skipped'], file_type=self.file_ext)
+        return self.stages['image_ocr']
+
+    def ocr_pages(self, pages):
+        """Full-page OCR of the given PDF pages, as {page_index: text}
+
+        Pages already OCR'd by this pipeline are not OCR'd again.
+        """
+        if self.file_ext != 'pdf' or not setup_tesseract():
+            return {}
+        done = {i: page_text for i, page_text in self.stages.get('page_ocr', [])}
+        missing = [i for i in pages if i not in done]
+        if missing:
+            self._report('ocr')
+            status = {}
+            with metrics.span('page_ocr', pages=len(missing)):
+                for i, page_text in ocr_full_pages_of_pdf(self.document, missing,
+                                                          lambda n, total: self._report('ocr', n, total), status):
+                    done[i] = page_text
+            self.stages['page_ocr'] = sorted([i, page_text] for i, page_text in done.items())
+            # Pages whose OCR failed; their text is missing from the result
+            failed = set(self.stages.get('page_ocr_failed', [])) | set(status.get('failed_pages', []))
+            self.stages['page_ocr_failed'] = sorted(failed)
+        return {i: done[i] for i in pages if i in done}
+
+    def page_ocr_text(self, pages=None):
+        """Full-page OCR text of a PDF (every page by default)"""
+        if pages is None:
+            pages = range(len(self.pdf_page_texts()))
+        ocr_text = ""
+        for i, page_text in sorted(self.ocr_pages(pages).items()):
+            ocr_text += f"\n[Page {i + 1} OCR]:\n{page_text}\n"
+        return ocr_text
+
+    def pdf_text(self):
+        """Native text of text pages merged with OCR of scanned pages, in page order"""
+        page_ocr = self.ocr_pages(self.scanned_pages())
+        text = ""
+        for i, page_text in enumerate(self.pdf_page_texts()):
+            if page_ocr.get(i, "").strip():
+                text += f"\n[Page {i + 1} OCR]:\n{page_ocr[i]}\n"
+            elif page_text:
+                # Page markers let generation chunk the text by page
+                text += f"\n[Page {i + 1}]\n{page_text}\n"
+        return text
+
+    @property
+    def timed_out(self):
+        """Whether a deadline cut OCR short, leaving the extracted text partial"""
+        return bool(self.stages.get('image_ocr_timed_out'))
+
+    @property
+    def failed_pages(self):
+        """Indexes of PDF pages whose full-page OCR failed"""
+        return self.stages.get('page_ocr_failed', [])
+
+    @property
+    def incomplete(self):
+        """Whether OCR timed out or failed on a page, so the text may be missing parts"""
+        return self.timed_out or bool(self.failed_pages)
+
+    def is_minimal(self, text):
+        return not text.strip() or len(text.strip()) < self.MIN_TEXT_LENGTH
+
+    def extract(self):
+        """Run the stages needed for this file type and return the combined text"""
+        if self.file_ext in ['png', 'jpg', 'jpeg', 'tiff', 'bmp']:
+            if not self.has_run('image_text'):
+                self._report('ocr')
+            return self._run_stage('image_text', extract_text_from_image, self.document)
+
+        if self.file_ext == 'pdf':
+            text = self.pdf_text()
+        else:
+            text = self.native_text()
+
+        image_text = self.image_text()
+        if image_text:
+            text += "\n=== TEXT FROM IMAGES ===\n" + image_text
+
+        # If still no text (e.g. outlined fonts), try OCR on every page
+        if self.file_ext == 'pdf' and self.is_minimal(text):
+            print("Minimal text found, trying full page OCR...")
+            ocr_text = self.page_ocr_text()
+            if ocr_text.strip():
+                text = ocr_text
+
+        if self.file_ext in ['docx', 'doc']:
+            text = text.strip()
+        return text
+
+
+def extract_text_from_pdf(file_path):
+    """Enhanced PDF text extraction with image OCR"""
+    try:
+        print(f"Processing PDF: {file_path}")
+        with ParsedDocument(file_path, 'pdf') as document:
+            return ExtractionPipeline(document).extract()
+    except Exception as e:
+        print(f"Error processing PDF: {e}")
+        return ""
+
+
+def extract_text_from_docx(file_path):
+    """Enhanced DOCX/DOC text extraction with image OCR"""
+    try:
+        file_ext = file_path.rsplit('.', 1)[1].lower()
+        print(f"Processing {file_ext.upper()}: {file_path}")
+        with ParsedDocument(file_path, file_ext) as document:
+            text = ExtractionPipeline(document).extract()
+        if not text:
+            print(f"No text extracted from {file_ext.upper()} file")
+        return text
+    except Exception as e:
+        print(f"Error extracting text from DOCX/DOC: {e}")
+        return ""
+
+
+def extract_text_from_pptx(file_path):
+    """Enhanced PPTX text extraction with image OCR"""
+    try:
+        print(f"Processing PPTX: {file_path}")
+        with ParsedDocument(file_path, 'pptx') as document:
+            return ExtractionPipeline(document).extract()
+    except Exception as e:
+        print(f"Error extracting text from PPTX: {e}")
+        return ""
@@ -0,0 +1,98 @@
+import os
+import json
+import tempfile
+import threading
+
+
+class ExtractionCache:
+    """Persistent on-disk cache of extraction results keyed by content
+
+    Entries are JSON files named after the SHA-256 of the upload bytes and
+    a version string (see extraction.extraction_cache_version), which also
+    covers the OCR and PDF settings in effect. Hits refresh the entry's mtime; once the cache
+    grows past its size limit the least recently used entries are evicted.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or os.getenv('EXTRACTION_CACHE_DIR', os.path.join('cache', 'extraction'))
+        self.max_bytes = max_bytes or int(float(os.getenv('EXTRACTION_CACHE_MAX_MB', 256)) * 1024 * 1024)
+        self.enabled = os.getenv('EXTRACTION_CACHE', 'on').lower() not in ['0', 'off', 'false']
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, digest, version):
+        return os.path.join(self.cache_dir, f"{digest}-v{version}.json")
+
+    def get(self, digest, version):
+        """Get the cached entry for a file digest, or None"""
+        if not self.enabled:
+            return None
+        path = self._path(digest, version)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            # Mark as recently used
+            os.utime(path, None)
+            print(f"Extraction cache hit: {digest[:12]}")
+            return entry
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Error reading extraction cache entry {path}: {e}")
+            return None
+
+    def put(self, digest, version, entry):
+        """Store an extraction result and evict old entries if needed"""
+        if not self.enabled:
+            return
+        path = self._path(digest, version)
+        try:
+            # Write atomically so concurrent readers never see partial entries
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Error writing extraction cache entry {path}: {e}")
+            return
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits its size limit"""
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+            entries.sort()
+            while total > self.max_bytes and entries:
+                _, size, path = entries.pop(0)
+                try:
+                    os.remove(path)
+                    total -= size
+                    print(f"Evicted extraction cache entry: {os.path.basename(path)}")
+                except OSError:
+                    continue
+
+    def clear(self):
+        """Remove every cached entry"""
+        with self._lock:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.json'):
+                    try:
+                        os.remove(os.path.join(self.cache_dir, name))
+                    except OSError:
+                        continue
+
+
+# Initialize the shared extraction cache
+extraction_cache = ExtractionCache()
@@ -0,0 +1,392 @@
+import os
+import json
+import time
+import re
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dotenv import load_dotenv
+from chunking import chunk_text, estimate_tokens, spread
+from generation_cache import generation_cache
+from llm_client import llm_client
+from offline_generation import generate_offline_mcqs, generate_offline_flashcards
+from metrics import metrics
+
+GROQ_MODEL = "llama3-8b-8192"
+
+# Bump whenever the MCQ/flashcard prompts change, so cached output is not reused
+PROMPT_VERSION = 2
+
+# Seconds to wait for each generator before using the local fallback
+MCQ_TIMEOUT = float(os.getenv('MCQ_TIMEOUT', os.getenv('GENERATION_TIMEOUT', 60)))
+FLASHCARD_TIMEOUT = float(os.getenv('FLASHCARD_TIMEOUT', os.getenv('GENERATION_TIMEOUT', 60)))
+
+# Shared pool so MCQ and flashcard requests run side by side
+generation_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('GENERATION_WORKERS', 8)),
+    thread_name_prefix='generation'
+)
+
+# Long texts are split into chunks of about this many tokens, generated
+# from concurrently and merged. A separate pool keeps the per-chunk
+# requests from waiting on the generators that submitted them.
+CHUNK_TOKENS = int(os.getenv('GENERATION_CHUNK_TOKENS', 1000))
+chunk_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('GENERATION_CHUNK_WORKERS', 8)),
+    thread_name_prefix='generation-chunk'
+)
+
+# Estimated tokens (prompt + completion) one MCQ or flashcard generation
+# may spend across all of its chunk requests
+TOKEN_BUDGET = int(os.getenv('GENERATION_TOKEN_BUDGET', 24000))
+
+# Approximate prompt tokens besides the content itself
+PROMPT_OVERHEAD_TOKENS = 400
+
+
+def _max_output_tokens(count):
+    """Completion tokens to allow for `count` questions or flashcards"""
+    return min(2500, 200 + 220 * count)
+
+
+def plan_chunks(text, count, budget=None, chunk_tokens=None):
+    """Split text into chunks and decide how many items to ask each for
+
+    As many chunks are kept as the token budget allows, spread evenly
+    over the document; each is asked for a share of `count` plus one
+    spare for deduplication.
+
+    Returns:
+        list: (chunk_text, item_count) tuples in document order
+    """
+    budget = budget or TOKEN_BUDGET
+    chunks = chunk_text(text, chunk_tokens or CHUNK_TOKENS) or [text]
+
+    n = len(chunks)
+    while n > 1:
+        per_chunk = -(-count // n) + 1
+        cost = sum(estimate_tokens(chunk) for chunk in spread(chunks, n))
+        cost += n * (PROMPT_OVERHEAD_TOKENS + _max_output_tokens(per_chunk))
+        if cost <= budget:
+            break
+        n -= 1
+    if n == 1:
+        # A single request gets the whole count; keep its input within the budget
+        max_chars = max(1, budget - PROMPT_OVERHEAD_TOKENS - _max_output_tokens(count)) * 4
+        return [(text[:max_chars], count)]
+
+    per_chunk = -(-count // n) + 1
+    return [(chunk, per_chunk) for chunk in spread(chunks, n)]
+
+
+def _normalize(text):
+    return re.sub(r'\W+', ' ', str(text).lower()).strip()
+
+
+def merge_results(results, count, field):
+    """Merge per-chunk results into `count` items, dropping duplicates
+
+    Items are taken round-robin across chunks so the whole document is
+    covered; an item whose `field` matches an earlier one exactly or
+    shares most of its words with it is skipped.
+    """
+    merged = []
+    seen = []
+    longest = max((len(items) for items in results), default=0)
+    for i in range(longest):
+        for items in results:
+            if i >= len(items) or len(merged) >= count:
+                continue
+            item = items[i]
+            if not isinstance(item, dict) or not item.get(field):
+                continue
+            words = set(_normalize(item[field]).split())
+            if any(words == other or (words and len(words & other) / len(words | other) >= 0.8)
+                   for other in seen):
+                continue
+            seen.append(words)
+            merged.append(item)
+    return merged
+
+
+def _generate_chunked(text, count, request, api_key, field, label):
+    """Map `request(chunk, n, api_key)` over the chunks concurrently, then merge"""
+    plan = plan_chunks(text, count)
+    if len(plan) > 1:
+        print(f"Generating {label} from {len(plan)} chunks concurrently")
+    futures = [chunk_executor.submit(request, chunk, n, api_key) for chunk, n in plan]
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result() or [])
+        except Exception as e:
+            print(f"{label} chunk generation failed: {e}")
+            results.append([])
+    return merge_results(results, count, field)
+
+
+def generate_mcqs_with_groq(text, num_questions=10):
+    """Generate MCQs using GROQ API
+
+    The whole text is covered: it is chunked by page/slide, chunks are
+    sent concurrently within the token budget and the results are merged.
+    """
+    # Load environment variables
+    load_dotenv()
+    # GROQ API configuration
+    GROQ_API_KEY = os.getenv("GROQ_API_KEY", "your-groq-api-key-here")
+    # If no API key is provided, use fallback
+    if not GROQ_API_KEY or GROQ_API_KEY == "your-groq-api-key-here":
+        print("No GROQ API key provided, using fallback MCQ generation")
+        return create_content_based_mcqs(text, num_questions)
+    
+    with metrics.span('generate_mcqs', count=num_questions) as span:
+        questions = _generate_chunked(text, num_questions, _request_mcqs, GROQ_API_KEY, 'question', 'MCQs')
+        span.set(generated=len(questions))
+    if not questions:
+        return create_content_based_mcqs(text, num_questions)
+    print(f"Generated {len(questions)} MCQs")
+    return questions
+
+def _request_mcqs(text_preview, num_questions, GROQ_API_KEY):
+    """Ask GROQ for MCQs about one chunk; returns a list, or None on failure"""
+    # Identical prompt inputs produce identical requests; reuse earlier output
+    cache_key = generation_cache.make_key('mcqs', text_preview, num_questions, GROQ_MODEL, PROMPT_VERSION)
+    cached = generation_cache.get(cache_key)
+    metrics.inc('cache_requests_total', cache='generation', result='miss' if cached is None else 'hit')
+    if cached is not None:
+        print(f"Using {len(cached)} cached MCQs")
+        return cached
+    
+    prompt = f"""
+    You are an expert question generator. Based on the following text content, create {num_questions} high-quality multiple choice questions (MCQs).
+
+    CONTENT TO ANALYZE:
+    {text_preview}
+
+    REQUIREMENTS:
+    1. Questions must be directly related to the content above
+    2. Cover different topics and concepts from the text
+    3. Mix of difficulty levels (easy, medium, hard)
+    4. Each question has exactly 4 options
+    5. Only ONE correct answer per question
+    6. Distractors should be plausible but clearly wrong
+    7. Focus on key concepts, facts, and important details
+
+    RESPONSE FORMAT (JSON only):
+    {{
+        "questions": [
+            {{
+                "question": "What is the main concept discussed regarding [specific topic]?",
+                "options": [
+                    "Correct answer based on text",
+                    "Plausible but incorrect option",
+                    "Another plausible but incorrect option",
+                    "Third plausible but incorrect option"
+                ],
+                "correct_answer": 0
+            }}
+        ]
+    }}
+
+    Generate {num_questions} questions now. Return ONLY the JSON response, no additional text.
+    """
+    
+    payload = {
+        "model": GROQ_MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are an expert educational content creator specializing in generating high-quality multiple choice questions from text content. Always respond with valid JSON format only."
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        "temperature": 0.3,
+        "max_tokens": _max_output_tokens(num_questions)
+    }
+    
+    try:
+        print(f"Calling GROQ API to generate {num_questions} MCQs...")
+        response = llm_client.post(payload, GROQ_API_KEY)
+        
+        if response.status_code == 200:
+            result = response.json()
+            content = result['choices'][0]['message']['content'].strip()
+            
+            # Clean up the response
+            if content.startswith('```json'):
+                content = content.replace('```json', '').replace('```', '').strip()
+            
+            try:
+                mcq_data = json.loads(content)
+                if 'questions' in mcq_data and len(mcq_data['questions']) > 0:
+                    print(f"Successfully generated {len(mcq_data['questions'])} MCQs")
+                    generation_cache.put(cache_key, mcq_data['questions'])
+                    return mcq_data['questions']
+                else:
+                    print("No questions found in API response")
+                    return None
+            except json.JSONDecodeError as e:
+                print(f"JSON parsing error: {e}")
+                return None
+        else:
+            print(f"GROQ API error: {response.status_code} - {response.text}")
+            return None
+            
+    except Exception as e:
+        print(f"Error calling GROQ API: {e}")
+        return None
+
+def create_content_based_mcqs(text, num_questions=10):
+    """Fallback: cloze MCQs from the text, generated locally without the API"""
+    with metrics.span('offline_generation', kind='mcqs'):
+        questions = generate_offline_mcqs(text, num_questions)
+    metrics.inc('generation_fallbacks_total', kind='mcqs')
+    print(f"Generated {len(questions)} MCQs offline")
+    return questions
+
+def generate_flashcards_with_groq(text, num_flashcards=10):
+    """Generate flashcards using GROQ API, over the whole chunked text"""
+    load_dotenv()
+    GROQ_API_KEY = os.getenv("GROQ_API_KEY", "your-groq-api-key-here")
+
+    if not GROQ_API_KEY or GROQ_API_KEY == "your-groq-api-key-here":
+        print("No GROQ API key provided for flashcards, using fallback generation")
+        return create_content_based_flashcards(text, num_flashcards)
+
+    with metrics.span('generate_flashcards', count=num_flashcards) as span:
+        flashcards = _generate_chunked(text, num_flashcards, _request_flashcards, GROQ_API_KEY, 'front', 'flashcards')
+        span.set(generated=len(flashcards))
+    if not flashcards:
+        return create_content_based_flashcards(text, num_flashcards)
+    print(f"Generated {len(flashcards)} flashcards")
+    return flashcards
+
+def _request_flashcards(text_preview, num_flashcards, GROQ_API_KEY):
+    """Ask GROQ for flashcards about one chunk; returns a list, or None on failure"""
+    cache_key = generation_cache.make_key('flashcards', text_preview, num_flashcards, GROQ_MODEL, PROMPT_VERSION)
+    cached = generation_cache.get(cache_key)
+    metrics.inc('cache_requests_total', cache='generation', result='miss' if cached is None else 'hit')
+    if cached is not None:
+        print(f"Using {len(cached)} cached flashcards")
+        return cached
+
+    prompt = f"""
+    You are an expert flashcard generator. Based on the following text content, create {num_flashcards} high-quality flashcards.
+
+    CONTENT TO ANALYZE:
+    {text_preview}
+
+    REQUIREMENTS:
+    1. Each flashcard must have a clear 'front' (question/term) and 'back' (answer/definition).
+    2. Flashcards must be directly related to the content above.
+    3. Cover different topics and concepts from the text.
+    4. Focus on key concepts, facts, and important details.
+
+    RESPONSE FORMAT (JSON only):
+    {{
+        "flashcards": [
+            {{
+                "front": "What is [key concept]?",
+                "back": "[Definition/Explanation of key concept]"
+            }}
+        ]
+    }}
+
+    Generate {num_flashcards} flashcards now. Return ONLY the JSON response, no additional text.
+    """
+
+    payload = {
+        "model": GROQ_MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are an expert educational content creator specializing in generating high-quality flashcards from text content. Always respond with valid JSON format only."
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        "temperature": 0.3,
+        "max_tokens": _max_output_tokens(num_flashcards)
+    }
+
+    try:
+        print(f"Calling GROQ API to generate {num_flashcards} flashcards...")
+        response = llm_client.post(payload, GROQ_API_KEY)
+
+        if response.status_code == 200:
+            result = response.json()
+            content = result['choices'][0]['message']['content'].strip()
+
+            if content.startswith('```json'):
+                content = content.replace('```json', '').replace('```', '').strip()
+
+            try:
+                flashcard_data = json.loads(content)
+                if 'flashcards' in flashcard_data and len(flashcard_data['flashcards']) > 0:
+                    print(f"Successfully generated {len(flashcard_data['flashcards'])} flashcards")
+                    generation_cache.put(cache_key, flashcard_data['flashcards'])
+                    return flashcard_data['flashcards']
+                else:
+                    print("No flashcards found in API response")
+                    return None
+            except json.JSONDecodeError as e:
+                print(f"JSON parsing error for flashcards: {e}")
+                return None
+        else:
+            print(f"GROQ API error for flashcards: {response.status_code} - {response.text}")
+            return None
+
+    except Exception as e:
+        print(f"Error calling GROQ API for flashcards: {e}")
+        return None
+
+def create_content_based_flashcards(text, num_flashcards=10):
+    """Fallback: term/definition flashcards from the text, generated locally without the API"""
+    with metrics.span('offline_generation', kind='flashcards'):
+        flashcards = generate_offline_flashcards(text, num_flashcards)
+    metrics.inc('generation_fallbacks_total', kind='flashcards')
+    print(f"Generated {len(flashcards)} flashcards offline")
+    return flashcards
+
+
+def _result_or_fallback(future, deadline, fallback, text, count, label):
+    """Wait for a generator until its deadline, then fall back locally"""
+    try:
+        return future.result(timeout=max(0, deadline - time.monotonic()))
+    except FutureTimeoutError:
+        print(f"{label} generation timed out, using fallback generation")
+    except Exception as e:
+        print(f"{label} generation failed: {e}")
+    future.cancel()
+    return fallback(text, count)
+
+
+def generate_study_material(text, num_questions=10, num_flashcards=10, mcq_timeout=None, flashcard_timeout=None):
+    """Generate MCQs and flashcards concurrently
+
+    The two requests are independent, so the caller waits for the slower
+    of the two instead of their sum. Each has its own timeout and falls
+    back to content-based generation when it expires.
+
+    Returns:
+        tuple: (mcqs, flashcards)
+    """
+    start = time.monotonic()
+    mcq_future = generation_executor.submit(metrics.bind(generate_mcqs_with_groq), text, num_questions)
+    flashcard_future = generation_executor.submit(metrics.bind(generate_flashcards_with_groq), text, num_flashcards)
+
+    mcqs = _result_or_fallback(
+        mcq_future, start + (mcq_timeout or MCQ_TIMEOUT),
+        create_content_based_mcqs, text, num_questions, 'MCQ'
+    )
+    flashcards = _result_or_fallback(
+        flashcard_future, start + (flashcard_timeout or FLASHCARD_TIMEOUT),
+        create_content_based_flashcards, text, num_flashcards, 'Flashcard'
+    )
+
+    print(f"Generated study material in {time.monotonic() - start:.1f}s")
+    return mcqs, flashcards
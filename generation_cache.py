@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class GenerationCache:
+    """Cache of generated MCQs/flashcards keyed by the prompt inputs
+
+    An in-process LRU with a TTL sits in front of an optional SQLite file
+    (GENERATION_CACHE_PATH) so entries survive restarts. Both layers are
+    bounded by the same entry limit.
+    """
+
+    def __init__(self, max_entries=None, ttl=None, path=None):
+        self.max_entries = max_entries or int(os.getenv('GENERATION_CACHE_MAX_ENTRIES', 512))
+        self.ttl = ttl or int(os.getenv('GENERATION_CACHE_TTL', 7 * 24 * 3600))
+        self.path = path or os.getenv('GENERATION_CACHE_PATH')
+        self.enabled = os.getenv('GENERATION_CACHE', 'on').lower() not in ['0', 'off', 'false']
+        self._entries = OrderedDict()  # key -> (created_at, value)
+        self._lock = threading.Lock()
+        self._db = None
+
+        if self.path:
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                self._db = sqlite3.connect(self.path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS generation_cache ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                    "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"Generation cache persistence disabled: {e}")
+                self._db = None
+
+    @staticmethod
+    def make_key(kind, text, count, model, prompt_version):
+        """Hash the inputs that determine the generated output"""
+        payload = json.dumps([kind, text, count, model, prompt_version], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _expired(self, created_at, now):
+        return now - created_at > self.ttl
+
+    def get(self, key):
+        """Get a cached value, or None if missing or expired"""
+        if not self.enabled:
+            return None
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if not self._expired(created_at, now):
+                    self._entries.move_to_end(key)
+                    return value
+                del self._entries[key]
+
+            if self._db is None:
+                return None
+
+            try:
+                row = self._db.execute(
+                    "SELECT value, created_at FROM generation_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                value, created_at = json.loads(row[0]), row[1]
+                if self._expired(created_at, now):
+                    self._db.execute("DELETE FROM generation_cache WHERE key = ?", (key,))
+                    self._db.commit()
+                    return None
+                self._db.execute("UPDATE generation_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                self._db.commit()
+            except (sqlite3.Error, ValueError) as e:
+                print(f"Error reading generation cache: {e}")
+                return None
+
+            self._remember(key, created_at, value)
+            return value
+
+    def put(self, key, value):
+        """Store a generated value and evict the least recently used entries"""
+        if not self.enabled:
+            return
+        now = time.time()
+
+        with self._lock:
+            self._remember(key, now, value)
+
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO generation_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), now, now)
+                )
+                self._db.execute("DELETE FROM generation_cache WHERE created_at < ?", (now - self.ttl,))
+                self._db.execute(
+                    "DELETE FROM generation_cache WHERE key NOT IN ("
+                    "SELECT key FROM generation_cache ORDER BY accessed_at DESC LIMIT ?)",
+                    (self.max_entries,)
+                )
+                self._db.commit()
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                print(f"Error writing generation cache: {e}")
+
+    def _remember(self, key, created_at, value):
+        self._entries[key] = (created_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Remove every cached entry"""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM generation_cache")
+                self._db.commit()
+
+
+# Initialize the shared generation cache
+generation_cache = GenerationCache()
@@ -0,0 +1,57 @@
+"""gunicorn settings, tunable through the environment
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Requests are served by threaded worker processes. Uploads only enqueue a
+job, extraction runs on each worker's job threads and OCR in a separate
+low-priority process pool, so lightweight endpoints (/check_answer,
+/session_data, chat) are never queued behind OCR.
+"""
+import os
+import sys
+import multiprocessing
+
+cpus = multiprocessing.cpu_count()
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', 5000)}")
+
+# Worker processes and request threads per process
+workers = int(os.getenv('WEB_CONCURRENCY', max(2, cpus // 2)))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+
+# Seconds a request may take; chat calls wait on the LLM upstream
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+# Seconds a worker stopped by the master (shutdown, HUP reload) gets to
+# finish requests and running upload jobs
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 120))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers after this many requests (0 = never), with jitter so
+# they do not all restart at once. Off by default: upload jobs run inside
+# the web workers, and a recycling worker is killed after `timeout`
+# seconds (not graceful_timeout) while it waits for them, so long OCR
+# jobs would be cut off. The progress page's polling makes recycling
+# frequent.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+
+# Every worker owns an OCR process pool; split the CPUs between them
+# rather than giving each worker one process per CPU
+os.environ.setdefault('OCR_WORKERS', str(max(1, cpus // workers)))
+
+
+def worker_exit(server, worker):
+    """Let a stopping worker finish its queued and running upload jobs
+
+    gunicorn also calls this hook in the master (e.g. for a worker that
+    already died), where there is no job queue to wait for.
+    """
+    if worker.pid != os.getpid():
+        return
+    jobs = sys.modules.get('jobs')
+    if jobs is None:
+        return  # this worker never loaded the app, so it ran no jobs
+    jobs.job_queue.shutdown(wait=True)
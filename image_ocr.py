@@ -0,0 +1,332 @@
+import io
+import os
+import math
+import time
+import hashlib
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+import pytesseract
+from pytesseract import Output
+from PIL import Image, ImageFilter
+from ocr_engine import ocr_engine
+from preprocessing import image_preprocessor
+from metrics import metrics
+
+# OCR configurations tried in "thorough" mode, in order of preference
+OCR_CONFIGS = [
+    '--psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,!?;: ',
+    '--psm 4 --oem 3',
+    '--psm 3 --oem 3',
+    '--psm 6 --oem 3',
+    '--psm 1 --oem 3',
+    '--psm 8 --oem 3',
+    '--psm 13 --oem 3'
+]
+
+# OCR mode for images: 'thorough' (parallel config search) or 'fast' (OSD + single pass)
+OCR_MODE = os.getenv('OCR_MODE', 'thorough')
+
+# A config "clearly wins" once it reaches this confidence with enough text
+EARLY_EXIT_CONFIDENCE = float(os.getenv('OCR_EARLY_EXIT_CONFIDENCE', 85))
+EARLY_EXIT_MIN_CHARS = int(os.getenv('OCR_EARLY_EXIT_MIN_CHARS', 20))
+
+# Seconds allowed for OCR of all images embedded in one document; whatever
+# finished by then is returned and the rest is skipped
+IMAGE_OCR_DEADLINE = float(os.getenv('IMAGE_OCR_DEADLINE', 120))
+
+# Embedded images below these thresholds are assumed to carry no text
+MIN_IMAGE_SIDE = int(os.getenv('OCR_MIN_IMAGE_SIDE', 32))
+MIN_IMAGE_ENTROPY = float(os.getenv('OCR_MIN_IMAGE_ENTROPY', 0.1))
+MIN_EDGE_DENSITY = float(os.getenv('OCR_MIN_EDGE_DENSITY', 0.02))
+
+
+def preprocess_image_for_ocr(image, dpi=None):
+    """Enhance image for better OCR results
+
+    `dpi` is the resolution the image was rendered at, used to downscale
+    oversized renders (see preprocessing.ImagePreprocessor).
+    """
+    try:
+        return image_preprocessor(image, dpi)
+    except Exception as e:
+        print(f"Error preprocessing image: {e}")
+        return image
+
+
+def ocr_with_confidence(image, config='', lang='eng'):
+    """Run a single OCR pass and return (text, mean word confidence)
+
+    Uses image_to_data so the text and its confidence come from one
+    Tesseract invocation.
+    """
+    data = pytesseract.image_to_data(image, lang=lang, config=config, output_type=Output.DICT)
+
+    lines = {}
+    confidences = []
+    for i, word in enumerate(data['text']):
+        if not word or not word.strip():
+            continue
+        key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        lines.setdefault(key, []).append(word)
+        conf = float(data['conf'][i])
+        if conf >= 0:
+            confidences.append(conf)
+
+    text = "\n".join(" ".join(words) for words in lines.values())
+    confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return text, confidence
+
+
+def _score(text, confidence):
+    """Rank OCR results by length, weighted by confidence"""
+    return len(text.strip()) * max(confidence, 1.0) / 100.0
+
+
+def _is_clear_winner(text, confidence):
+    return confidence >= EARLY_EXIT_CONFIDENCE and len(text.strip()) >= EARLY_EXIT_MIN_CHARS
+
+
+def search_best_config(image, configs=None, lang='eng'):
+    """Score OCR configs across the shared process pool and return the best text
+
+    Stops early and cancels the remaining configs as soon as one result
+    clearly wins.
+    """
+    configs = configs or OCR_CONFIGS
+    futures = {ocr_engine.submit(ocr_with_confidence, image, config, lang): config for config in configs}
+
+    best_text = ""
+    best_score = -1.0
+    pending = set(futures)
+
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                config = futures[future]
+                try:
+                    text, confidence = future.result()
+                except Exception as e:
+                    print(f"OCR config '{config}' failed: {e}")
+                    continue
+
+                score = _score(text, confidence)
+                if score > best_score:
+                    best_text = text
+                    best_score = score
+                    print(f"Better result with config '{config}': {len(text.strip())} chars, {confidence:.0f}% confidence")
+
+                if _is_clear_winner(text, confidence):
+                    print(f"Config '{config}' clearly wins, skipping {len(pending)} remaining configs")
+                    return best_text
+    finally:
+        for future in pending:
+            future.cancel()
+
+    return best_text
+
+
+def choose_psm(image, lang='eng'):
+    """Pick a page segmentation mode from OSD (--psm 0) layout analysis
+
+    Returns the image rotated upright and the PSM to use for a single
+    targeted OCR pass.
+    """
+    try:
+        osd = pytesseract.image_to_osd(image, output_type=Output.DICT)
+    except pytesseract.TesseractError:
+        # OSD needs a reasonable amount of text; treat the image as sparse text
+        return image, 11
+
+    rotate = int(osd.get('rotate', 0))
+    if rotate:
+        # OSD reports the clockwise rotation needed; PIL rotates counter-clockwise
+        image = image.rotate(-rotate, expand=True)
+
+    width, height = image.size
+    if height < 100 or width / max(height, 1) > 8:
+        return image, 7   # single text line
+    if float(osd.get('orientation_conf', 0)) < 2.0:
+        return image, 11  # low confidence layout, sparse text
+    if width * height < 500 * 500:
+        return image, 6   # small image, single uniform block
+    return image, 3       # full page, automatic segmentation
+
+
+def extract_text_fast(image, lang='eng'):
+    """Single targeted OCR pass using the PSM picked by OSD"""
+    image, psm = choose_psm(image, lang)
+    print(f"Fast OCR mode using --psm {psm}")
+    text, confidence = ocr_with_confidence(image, f'--psm {psm} --oem 3', lang)
+    print(f"Fast OCR result: {len(text.strip())} chars, {confidence:.0f}% confidence")
+    return text
+
+
+def ocr_image_bytes(data, config='--psm 6', lang='eng'):
+    """Decode, preprocess and OCR one embedded image (runs in a pool worker)"""
+    pil_image = Image.open(io.BytesIO(data))
+    processed_img = preprocess_image_for_ocr(pil_image)
+    return pytesseract.image_to_string(processed_img, lang=lang, config=config)
+
+
+class EmbeddedImageFilter:
+    """Pre-OCR filter for images embedded in a document
+
+    Skips tiny images (icons, bullets), near-uniform images with low
+    entropy or few edges (backgrounds, decorations) and duplicates, so a
+    logo reused on every slide is OCR'd once. Skip counts are kept per
+    reason for reporting.
+    """
+
+    def __init__(self, min_side=None, min_entropy=None, min_edge_density=None):
+        self.min_side = MIN_IMAGE_SIDE if min_side is None else min_side
+        self.min_entropy = MIN_IMAGE_ENTROPY if min_entropy is None else min_entropy
+        self.min_edge_density = MIN_EDGE_DENSITY if min_edge_density is None else min_edge_density
+        self._seen = set()
+        self.checked = 0
+        self.passed = 0
+        self.skipped = {}
+
+    def _skip(self, reason):
+        self.skipped[reason] = self.skipped.get(reason, 0) + 1
+        return False
+
+    def seen_before(self, key):
+        """Record a dedupe key (content hash, PDF xref); True if already seen"""
+        if key in self._seen:
+            self.checked += 1
+            self._skip('duplicate')
+            return True
+        self._seen.add(key)
+        return False
+
+    def accept(self, data):
+        """Check whether an embedded image is worth OCR'ing"""
+        if self.seen_before(hashlib.sha1(data).hexdigest()):
+            return False
+        self.checked += 1
+
+        try:
+            image = Image.open(io.BytesIO(data))
+            width, height = image.size
+        except Exception:
+            return self._skip('unreadable')
+
+        if min(width, height) < self.min_side:
+            return self._skip('too_small')
+
+        try:
+            # Statistics on a small grayscale thumbnail are enough here
+            image.draft('L', (256, 256))
+            thumb = image.convert('L')
+            thumb.thumbnail((256, 256))
+        except Exception:
+            return self._skip('unreadable')
+
+        pixels = thumb.size[0] * thumb.size[1]
+        histogram = thumb.histogram()
+        entropy = -sum((n / pixels) * math.log2(n / pixels) for n in histogram if n)
+        if entropy < self.min_entropy:
+            return self._skip('low_entropy')
+
+        edges = thumb.filter(ImageFilter.FIND_EDGES).histogram()
+        edge_density = sum(edges[32:]) / pixels
+        if edge_density < self.min_edge_density:
+            return self._skip('low_edge_density')
+
+        self.passed += 1
+        return True
+
+    def filter(self, images):
+        """Yield only the (label, image_bytes) pairs that pass the filter"""
+        for label, data in images:
+            if self.accept(data):
+                yield label, data
+
+    def report(self):
+        """Summary of how many images were skipped and why"""
+        return {
+            'checked': self.checked,
+            'passed': self.passed,
+            'skipped': sum(self.skipped.values()),
+            'reasons': dict(self.skipped)
+        }
+
+    def log_report(self, kind):
+        report = self.report()
+        if report['skipped']:
+            reasons = ", ".join(f"{reason}: {count}" for reason, count in sorted(report['reasons'].items()))
+            print(f"Skipped {report['skipped']} of {report['checked']} images in {kind} before OCR ({reasons})")
+
+
+def ocr_images(images, deadline=None, config='--psm 6', lang='eng', window=None, status=None):
+    """OCR a document's embedded images through the shared process pool
+
+    `images` is an iterable of (label, image_bytes) pairs; it is consumed
+    lazily so at most `window` images are held in flight. Results come
+    back in document order as (label, text) pairs. Once `deadline`
+    seconds have passed, remaining images are skipped and the partial
+    result is returned; status['timed_out'] is then set, if a `status`
+    dict is given, so callers can tell a partial result apart.
+    """
+    deadline = IMAGE_OCR_DEADLINE if deadline is None else deadline
+    stop_at = time.monotonic() + deadline
+    window = max(1, window or ocr_engine.max_workers * 2)
+
+    images = iter(images)
+    order = []
+    results = {}
+    in_flight = {}
+    payloads = {}  # label -> bytes of images in flight, for a retry if the pool breaks
+    exhausted = False
+    timed_out = False
+
+    while True:
+        # Keep the window full
+        while not exhausted and len(in_flight) < window:
+            try:
+                label, data = next(images)
+            except StopIteration:
+                exhausted = True
+                break
+            future = ocr_engine.submit(ocr_image_bytes, data, config, lang)
+            in_flight[future] = label
+            payloads[label] = data
+            order.append(label)
+
+        if not in_flight:
+            break
+
+        remaining = stop_at - time.monotonic()
+        if remaining <= 0:
+            timed_out = True
+            break
+
+        done, _ = wait(in_flight, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            label = in_flight.pop(future)
+            data = payloads.pop(label, None)
+            try:
+                results[label] = future.result()
+                metrics.inc('ocr_passes_total', kind='image')
+            except BrokenProcessPool as e:
+                if data is None:
+                    print(f"Error processing image {label}: {e}")
+                    metrics.inc('ocr_failures_total', kind='image')
+                else:
+                    # Retry once on a fresh pool; no bytes are kept for a second retry
+                    in_flight[ocr_engine.submit(ocr_image_bytes, data, config, lang)] = label
+                    continue
+            except Exception as e:
+                print(f"Error processing image {label}: {e}")
+                metrics.inc('ocr_failures_total', kind='image')
+
+    if timed_out:
+        for future in in_flight:
+            future.cancel()
+        print(f"Image OCR deadline of {deadline:.0f}s reached, returning {len(results)} of {len(order)}+ images")
+        metrics.inc('ocr_deadlines_total')
+        if status is not None:
+            status['timed_out'] = True
+
+    return [(label, results[label]) for label in order if label in results]
@@ -0,0 +1,255 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from metrics import metrics
+
+
+class JobError(Exception):
+    """A job failure whose message is safe to show to the user"""
+
+
+class JobQueueFull(Exception):
+    """Raised when the queue already holds its maximum number of jobs"""
+
+
+class Job:
+    """Handle passed to a running job for reporting progress"""
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.id = job_id
+
+    def update(self, **fields):
+        """Record progress, e.g. stage='ocr', pages_done=3, pages_total=10"""
+        self.queue.update(self.id, **fields)
+
+    def progress(self, stage, pages_done=None, pages_total=None):
+        """Progress callback in the form used by the extraction pipeline"""
+        fields = {'stage': stage}
+        if pages_done is not None:
+            fields['pages_done'] = pages_done
+        if pages_total is not None:
+            fields['pages_total'] = pages_total
+        self.update(**fields)
+
+
+class JobQueue:
+    """Local background job queue for upload processing
+
+    Jobs run on a bounded thread pool in this process; their state lives
+    in SQLite so any web worker can answer status requests. Finished jobs
+    are purged after JOB_TTL seconds.
+
+    While a job is queued or running, a heartbeat thread of the process
+    that owns it touches its row every JOB_HEARTBEAT seconds. If the
+    process dies (worker crash, OOM kill, timeout), the heartbeat stops.
+    After JOB_STALE_AFTER seconds without an update, the job is marked
+    failed instead of staying queued/running forever, and it is purged
+    like any other failed job.
+    """
+
+    STALE_ERROR = 'Processing was interrupted. Please upload the file again.'
+
+
+    FIELDS = ['stage', 'pages_done', 'pages_total', 'status', 'error', 'result']
+
+    def __init__(self, db_path=None, max_workers=None, max_pending=None, ttl=None,
+                 heartbeat=None, stale_after=None):
+        self.db_path = db_path or os.getenv('JOBS_DB', os.path.join('cache', 'jobs.sqlite3'))
+        self.max_workers = max_workers or int(os.getenv('UPLOAD_WORKERS', 2))
+        self.max_pending = max_pending or int(os.getenv('JOB_QUEUE_SIZE', 32))
+        self.ttl = ttl or int(os.getenv('JOB_TTL', 3600))
+        self.heartbeat = heartbeat or float(os.getenv('JOB_HEARTBEAT', 30))
+        self.stale_after = stale_after or float(os.getenv('JOB_STALE_AFTER', 300))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='upload-job')
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._active = set()  # IDs of queued/running jobs owned by this process
+        self._active_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat_thread = None
+
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, stage TEXT, "
+                "pages_done INTEGER DEFAULT 0, pages_total INTEGER DEFAULT 0, "
+                "error TEXT, result TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with db:  # commits on success, rolls back on error
+                yield db
+        finally:
+            db.close()
+
+    def new_id(self):
+        return uuid.uuid4().hex
+
+    def submit(self, func, *args, job_id=None):
+        """Queue func(job, *args) and return the job ID
+
+        Raises:
+            JobQueueFull: if max_pending jobs are already queued or running
+        """
+        if not self._slots.acquire(blocking=False):
+            raise JobQueueFull("Too many uploads are being processed, please try again shortly")
+
+        job_id = job_id or self.new_id()
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO jobs (id, status, stage, created_at, updated_at) VALUES (?, 'queued', 'queued', ?, ?)",
+                (job_id, now, now)
+            )
+        with self._active_lock:
+            self._active.add(job_id)
+        self._start_heartbeat()
+        self.purge_expired()
+
+        try:
+            self._executor.submit(self._run, job_id, func, args)
+        except Exception:
+            self._finished(job_id)
+            self.update(job_id, status='failed', error='Error processing file. Please try again.')
+            raise
+        return job_id
+
+    def _finished(self, job_id):
+        with self._active_lock:
+            self._active.discard(job_id)
+        self._slots.release()
+
+    def _start_heartbeat(self):
+        with self._active_lock:
+            if self._heartbeat_thread is not None:
+                return
+            self._heartbeat_thread = threading.Thread(target=self._beat, name='job-heartbeat', daemon=True)
+            self._heartbeat_thread.start()
+
+    def _beat(self):
+        """Keep this process's queued and running jobs from looking stale"""
+        while not self._stop.wait(self.heartbeat):
+            with self._active_lock:
+                job_ids = list(self._active)
+            if not job_ids:
+                continue
+            try:
+                with self._connect() as db:
+                    db.execute(
+                        "UPDATE jobs SET updated_at = ? WHERE status IN ('queued', 'running') "
+                        f"AND id IN ({', '.join('?' * len(job_ids))})",
+                        [time.time()] + job_ids
+                    )
+            except sqlite3.Error as e:
+                print(f"Error recording job heartbeat: {e}")
+
+    def _run(self, job_id, func, args):
+        job = Job(self, job_id)
+        # Spans recorded while the job runs are tagged with its ID
+        with metrics.trace(job_id), metrics.span('job') as span:
+            status = 'done'
+            try:
+                self.update(job_id, status='running')
+                result = func(job, *args)
+                self.update(job_id, status='done', stage='done', result=result)
+            except JobError as e:
+                print(f"Job {job_id} failed: {e}")
+                status = 'failed'
+                self.update(job_id, status='failed', error=str(e))
+            except Exception as e:
+                print(f"Job {job_id} crashed: {e}")
+                status = 'crashed'
+                self.update(job_id, status='failed', error='Error processing file. Please try again.')
+            finally:
+                self._finished(job_id)
+                span.set(outcome=status)
+                metrics.inc('jobs_total', status=status)
+
+    def update(self, job_id, **fields):
+        """Update stored fields of a job"""
+        columns = []
+        values = []
+        for name, value in fields.items():
+            if name not in self.FIELDS:
+                raise ValueError(f"Unknown job field: {name}")
+            if name == 'result':
+                value = json.dumps(value)
+            columns.append(f"{name} = ?")
+            values.append(value)
+        columns.append("updated_at = ?")
+        values.append(time.time())
+        values.append(job_id)
+        try:
+            with self._connect() as db:
+                db.execute(f"UPDATE jobs SET {', '.join(columns)} WHERE id = ?", values)
+        except sqlite3.Error as e:
+            print(f"Error updating job {job_id}: {e}")
+
+    def get(self, job_id):
+        """Get a job as a dict, or None if it does not exist"""
+        with self._connect() as db:
+            db.row_factory = sqlite3.Row
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        if job['status'] in ('queued', 'running') and job['updated_at'] < time.time() - self.stale_after:
+            self.fail_stale(job_id)
+            job.update(status='failed', error=self.STALE_ERROR)
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs; with wait=True, let running and queued jobs finish"""
+        self._executor.shutdown(wait=wait)
+        self._stop.set()
+
+    def fail_stale(self, job_id=None):
+        """Mark queued/running jobs whose owner stopped updating them as failed
+
+        With a job_id only that job is checked. updated_at is left as the
+        time of the job's last sign of life, so purge_expired deletes
+        long-dead jobs straight away. Returns the number of jobs marked
+        failed.
+        """
+        query = ("UPDATE jobs SET status = 'failed', error = ? "
+                 "WHERE status IN ('queued', 'running') AND updated_at < ?")
+        params = [self.STALE_ERROR, time.time() - self.stale_after]
+        if job_id is not None:
+            query += " AND id = ?"
+            params.append(job_id)
+        try:
+            with self._connect() as db:
+                failed = db.execute(query, params).rowcount
+        except sqlite3.Error as e:
+            print(f"Error failing stale jobs: {e}")
+            return 0
+        if failed:
+            print(f"Marked {failed} stale job(s) as failed")
+            metrics.inc('jobs_total', failed, status='stale')
+        return failed
+
+    def purge_expired(self):
+        """Fail stale jobs and delete jobs that finished more than ttl seconds ago"""
+        self.fail_stale()
+        try:
+            with self._connect() as db:
+                db.execute(
+                    "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                    (time.time() - self.ttl,)
+                )
+        except sqlite3.Error as e:
+            print(f"Error purging jobs: {e}")
+
+
+# Initialize the shared job queue
+job_queue = JobQueue()
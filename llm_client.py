@@ -0,0 +1,196 @@
+import os
+import time
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import metrics
+
+GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+
+# Upstream statuses worth retrying
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling the upstream while the circuit is open"""
+
+
+class RetryBudget:
+    """Caps retries to a fraction of overall traffic
+
+    Every request deposits `ratio` tokens and every retry withdraws one,
+    so a struggling upstream is not hit with a retry storm.
+    """
+
+    def __init__(self, ratio=0.2, min_tokens=3, max_tokens=20):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = float(min_tokens)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self):
+        """Take a token for a retry; returns False when the budget is spent"""
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class CircuitBreaker:
+    """Fails fast after repeated upstream failures
+
+    After `failure_threshold` consecutive failures the circuit opens for
+    `reset_timeout` seconds; then a single trial request is let through
+    (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        """Check whether a request may be sent upstream"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    print(f"LLM circuit opened after {self._failures} consecutive failures")
+                self._opened_at = time.monotonic()
+
+
+class LLMClient:
+    """Shared HTTP client for all GROQ chat completion calls
+
+    Keeps a pooled keep-alive Session, applies connect/read timeouts to
+    every call, retries 429/5xx with jittered backoff within a retry
+    budget, and short-circuits while the upstream is unhealthy.
+    """
+
+    def __init__(self, api_url=GROQ_API_URL):
+        self.api_url = api_url
+        self.connect_timeout = float(os.getenv('LLM_CONNECT_TIMEOUT', 5))
+        self.read_timeout = float(os.getenv('LLM_READ_TIMEOUT', 30))
+        self.max_retries = int(os.getenv('LLM_MAX_RETRIES', 2))
+        self.backoff = float(os.getenv('LLM_RETRY_BACKOFF', 0.5))
+        self.retry_budget = RetryBudget(ratio=float(os.getenv('LLM_RETRY_BUDGET', 0.2)))
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv('LLM_BREAKER_THRESHOLD', 5)),
+            reset_timeout=float(os.getenv('LLM_BREAKER_RESET', 30))
+        )
+
+        pool_size = int(os.getenv('LLM_POOL_SIZE', 16))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def is_available(self):
+        """Check whether the circuit currently lets requests through"""
+        return self.breaker.state != 'open'
+
+    def _sleep_before_retry(self, attempt, response=None):
+        delay = self.backoff * (2 ** attempt)
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    delay = max(delay, float(retry_after))
+                except ValueError:
+                    pass
+        # Full jitter spreads out retries from concurrent workers
+        time.sleep(random.uniform(0, delay))
+
+    def post(self, payload, api_key, timeout=None, stream=False):
+        """POST a chat completion payload and return the response
+
+        Raises:
+            CircuitOpenError: if the upstream is currently considered unhealthy
+            requests.RequestException: if the request ultimately fails
+        """
+        if not self.breaker.allow():
+            metrics.inc('llm_requests_total', result='circuit_open')
+            raise CircuitOpenError("LLM upstream unavailable (circuit open)")
+
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        timeout = timeout or (self.connect_timeout, self.read_timeout)
+        self.retry_budget.deposit()
+
+        with metrics.span('llm_request', stream=stream) as span:
+            response = self._post_with_retries(headers, payload, timeout, stream)
+            span.set(http_status=response.status_code)
+        metrics.inc('llm_requests_total', result=str(response.status_code))
+        return response
+
+    def _post_with_retries(self, headers, payload, timeout, stream):
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(self.api_url, headers=headers, json=payload,
+                                             timeout=timeout, stream=stream)
+            except requests.RequestException as e:
+                if attempt < self.max_retries and self.retry_budget.withdraw():
+                    print(f"LLM request failed ({e}), retrying")
+                    metrics.inc('llm_retries_total', reason='network')
+                    self._sleep_before_retry(attempt)
+                    attempt += 1
+                    continue
+                self.breaker.record_failure()
+                metrics.inc('llm_requests_total', result='network_error')
+                raise
+
+            if response.status_code in RETRY_STATUSES:
+                if attempt < self.max_retries and self.retry_budget.withdraw():
+                    print(f"LLM upstream returned {response.status_code}, retrying")
+                    metrics.inc('llm_retries_total', reason=str(response.status_code))
+                    response.close()
+                    self._sleep_before_retry(attempt, response)
+                    attempt += 1
+                    continue
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            return response
+
+
+# Initialize the shared client
+llm_client = LLMClient()
@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+
+# Histogram buckets in seconds: OCR pages and LLM calls run to tens of seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Span:
+    """A timed stage; records its duration and logs one structured line
+
+    Fields can be added while the span runs with set(), e.g. the number of
+    pages a stage processed.
+    """
+
+    __slots__ = ('metrics', 'name', 'fields', 'start', 'parent')
+
+    def __init__(self, metrics, name, fields):
+        self.metrics = metrics
+        self.name = name
+        self.fields = fields
+        self.start = None
+        self.parent = None
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def __enter__(self):
+        local = self.metrics._local
+        self.parent = getattr(local, 'span', None)
+        local.span = self
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        self.metrics._local.span = self.parent
+        status = 'error' if exc_type else 'ok'
+        self.metrics.observe('stage_seconds', elapsed, stage=self.name)
+        if exc_type:
+            self.metrics.inc('stage_errors_total', stage=self.name)
+        # Span fields come first so they can never shadow the span's own keys
+        record = dict(self.fields)
+        record['span'] = self.name
+        record['parent'] = self.parent.name if self.parent else None
+        record['ms'] = round(elapsed * 1000, 3)
+        record['status'] = status
+        self.metrics.log('span', record)
+        return False
+
+
+class _NullSpan:
+    """Stand-in span used while metrics are disabled"""
+
+    __slots__ = ()
+
+    def set(self, **fields):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Metrics:
+    """In-process counters, histograms and stage spans
+
+    Counters and histograms are keyed by name and labels and exposed in
+    the Prometheus text format at /metrics. Spans time a stage of work
+    (validate, parse, OCR, generation, ...) into the stage_seconds
+    histogram and, with METRICS_LOG on, write one JSON log line each,
+    tagged with the trace ID of the job they ran in.
+
+    Values are per process: each gunicorn worker reports its own. With
+    METRICS=off every call returns immediately.
+    """
+
+    def __init__(self, enabled=None, log_spans=None):
+        if enabled is None:
+            enabled = os.getenv('METRICS', 'on').lower() not in ['0', 'off', 'false']
+        if log_spans is None:
+            log_spans = os.getenv('METRICS_LOG', 'on').lower() not in ['0', 'off', 'false']
+        self.enabled = enabled
+        self.log_spans = enabled and log_spans
+        self._counters = {}    # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        """Add to a counter"""
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Record a value (usually seconds) in a histogram"""
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def span(self, name, **fields):
+        """Context manager timing one stage"""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, fields)
+
+    def trace(self, trace_id):
+        """Context manager tagging this thread's spans and logs with a trace ID"""
+        return _Trace(self, trace_id) if self.enabled else NULL_SPAN
+
+    def bind(self, func):
+        """Wrap func so it runs under the calling thread's trace ID, e.g. on an executor"""
+        trace_id = getattr(self._local, 'trace_id', None) if self.enabled else None
+        if trace_id is None:
+            return func
+
+        def traced(*args, **kwargs):
+            with self.trace(trace_id):
+                return func(*args, **kwargs)
+        return traced
+
+    def log(self, event, fields):
+        """Write one structured (JSON) log line with the given fields"""
+        if not self.log_spans:
+            return
+        record = {'event': event, 'ts': round(time.time(), 3)}
+        trace_id = getattr(self._local, 'trace_id', None)
+        if trace_id:
+            record['trace'] = trace_id
+        record.update(fields)
+        print(json.dumps(record, default=str))
+
+    @staticmethod
+    def _format(name, labels, extra=()):
+        labels = tuple(labels) + tuple(extra)
+        if not labels:
+            return name
+        pairs = ",".join(
+            '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for k, v in labels
+        )
+        return f"{name}{{{pairs}}}"
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, list(h.counts), h.sum, h.count, h.buckets) for key, h in self._histograms.items()
+            )
+
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{self._format(name, labels)} {value}")
+
+        for (name, labels), counts, total, count, buckets in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+                cumulative += bucket_count
+                lines.append(f"{self._format(name + '_bucket', labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{self._format(name + '_sum', labels)} {total}")
+            lines.append(f"{self._format(name + '_count', labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class _Trace:
+    __slots__ = ('metrics', 'trace_id', 'previous')
+
+    def __init__(self, metrics, trace_id):
+        self.metrics = metrics
+        self.trace_id = trace_id
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = getattr(self.metrics._local, 'trace_id', None)
+        self.metrics._local.trace_id = self.trace_id
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics._local.trace_id = self.previous
+        return False
+
+
+# Initialize the shared metrics registry
+metrics = Metrics()
@@ -0,0 +1,195 @@
+import os
+import glob
+import shutil
+import subprocess
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pytesseract
+
+
+def _init_worker(tesseract_cmd, niceness=0):
+    """Point OCR worker processes at the binary found by the parent
+
+    Workers also lower their CPU priority so OCR (and the Tesseract
+    processes it spawns) never starves the web workers.
+    """
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    if niceness and hasattr(os, 'nice'):
+        try:
+            os.nice(niceness)
+        except OSError:
+            pass
+
+
+class OCREngine:
+    """Process-wide registry for the Tesseract OCR binary.
+
+    Tesseract is probed once (binary path, version and installed language
+    packs) and the result is cached, so callers can check availability
+    without spawning a subprocess every time.
+    """
+
+    # Common installation paths, checked when `tesseract` is not on PATH
+    POSSIBLE_PATHS = [
+        r'C:\Program Files\Tesseract-OCR\tesseract.exe',
+        r'C:\Program Files (x86)\Tesseract-OCR\tesseract.exe',
+        r'C:\Users\{}\AppData\Local\Tesseract-OCR\tesseract.exe'.format(os.getenv('USERNAME', '')),
+        '/usr/bin/tesseract',
+        '/usr/local/bin/tesseract',
+        '/opt/homebrew/bin/tesseract',
+        '/usr/local/Cellar/tesseract/*/bin/tesseract'  # Homebrew on macOS
+    ]
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._probed = False
+        self.path = None
+        self.version = None
+        self.languages = []
+        self.max_workers = max(1, int(os.getenv('OCR_WORKERS', os.cpu_count() or 1)))
+        self.niceness = int(os.getenv('OCR_NICE', 10))
+        # Forking a threaded web worker can copy locks held by other threads
+        # into the child; forkserver/spawn start workers from a clean process
+        self.start_method = os.getenv('OCR_START_METHOD') or (
+            'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        )
+        self._executor = None
+
+    def _run(self, args):
+        """Run the Tesseract binary and return stdout, or None on failure"""
+        try:
+            result = subprocess.run(args, capture_output=True, text=True, timeout=10)
+        except (subprocess.TimeoutExpired, OSError):
+            return None
+        if result.returncode != 0:
+            return None
+        # Older Tesseract releases print version/langs to stderr
+        return result.stdout or result.stderr
+
+    def _candidates(self):
+        """Yield candidate binary paths in order of preference"""
+        on_path = shutil.which('tesseract')
+        if on_path:
+            yield on_path
+        for pattern in self.POSSIBLE_PATHS:
+            for path in sorted(glob.glob(pattern)):
+                yield path
+
+    def _probe(self):
+        self.path = None
+        self.version = None
+        self.languages = []
+
+        for path in self._candidates():
+            output = self._run([path, '--version'])
+            if not output:
+                continue
+
+            self.path = path
+            self.version = output.split()[1] if len(output.split()) > 1 else 'unknown'
+            pytesseract.pytesseract.tesseract_cmd = path
+
+            langs = self._run([path, '--list-langs'])
+            if langs:
+                # First line is a header ("List of available languages ...")
+                self.languages = [l.strip() for l in langs.splitlines()[1:] if l.strip()]
+
+            print(f"Tesseract found at: {path} (version {self.version}, languages: {', '.join(self.languages) or 'none'})")
+            break
+        else:
+            print("Tesseract not found. Please install it:")
+            print("Windows: Download from https://github.com/UB-Mannheim/tesseract/wiki")
+            print("Linux: sudo apt-get install tesseract-ocr")
+            print("macOS: brew install tesseract")
+
+        self._probed = True
+
+    def probe(self):
+        """Probe for Tesseract once; later calls reuse the cached result"""
+        if not self._probed:
+            with self._lock:
+                if not self._probed:
+                    self._probe()
+        return self.path is not None
+
+    def reprobe(self):
+        """Force a fresh probe, e.g. after Tesseract was installed or upgraded"""
+        with self._lock:
+            self._probe()
+            # Workers were started with the old binary path
+            self._shutdown_executor()
+        return self.path is not None
+
+    def executor(self):
+        """Get the shared, bounded process pool used for OCR work"""
+        self.probe()
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context(self.start_method),
+                        initializer=_init_worker,
+                        initargs=(self.path, self.niceness)
+                    )
+        return self._executor
+
+    def submit(self, fn, *args):
+        """Submit OCR work to the shared pool
+
+        A worker killed mid-task (e.g. by the OOM killer on a large page)
+        breaks the whole pool; it is then replaced and the call retried
+        once, so one bad page does not disable OCR for the rest of the
+        process's life.
+        """
+        executor = self.executor()
+        try:
+            return executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self.discard(executor)
+            return self.executor().submit(fn, *args)
+
+    def discard(self, executor):
+        """Drop a broken pool so the next executor() call starts a fresh one"""
+        with self._lock:
+            if self._executor is executor:
+                print("OCR process pool broke (a worker was killed), starting a new one")
+                self._shutdown_executor()
+
+    def _shutdown_executor(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def is_available(self):
+        """Cheap availability check backed by the cached probe"""
+        return self.probe()
+
+    def has_language(self, lang):
+        """Check whether a language pack (e.g. 'eng') is installed"""
+        return self.probe() and lang in self.languages
+
+    def info(self):
+        """Get the cached probe result as a dict"""
+        self.probe()
+        return {
+            "available": self.path is not None,
+            "path": self.path,
+            "version": self.version,
+            "languages": list(self.languages)
+        }
+
+
+# Initialize the shared engine registry
+ocr_engine = OCREngine()
+
+def is_available():
+    """Check whether Tesseract OCR is available in this process"""
+    return ocr_engine.is_available()
+
+def reprobe():
+    """Re-detect the Tesseract binary, version and language packs"""
+    return ocr_engine.reprobe()
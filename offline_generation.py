@@ -0,0 +1,461 @@
+import re
+import math
+import random
+import hashlib
+from functools import lru_cache
+from collections import Counter, defaultdict
+from chunking import SECTION_MARKER
+from retrieval import STOPWORDS
+
+WORD = re.compile(r"[A-Za-z][A-Za-z'\-]*[A-Za-z]|[A-Za-z]")
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"(])')
+
+# Words that introduce a noun phrase; terms seen after them are likely nouns
+DETERMINERS = frozenset("""
+a an the this that these those its their his her our each every some any no of in on at by with
+from into onto for about between within without through during
+""".split())
+
+# Words that open a noun phrase; a term directly before one is usually a
+# verb ("the nucleus contains the ...", "meiosis produces four ...")
+PHRASE_OPENERS = frozenset("""
+a an the this that these those its their his her our one two three four five several many
+""".split())
+
+# Words after which a content word is a verb ("to produce", "can bind")
+VERB_CUES = frozenset("""
+to can cannot could will would may might must should shall does do did
+""".split())
+
+# Prepositions, conjunctions and adverbs that the retrieval stopwords lack;
+# they end a noun phrase ("water across", "cell without")
+FUNCTION_WORDS = frozenset("""
+across inside outside without within among amongst along around behind below beneath beside besides
+beyond toward towards upon via near per like unlike despite throughout whereas although though
+unless whether either neither also often usually always never sometimes instead therefore however
+thus hence rather still even already yet etc
+""".split())
+
+# A content word followed by one of these is a phrasal verb ("speed up")
+PARTICLES = frozenset("up down out off away back".split())
+
+# Common verbs of study material; a match not preceded by a determiner is
+# read as a verb ("the chloroplast contains ...", but "in the form of")
+COMMON_VERBS = frozenset("""
+contain produce use form make cause occur require include provide allow help involve convert
+release absorb store transport move carry break control regulate increase decrease reduce create
+become show take give lead result depend consist describe explain determine affect change develop
+build bind speed enter leave pass divide replicate synthesize digest
+""".split())
+
+# Leading bullet markers of slide and note lines ("•", "-", "1.", "a)")
+BULLET = re.compile(r'^(?:[-*\u2022\u2023\u25e6\u25aa\u25cf\u25cb\u00b7\u2013\u2014]+|\(?\d{1,2}[.)]|\(?[a-z][.)])\s+')
+
+# Labels the image extractors put above OCR'd image text
+IMAGE_LABEL = re.compile(r'^\[Image[^\]]*\]:$')
+
+# Wrong options of last resort, for texts with too few terms of their own
+FILLER_TERMS = (
+    "hypothesis", "framework", "variable", "principle", "mechanism",
+    "equilibrium", "catalyst", "algorithm", "theorem", "ecosystem"
+)
+
+# "Osmosis is ...", "Enzymes are ...", "X refers to ...", "X, also called ..."
+DEFINITION = re.compile(
+    r'\b(?:is|are|was|were|refers? to|means?|is called|are called|is known as|are known as|'
+    r'is defined as|are defined as|describes?|consists? of)\b',
+    re.IGNORECASE
+)
+
+
+class OfflineGenerator:
+    """Local MCQ and flashcard generation from the document's own statistics
+
+    Used when the LLM is not configured, fails or times out. The text is
+    split into sentences and keywords (single words and two-word phrases)
+    are ranked by term frequency weighted by how specific they are to a
+    few sentences. MCQs are cloze questions: a keyword is blanked out of
+    a sentence that uses it, and the distractors are other keywords of
+    similar rank and shape. Flashcards pair a keyword with the sentence
+    that best defines it. Output is deterministic for a given text.
+    """
+
+    MIN_SENTENCE_WORDS = 6
+    MIN_FRAGMENT_WORDS = 2
+    MAX_SENTENCE_WORDS = 45
+    MAX_PHRASE_WORDS = 2
+
+    # With fewer full sentences than this (slide decks, short scans),
+    # bullet points and short lines are used as well
+    MIN_SENTENCES = 20
+
+    def _starts_block(self, previous, line):
+        """Whether a line starts a new block rather than continuing the one above
+
+        Extracted PDF, OCR and DOCX text is hard-wrapped: a sentence runs
+        over several lines, and a line may start mid-phrase ("contains
+        chlorophyll, ..."). Only a short previous line that does not end
+        mid-phrase, followed by a capitalised line, is read as a heading
+        or slide line of its own.
+        """
+        words = previous.split()
+        return (len(words) < self.MIN_SENTENCE_WORDS
+                and words[-1].lower().strip(',;') not in STOPWORDS
+                and line[:1].isupper())
+
+    def paragraphs(self, text):
+        """Paragraphs of the text with wrapped lines joined back together
+
+        Blocks end at blank lines, page/slide markers, image labels,
+        bullet points and headings; bullet markers are stripped.
+        """
+        text = SECTION_MARKER.sub('\n\n', text)
+        paragraphs, current = [], []
+        for line in text.split('\n'):
+            line = " ".join(line.split())
+            bullet = BULLET.match(line)
+            if (not line or IMAGE_LABEL.match(line) or bullet
+                    or (current and self._starts_block(current[-1], line))):
+                if current:
+                    paragraphs.append(" ".join(current))
+                current = []
+                if not line or IMAGE_LABEL.match(line):
+                    continue
+                line = BULLET.sub('', line)
+            current.append(line)
+        if current:
+            paragraphs.append(" ".join(current))
+        return paragraphs
+
+    def sentences(self, text):
+        """Readable sentences of the text, in order, without page markers
+
+        Repeated lines (slide headers, running titles) are kept once.
+        """
+        full, fragments = [], []
+        seen = set()
+        for paragraph in self.paragraphs(text):
+            for sentence in SENTENCE_END.split(paragraph):
+                words = sentence.split()
+                if not (self.MIN_FRAGMENT_WORDS <= len(words) <= self.MAX_SENTENCE_WORDS):
+                    continue
+                # Skip tables, references and OCR noise: mostly non-words
+                if len(WORD.findall(sentence)) < 0.6 * len(words):
+                    continue
+                if sentence.lower() in seen:
+                    continue
+                seen.add(sentence.lower())
+                target = full if len(words) >= self.MIN_SENTENCE_WORDS else fragments
+                target.append((len(seen), sentence))
+        if len(full) < self.MIN_SENTENCES:
+            full = sorted(full + fragments)
+        return [sentence for _, sentence in full]
+
+    @staticmethod
+    def _verb_like(key, previous):
+        """Whether a content word reads as a verb, judged from itself and the word before"""
+        if previous in VERB_CUES:
+            return True
+        if previous in DETERMINERS:
+            return False
+        if len(key) > 5 and key.endswith(('ized', 'ised', 'izes', 'ated')):
+            return True
+        if len(key) > 4 and key.endswith('ed'):
+            return True
+        # contains, produces, passes, producing
+        return any(stem in COMMON_VERBS for stem in (key, key[:-1], key[:-2], key[:-3], key[:-3] + 'e'))
+
+    def _candidates(self, sentence):
+        """Noun-phrase candidates of a sentence: the head noun of each run of
+        content words, alone and with the word before it
+
+        Runs are broken at stopwords and at words that read as verbs, so
+        "the chloroplast contains chlorophyll" gives "chloroplast" and
+        "chlorophyll", never "chloroplast contains". Yields (candidate,
+        noun-like) pairs; a run is surely a noun phrase when it opens the
+        sentence or follows a determiner, preposition or verb.
+        """
+        tokens = WORD.findall(sentence)
+        candidates = []
+        run = []
+        noun_like = True  # sentence subject
+        previous = ''
+        tokens.append('')
+        for i, token in enumerate(tokens):
+            key = token.lower()
+            content = (token and key not in STOPWORDS and key not in PHRASE_OPENERS
+                       and key not in FUNCTION_WORDS and len(key) > 2 and not key.endswith('ly'))
+            following = tokens[i + 1].lower() if i + 1 < len(tokens) else ''
+            verb = content and (self._verb_like(key, previous) or following in PARTICLES)
+            if content and not verb:
+                run.append(token)
+                previous = key
+                continue
+            if key in PHRASE_OPENERS and run and self._verb_like(run[-1].lower(), ''):
+                run.pop()
+            for size in range(1, min(self.MAX_PHRASE_WORDS, len(run)) + 1):
+                candidates.append((" ".join(run[-size:]), noun_like or size > 1))
+            run = []
+            noun_like = verb or key in DETERMINERS
+            previous = key
+        return candidates
+
+    def keywords(self, sentences):
+        """Ranked keywords with the sentences that contain them
+
+        Returns a list of (key, surface form, sentence indexes), best first.
+        """
+        frequency = Counter()
+        nouns = Counter()
+        surface = defaultdict(Counter)
+        where = defaultdict(list)
+        for i, sentence in enumerate(sentences):
+            seen = set()
+            for candidate, noun_like in self._candidates(sentence):
+                key = candidate.lower()
+                frequency[key] += 1
+                nouns[key] += noun_like
+                surface[key][candidate] += 1
+                if key not in seen:
+                    seen.add(key)
+                    where[key].append(i)
+
+        total = max(len(sentences), 1)
+        scored = []
+        for key, count in frequency.items():
+            words = key.count(' ') + 1
+            # Phrases must repeat to count as terms (except in short texts such
+            # as slide decks, where a title is said once); single words need some length
+            if words > 1 and count < 2 and total >= self.MIN_SENTENCES:
+                continue
+            if words == 1 and len(key) < 4:
+                continue
+            spread = len(where[key]) / total
+            if spread > 0.5 and total > 4:
+                continue  # too common to be a useful answer
+            specificity = math.log(1 + 1 / max(spread, 1 / total))
+            # Verbs and adjectives make poor answers: favour noun-like terms
+            noun_ratio = nouns[key] / count
+            score = count * specificity * (1.5 if words > 1 else 1.0) * min(len(key), 12) / 12 * (0.25 + noun_ratio)
+            scored.append((score, key))
+
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        ranked = []
+        covered = set()
+        for _, key in scored:
+            # A word already inside a better-ranked phrase adds nothing
+            if key in covered:
+                continue
+            # Lowercase form unless the term is always capitalized (names)
+            forms = surface[key]
+            form = key if key in forms else forms.most_common(1)[0][0]
+            ranked.append((key, form, where[key]))
+            if ' ' in key:
+                covered.update(key.split())
+        return ranked
+
+    @lru_cache(maxsize=4)
+    def analyze(self, text):
+        """Sentences and ranked keywords of a text
+
+        Cached, so MCQ and flashcard generation for the same upload share
+        one pass over the text.
+        """
+        sentences = self.sentences(text)
+        return sentences, self.keywords(sentences)
+
+    @staticmethod
+    def _rng(text):
+        seed = int(hashlib.sha256(text.encode('utf-8')).hexdigest()[:16], 16)
+        return random.Random(seed)
+
+    @staticmethod
+    def _blank(sentence, term):
+        """Sentence with the first whole-word occurrence of term blanked out"""
+        pattern = re.compile(r'(?<![A-Za-z])' + re.escape(term) + r'(?![A-Za-z])', re.IGNORECASE)
+        match = pattern.search(sentence)
+        if match is None:
+            return None, None
+        return sentence[:match.start()] + "_____" + sentence[match.end():], match.group(0)
+
+    @staticmethod
+    def _pick_sentence(indexes, sentences, used):
+        """Best unused sentence for a term: mid-length sentences read best"""
+        options = [i for i in indexes if i not in used]
+        if not options:
+            return None
+        return min(options, key=lambda i: (abs(len(sentences[i].split()) - 18), i))
+
+    def _distractors(self, answer_rank, ranked, sentence, answer_key, count=3):
+        """Keywords closest in rank to the answer with the same shape"""
+        answer_words = answer_key.split()
+        answer_capitalized = ranked[answer_rank][1][:1].isupper()
+        lowered = sentence.lower()
+        pool = []
+        for rank, (key, form, _) in enumerate(ranked):
+            if rank == answer_rank or len(key.split()) != len(answer_words):
+                continue
+            if set(key.split()) & set(answer_words) or key in lowered:
+                continue
+            if key[:5] == answer_key[:5]:
+                continue  # near-duplicates ("enzyme" / "enzymatic") give the answer away
+            mismatch = form[:1].isupper() != answer_capitalized
+            pool.append((mismatch, abs(rank - answer_rank), rank, form))
+        pool.sort()
+        return [form for _, _, _, form in pool[:count]]
+
+    @staticmethod
+    def _fillers(text, exclude, count):
+        """Generic wrong options that do not occur in the text"""
+        lowered = text.lower()
+        return [term for term in FILLER_TERMS if term not in lowered and term not in exclude][:count]
+
+    def _fallback_mcq(self, text, ranked, rng):
+        """One "which term appears in the document" question, for texts too
+        short to blank out terms"""
+        terms = [form for _, form, _ in ranked]
+        terms += [w for w in WORD.findall(text) if len(w) > 3 and w.lower() not in STOPWORDS]
+        terms += WORD.findall(text)
+        if not terms:
+            return None
+        answer = terms[0]
+        options = [answer] + self._fillers(text, answer.lower(), 3)
+        if len(options) < 2:
+            return None
+        order = list(range(len(options)))
+        rng.shuffle(order)
+        return {
+            "question": "Which of these terms appears in the document?",
+            "options": [options[i] for i in order],
+            "correct_answer": order.index(0)
+        }
+
+    def mcqs(self, text, count=10):
+        """Cloze MCQs covering the most important terms of the text
+
+        Never empty for a text with words in it: when no term can be
+        blanked out, a single recognition question is returned.
+        """
+        sentences, ranked = self.analyze(text)
+        rng = self._rng(text)
+        questions = []
+        used_sentences = set()
+
+        for rank, (key, form, indexes) in enumerate(ranked):
+            if len(questions) >= count:
+                break
+            index = self._pick_sentence(indexes, sentences, used_sentences)
+            if index is None:
+                continue
+            question, answer = self._blank(sentences[index], form)
+            # Leave enough of the sentence to answer from
+            if question is None or len(question.split()) < 3:
+                continue
+            distractors = self._distractors(rank, ranked, sentences[index], key)
+            if len(distractors) < 3:
+                # Short texts have few terms of their own
+                distractors += self._fillers(text, key, 3 - len(distractors))
+            if len(distractors) < 3:
+                continue
+            used_sentences.add(index)
+
+            options = [answer] + [self._match_case(d, answer) for d in distractors]
+            order = list(range(4))
+            rng.shuffle(order)
+            questions.append((index, {
+                "question": f"Fill in the blank: {question}",
+                "options": [options[i] for i in order],
+                "correct_answer": order.index(0)
+            }))
+
+        if not questions:
+            fallback = self._fallback_mcq(text, ranked, rng)
+            return [fallback] if fallback else []
+
+        # Follow the document's order rather than keyword rank
+        return [question for _, question in sorted(questions, key=lambda item: item[0])]
+
+    @staticmethod
+    def _match_case(term, answer):
+        """Give a distractor the answer's case when the answer is lowercase"""
+        return term.lower() if answer[:1].islower() and not term[:1].isupper() else term
+
+    @staticmethod
+    def _definition(sentence, key):
+        """The defining verb if the sentence reads "<term> is/are/means ...", else None"""
+        position = sentence.lower().find(key)
+        if position < 0:
+            return None
+        following = sentence[position + len(key):position + len(key) + 30].lstrip(' ,')
+        match = DEFINITION.match(following)
+        return match.group(0).lower() if match else None
+
+    @staticmethod
+    def _subject(sentence, key, form):
+        """The short noun phrase a defining sentence opens with ("DNA replication")"""
+        position = sentence.lower().find(key)
+        words = sentence[:position].split()
+        if words and words[0].lower() in ('a', 'an', 'the', 'this', 'these', 'those'):
+            words = words[1:]
+        if len(words) > 3 or (words and words[0].lower() in DETERMINERS):
+            return None
+        return " ".join(words + [form])
+
+    def flashcards(self, text, count=10):
+        """Term/definition flashcards for the most important terms
+
+        Terms that the text defines ("Osmosis is ...") come first; other
+        terms get the sentence that introduces them. Never empty for a
+        text with words in it.
+        """
+        sentences, ranked = self.analyze(text)
+        candidates = []
+
+        for rank, (key, form, indexes) in enumerate(ranked[:count * 4]):
+            # Prefer a sentence that defines the term, then one that starts with it
+            # The back must say more than the term itself
+            indexes = [i for i in indexes if len(sentences[i].split()) >= len(key.split()) + 2]
+            if not indexes:
+                continue
+            index = min(indexes, key=lambda i: (self._definition(sentences[i], key) is None,
+                                                not sentences[i].lower().startswith(key),
+                                                abs(len(sentences[i].split()) - 18), i))
+            verb = self._definition(sentences[index], key)
+            if verb:
+                form = self._subject(sentences[index], key, form) or form
+            candidates.append((verb is None, rank, index, form, verb))
+
+        cards = []
+        used_sentences = set()
+        for _, _, index, form, verb in sorted(candidates):
+            if len(cards) >= count:
+                break
+            if index in used_sentences:
+                continue
+            used_sentences.add(index)
+            if verb:
+                front = f"What {'are' if verb.startswith(('are', 'were')) else 'is'} {form}?"
+            else:
+                front = f"{form[:1].upper()}{form[1:]}"
+            cards.append({"front": front, "back": sentences[index]})
+
+        if not cards:
+            back = sentences[0] if sentences else " ".join(text.split())[:300]
+            if back:
+                front = ranked[0][1] if ranked else "Key point"
+                cards.append({"front": f"{front[:1].upper()}{front[1:]}", "back": back})
+        return cards
+
+
+# Initialize the shared offline generator
+offline_generator = OfflineGenerator()
+
+
+def generate_offline_mcqs(text, num_questions=10):
+    """Cloze MCQs generated locally, without the LLM"""
+    return offline_generator.mcqs(text, num_questions)
+
+
+def generate_offline_flashcards(text, num_flashcards=10):
+    """Term/definition flashcards generated locally, without the LLM"""
+    return offline_generator.flashcards(text, num_flashcards)
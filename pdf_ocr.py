@@ -0,0 +1,137 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+import fitz  # PyMuPDF - renders single pages without loading the whole document as images
+import pytesseract
+from PIL import Image
+from ocr_engine import ocr_engine
+from image_ocr import preprocess_image_for_ocr
+from metrics import metrics
+
+# Maximum number of pages rendered/OCR'd at the same time. Peak memory is
+# bounded by this window, not by the number of pages in the PDF.
+PAGE_WINDOW = int(os.getenv('OCR_PAGE_WINDOW', ocr_engine.max_workers * 2))
+
+# A page is treated as scanned when its text layer has fewer characters
+# than this and images cover at least MIN_SCAN_COVERAGE of its area
+MIN_PAGE_TEXT_CHARS = int(os.getenv('OCR_MIN_PAGE_CHARS', 50))
+MIN_SCAN_COVERAGE = float(os.getenv('OCR_MIN_SCAN_COVERAGE', 0.3))
+
+
+def render_page(file_path, page_index, dpi=300):
+    """Render one PDF page to a grayscale PIL image"""
+    doc = fitz.open(file_path)
+    try:
+        pix = doc[page_index].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+        return Image.frombytes('L', (pix.width, pix.height), pix.samples)
+    finally:
+        doc.close()
+
+
+def ocr_page(file_path, page_index, dpi=300, config='--psm 6', lang='eng'):
+    """Rasterize, preprocess and OCR a single page (runs in a pool worker)"""
+    image = render_page(file_path, page_index, dpi)
+    processed_img = preprocess_image_for_ocr(image, dpi)
+    return pytesseract.image_to_string(processed_img, lang=lang, config=config)
+
+
+def page_count(file_path):
+    """Get the number of pages in a PDF"""
+    with fitz.open(file_path) as doc:
+        return len(doc)
+
+
+def image_coverage(page):
+    """Fraction of a PyMuPDF page's area covered by placed images"""
+    page_rect = page.rect
+    page_area = page_rect.width * page_rect.height
+    if page_area <= 0:
+        return 0.0
+    covered = 0.0
+    for info in page.get_image_info():
+        bbox = fitz.Rect(info['bbox']) & page_rect
+        if not bbox.is_empty:
+            covered += bbox.width * bbox.height
+    return min(1.0, covered / page_area)
+
+
+def classify_pages(doc, page_texts):
+    """Label each page of an open PyMuPDF document 'text', 'scan' or 'blank'
+
+    `page_texts` is the extracted text layer of each page. Pages with a
+    usable text layer stay on the native text path; only 'scan' pages
+    need to be rasterized and OCR'd.
+    """
+    layout = []
+    for page_index, page_text in enumerate(page_texts):
+        if len(page_text.strip()) >= MIN_PAGE_TEXT_CHARS:
+            layout.append('text')
+        elif image_coverage(doc[page_index]) >= MIN_SCAN_COVERAGE:
+            layout.append('scan')
+        else:
+            layout.append('blank')
+    print(f"PDF page layout: {layout.count('text')} text, {layout.count('scan')} scanned, "
+          f"{layout.count('blank')} blank")
+    return layout
+
+
+def ocr_pdf_pages(file_path, pages=None, dpi=300, config='--psm 6', lang='eng', window=None, progress=None,
+                  status=None):
+    """Stream full-page OCR over a PDF through the shared process pool
+
+    Pages are rendered inside the workers one at a time, at most `window`
+    pages are in flight, and results are returned in page order as a list
+    of (page_index, text) tuples. `progress(pages_done, pages_total)` is
+    called as pages finish. A page whose OCR fails comes back as "" and,
+    if a `status` dict is given, is listed in status['failed_pages'].
+    """
+    if pages is None:
+        pages = range(page_count(file_path))
+    pages = list(pages)
+    window = max(1, window or PAGE_WINDOW)
+    if progress:
+        progress(0, len(pages))
+
+    results = {}
+    in_flight = {}
+    retried = set()
+    failed = []
+    next_index = 0
+
+    while next_index < len(pages) or in_flight:
+        # Keep the window full
+        while next_index < len(pages) and len(in_flight) < window:
+            page_index = pages[next_index]
+            future = ocr_engine.submit(ocr_page, file_path, page_index, dpi, config, lang)
+            in_flight[future] = page_index
+            next_index += 1
+
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            page_index = in_flight.pop(future)
+            try:
+                results[page_index] = future.result()
+                metrics.inc('ocr_passes_total', kind='page')
+                print(f"OCR Page {page_index + 1}: Extracted {len(results[page_index])} characters")
+            except BrokenProcessPool as e:
+                if page_index in retried:
+                    print(f"OCR Page {page_index + 1} failed: {e}")
+                    metrics.inc('ocr_failures_total', kind='page')
+                    results[page_index] = ""
+                    failed.append(page_index)
+                else:
+                    # The pool died under this page; retry it once on a new pool
+                    retried.add(page_index)
+                    in_flight[ocr_engine.submit(ocr_page, file_path, page_index, dpi, config, lang)] = page_index
+                    continue
+            except Exception as e:
+                print(f"OCR Page {page_index + 1} failed: {e}")
+                metrics.inc('ocr_failures_total', kind='page')
+                results[page_index] = ""
+                failed.append(page_index)
+            if progress:
+                progress(len(results), len(pages))
+
+    if status is not None and failed:
+        status['failed_pages'] = sorted(failed)
+    return [(page_index, results[page_index]) for page_index in pages]
@@ -0,0 +1,50 @@
+import os
+
+# Backend for the PDF text layer: 'pymupdf' (fast, default) or
+# 'pdfplumber' (slower, layout-accurate)
+PDF_TEXT_BACKEND = os.getenv('PDF_TEXT_BACKEND', 'pymupdf')
+
+
+class PyMuPDFTextBackend:
+    """PDF text layer via PyMuPDF get_text
+
+    Runs in C on the fitz handle that image extraction and page rendering
+    already use. Blocks are sorted top-to-bottom, left-to-right so the
+    reading order matches pdfplumber on ordinary pages.
+    """
+
+    name = 'pymupdf'
+
+    def page_texts(self, document):
+        return [page.get_text('text', sort=True).strip() for page in document.fitz]
+
+
+class PdfplumberTextBackend:
+    """PDF text layer via pdfplumber's layout analysis
+
+    Pure Python and much slower, but keeps columns and table cells in
+    visual order more reliably on complex layouts.
+    """
+
+    name = 'pdfplumber'
+
+    def page_texts(self, document):
+        return [page.extract_text() or "" for page in document.pdf.pages]
+
+
+PDF_TEXT_BACKENDS = {
+    'pymupdf': PyMuPDFTextBackend(),
+    'pdfplumber': PdfplumberTextBackend(),
+}
+
+# Descriptive aliases
+PDF_TEXT_BACKENDS['fast'] = PDF_TEXT_BACKENDS['pymupdf']
+PDF_TEXT_BACKENDS['layout'] = PDF_TEXT_BACKENDS['pdfplumber']
+
+
+def get_pdf_text_backend(name=None):
+    """Look up a PDF text backend by name (defaults to PDF_TEXT_BACKEND)"""
+    name = (name or PDF_TEXT_BACKEND).lower()
+    if name not in PDF_TEXT_BACKENDS:
+        raise ValueError(f"Unknown PDF text backend: {name}")
+    return PDF_TEXT_BACKENDS[name]
@@ -0,0 +1,203 @@
+import os
+import numpy as np
+from PIL import Image, ImageOps
+
+
+def _env_flag(name, default):
+    return os.getenv(name, default).lower() not in ['0', 'off', 'false']
+
+
+class ImagePreprocessor:
+    """NumPy image preprocessing for OCR
+
+    Replaces the PIL chain (grayscale -> contrast -> sharpness -> median)
+    that allocated a new full-size image per step. The image is loaded once
+    into an int16 buffer and contrast, sharpening and thresholding are
+    applied to it in place; the median filter works on uint8 planes.
+    Optional steps:
+
+    - downscale to `target_dpi` when the source is rendered/scanned higher
+    - adaptive (local mean) binarization
+    - deskew by projection profile
+    """
+
+    def __init__(self, contrast=None, sharpness=None, denoise=None, binarize=None,
+                 block_size=None, threshold_offset=None, deskew=None, max_skew=None, target_dpi=None):
+        self.contrast = contrast if contrast is not None else float(os.getenv('OCR_CONTRAST', 2.0))
+        self.sharpness = sharpness if sharpness is not None else float(os.getenv('OCR_SHARPNESS', 2.0))
+        self.denoise = denoise if denoise is not None else _env_flag('OCR_DENOISE', 'on')
+        self.binarize = binarize if binarize is not None else _env_flag('OCR_BINARIZE', 'off')
+        self.block_size = block_size or int(os.getenv('OCR_THRESHOLD_BLOCK', 31))
+        self.threshold_offset = threshold_offset if threshold_offset is not None else int(os.getenv('OCR_THRESHOLD_OFFSET', 10))
+        self.deskew = deskew if deskew is not None else _env_flag('OCR_DESKEW', 'off')
+        self.max_skew = max_skew or float(os.getenv('OCR_MAX_SKEW', 5))
+        self.target_dpi = target_dpi if target_dpi is not None else int(os.getenv('OCR_TARGET_DPI', 300))
+
+    def __call__(self, image, dpi=None):
+        return self.process(image, dpi)
+
+    def process(self, image, dpi=None):
+        """Preprocess a PIL image and return a grayscale ('L') PIL image
+
+        `dpi` is the resolution the image was rendered at; when omitted the
+        image's own DPI metadata is used, if any.
+        """
+        if image.mode != 'L':
+            image = image.convert('L')
+        image = self.downscale(image, dpi)
+        if self.deskew:
+            image = self.straighten(image)
+
+        buf = np.array(image, dtype=np.int16)
+        if self.contrast != 1.0:
+            self.enhance_contrast(buf)
+        if self.sharpness != 1.0:
+            self.sharpen(buf)
+        if self.binarize:
+            # The local threshold also takes care of speckle noise
+            self.threshold(buf)
+            return Image.fromarray(buf.astype(np.uint8), 'L')
+
+        pixels = buf.astype(np.uint8)
+        del buf
+        if self.denoise:
+            pixels = self.median_filter(pixels)
+        return Image.fromarray(pixels, 'L')
+
+    def downscale(self, image, dpi=None):
+        """Resize to target_dpi when the source resolution is higher"""
+        if not self.target_dpi:
+            return image
+        if dpi is None:
+            dpi = image.info.get('dpi', (None,))[0]
+        if not dpi or dpi <= self.target_dpi:
+            return image
+        scale = self.target_dpi / float(dpi)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        return image.resize(size, Image.LANCZOS)
+
+    def enhance_contrast(self, buf):
+        """Stretch values around the mean, like ImageEnhance.Contrast"""
+        mean = int(buf.mean() + 0.5)
+        buf -= mean
+        np.multiply(buf, self.contrast, out=buf, casting='unsafe')
+        buf += mean
+        np.clip(buf, 0, 255, out=buf)
+
+    def sharpen(self, buf):
+        """Blend away from a 3x3 smoothed copy, like ImageEnhance.Sharpness
+
+        Border pixels are left unchanged, as PIL does.
+        """
+        if buf.shape[0] < 3 or buf.shape[1] < 3:
+            return
+        # PIL's SMOOTH kernel: 1 1 1 / 1 5 1 / 1 1 1, divided by 13
+        smooth = buf * 5
+        inner = smooth[1:-1, 1:-1]
+        inner -= buf[1:-1, 1:-1]
+        for dy in (0, 1, 2):
+            for dx in (0, 1, 2):
+                inner += buf[dy:dy + buf.shape[0] - 2, dx:dx + buf.shape[1] - 2]
+        inner += 6
+        inner //= 13
+        # Borders: smooth == buf so they come out unchanged
+        smooth[0, :] = buf[0, :]
+        smooth[-1, :] = buf[-1, :]
+        smooth[:, 0] = buf[:, 0]
+        smooth[:, -1] = buf[:, -1]
+
+        buf -= smooth
+        np.multiply(buf, self.sharpness, out=buf, casting='unsafe')
+        buf += smooth
+        np.clip(buf, 0, 255, out=buf)
+
+    @staticmethod
+    def median_filter(pixels):
+        """3x3 median of a uint8 array, like ImageFilter.MedianFilter(3)
+
+        Each column of three is sorted first; the median of the nine is then
+        the median of (max of lows, median of mids, min of highs) across three
+        neighbouring columns. Edges are replicated.
+        """
+        padded = np.pad(pixels, 1, mode='edge')
+        up, centre_row, down = padded[:-2], padded[1:-1], padded[2:]
+        low = np.minimum(up, centre_row)
+        high = np.maximum(up, centre_row)
+        mid = np.minimum(high, down)
+        np.maximum(mid, low, out=mid)
+        np.minimum(low, down, out=low)
+        np.maximum(high, down, out=high)
+        del padded
+
+        def left(a):
+            return a[:, :-2]
+
+        def centre(a):
+            return a[:, 1:-1]
+
+        def right(a):
+            return a[:, 2:]
+
+        max_low = np.maximum(np.maximum(left(low), centre(low)), right(low))
+        min_high = np.minimum(np.minimum(left(high), centre(high)), right(high))
+        del low, high
+        a, b, c = left(mid), centre(mid), right(mid)
+        med_mid = np.maximum(np.minimum(a, b), np.minimum(np.maximum(a, b), c))
+        del mid
+
+        return np.maximum(np.minimum(max_low, med_mid), np.minimum(np.maximum(max_low, med_mid), min_high))
+
+    def threshold(self, buf):
+        """Binarize in place against the local mean of a block_size window
+
+        Pixels darker than (local mean - threshold_offset) become black.
+        Local sums come from a cumulative-sum box filter, so the cost does
+        not depend on the block size.
+        """
+        radius = max(1, self.block_size // 2)
+        padded = np.pad(buf, radius, mode='edge')
+        size = 2 * radius + 1
+
+        # Vertical then horizontal box sums; both fit in int32 for page-sized images
+        sums = np.cumsum(padded, axis=0, dtype=np.int32)
+        del padded
+        sums = np.concatenate([sums[size - 1:size], sums[size:] - sums[:-size]], axis=0)
+        np.cumsum(sums, axis=1, out=sums)
+        sums = np.concatenate([sums[:, size - 1:size], sums[:, size:] - sums[:, :-size]], axis=1)
+
+        # buf * area < sums - offset * area, without dividing
+        area = size * size
+        sums -= self.threshold_offset * area
+        dark = buf.astype(np.int32) * area < sums
+        buf.fill(255)
+        buf[dark] = 0
+
+    def skew_angle(self, image):
+        """Estimate the text skew in degrees with a projection profile
+
+        Text lines produce the sharpest row profile when horizontal, so the
+        angle with the largest squared row-to-row difference wins. Runs on a
+        small thumbnail.
+        """
+        thumb = ImageOps.invert(image)
+        thumb.thumbnail((1000, 1000))
+        best_angle, best_score = 0.0, -1.0
+        for angle in np.arange(-self.max_skew, self.max_skew + 0.01, 0.5):
+            rotated = thumb.rotate(float(angle), resample=Image.BILINEAR, fillcolor=0)
+            profile = np.asarray(rotated, dtype=np.float32).sum(axis=1)
+            score = float(np.square(np.diff(profile)).sum())
+            if score > best_score:
+                best_angle, best_score = float(angle), score
+        return best_angle
+
+    def straighten(self, image):
+        """Rotate the image so its text lines are horizontal"""
+        angle = self.skew_angle(image)
+        if abs(angle) < 0.25:
+            return image
+        print(f"Deskewing image by {angle:.1f} degrees")
+        return image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+
+
+# Initialize the shared preprocessor
+image_preprocessor = ImagePreprocessor()
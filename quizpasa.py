@@ -3,12 +3,15 @@ import json
 import requests
 from dotenv import load_dotenv
 from datetime import datetime
+from llm_client import llm_client, GROQ_API_URL
+from study_context import CONTEXT_HEADER, context_block, session_context
+from retrieval import relevant_passages
 
 class QuizPasa:
     def __init__(self):
         load_dotenv()
         self.api_key = os.getenv("QUIZ_API_KEY")
-        self.api_url = "https://api.groq.com/openai/v1/chat/completions"
+        self.api_url = GROQ_API_URL
         self.model = "llama3-8b-8192"
         
         # System prompt for QuizPasa personality
@@ -37,6 +40,33 @@ class QuizPasa:
         """Check if API key is properly configured"""
         return self.api_key and self.api_key != "your-quiz-api-key-here"
     
+    def build_messages(self, user_message, conversation_history=None, session_data=None):
+        """Build the upstream message list: system prompt with study context, history, new message"""
+        system_message = self.system_prompt
+        
+        # The material block is rendered once when the material is stored;
+        # references like "question 3" narrow it to the items asked about
+        context = session_context(session_data)
+        if context:
+            system_message += CONTEXT_HEADER + context_block(context, user_message)
+        
+        # Ground answers in the passages of the source document that match
+        # the message, rather than the whole text
+        if session_data and session_data.get('retrieval_id'):
+            system_message += relevant_passages(session_data['retrieval_id'], user_message)
+        
+        messages = [
+            {"role": "system", "content": system_message}
+        ]
+        
+        # Add conversation history if provided
+        if conversation_history:
+            messages.extend(conversation_history)
+        
+        # Add current user message
+        messages.append({"role": "user", "content": user_message})
+        return messages
+    
     def get_chat_response(self, user_message, conversation_history=None, session_data=None):
         """
         Get a response from the chatbot for the given user message
@@ -58,43 +88,8 @@ class QuizPasa:
             }
         
         try:
-            # Prepare headers
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
             # Prepare messages with session context if available
-            system_message = self.system_prompt
-            
-            if session_data and (session_data.get('mcqs') or session_data.get('flashcards')):
-                context = "\nCurrent study materials:\n"
-                
-                if session_data.get('mcqs'):
-                    context += "\nMCQs:\n"
-                    for i, mcq in enumerate(session_data['mcqs'], 1):
-                        context += f"Question {i}: {mcq['question']}\n"
-                        for j, option in enumerate(mcq['options']):
-                            context += f"  {chr(65+j)}) {option}\n"
-                        context += f"Correct Answer: {chr(65+mcq['correct_answer'])}\n"
-                
-                if session_data.get('flashcards'):
-                    context += "\nFlashcards:\n"
-                    for i, card in enumerate(session_data['flashcards'], 1):
-                        context += f"Card {i}:\n  Front: {card['front']}\n  Back: {card['back']}\n"
-                
-                system_message += "\n\nYou have access to the following study materials. Use this context to provide relevant answers:\n" + context
-            
-            messages = [
-                {"role": "system", "content": system_message}
-            ]
-            
-            # Add conversation history if provided
-            if conversation_history:
-                messages.extend(conversation_history)
-            
-            # Add current user message
-            messages.append({"role": "user", "content": user_message})
+            messages = self.build_messages(user_message, conversation_history, session_data)
             
             # Prepare payload
             payload = {
@@ -105,13 +100,8 @@ class QuizPasa:
                 "stream": False
             }
             
-            # Make API call
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
+            # Make API call over the shared pooled client
+            response = llm_client.post(payload, self.api_key)
             
             if response.status_code == 200:
                 result = response.json()
@@ -123,18 +113,7 @@ class QuizPasa:
                     "timestamp": datetime.now().isoformat()
                 }
             else:
-                error_message = f"API Error: {response.status_code}"
-                try:
-                    error_data = response.json()
-                    error_message += f" - {error_data.get('error', {}).get('message', 'Unknown error')}"
-                except:
-                    error_message += f" - {response.text}"
-                
-                return {
-                    "success": False,
-                    "message": "I'm having trouble connecting right now. Please try again.",
-                    "error": error_message
-                }
+                return self._api_error(response)
                 
         except requests.RequestException as e:
             return {
@@ -149,6 +128,107 @@ class QuizPasa:
                 "error": f"Unexpected error: {str(e)}"
             }
     
+    @staticmethod
+    def _api_error(response):
+        """Error response for a non-200 reply from the upstream"""
+        error_message = f"API Error: {response.status_code}"
+        try:
+            error_data = response.json()
+            error_message += f" - {error_data.get('error', {}).get('message', 'Unknown error')}"
+        except:
+            error_message += f" - {response.text}"
+        
+        return {
+            "success": False,
+            "message": "I'm having trouble connecting right now. Please try again.",
+            "error": error_message
+        }
+    
+    def stream_chat_response(self, user_message, conversation_history=None, session_data=None):
+        """
+        Stream a response token by token as it arrives from the upstream
+        
+        Yields event dicts:
+            {"type": "token", "content": str} for each piece of the reply
+            {"type": "done", "success": bool, "message": str, ...} once at the end
+        
+        If no response arrives at all (connection failure), the
+        non-streaming response is used instead and delivered as a single
+        token. An error status from the upstream is reported in the done
+        event rather than retried: llm_client has already retried it, and
+        sending the same request again would only add load (429/5xx) or
+        fail the same way (400).
+        """
+        if not self.is_api_configured():
+            yield from self._as_events(self.get_chat_response(user_message, conversation_history, session_data))
+            return
+        
+        payload = {
+            "model": self.model,
+            "messages": self.build_messages(user_message, conversation_history, session_data),
+            "temperature": 0.5,
+            "max_tokens": 400,
+            "stream": True
+        }
+        
+        try:
+            response = llm_client.post(payload, self.api_key, stream=True)
+        except requests.RequestException as e:
+            print(f"Chat streaming request failed ({e}), falling back")
+            yield from self._as_events(self.get_chat_response(user_message, conversation_history, session_data))
+            return
+        
+        if response.status_code != 200:
+            print(f"Chat streaming failed with status {response.status_code}")
+            try:
+                yield dict(self._api_error(response), type="done")
+            finally:
+                response.close()
+            return
+        
+        parts = []
+        try:
+            for line in response.iter_lines(chunk_size=None):
+                # OpenAI-compatible SSE: "data: {json}" lines, ending with "data: [DONE]"
+                line = line.decode('utf-8').strip()
+                if not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                delta = json.loads(data)['choices'][0].get('delta', {}).get('content')
+                if delta:
+                    parts.append(delta)
+                    yield {"type": "token", "content": delta}
+        except (requests.RequestException, ValueError, KeyError, IndexError) as e:
+            if not parts:
+                print(f"Chat stream failed before the first token: {e}")
+                yield {
+                    "type": "done",
+                    "success": False,
+                    "message": "Connection issues. Please try again later.",
+                    "error": f"Stream error: {str(e)}"
+                }
+                return
+            # Keep what was already delivered
+            print(f"Chat stream interrupted: {e}")
+        finally:
+            response.close()
+        
+        yield {
+            "type": "done",
+            "success": True,
+            "message": "".join(parts).strip(),
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    @staticmethod
+    def _as_events(response):
+        """Turn a non-streaming response dict into stream events"""
+        if response.get("success") and response.get("message"):
+            yield {"type": "token", "content": response["message"]}
+        yield dict(response, type="done")
+    
     def get_welcome_message(self):
         """Get a welcome message for new chat sessions"""
         return {
@@ -199,6 +279,23 @@ def handle_chat_message(user_message, conversation_history=None, session_data=No
     
     return quiz_pasa.get_chat_response(user_message, conversation_history, session_data)
 
+def stream_chat_message(user_message, conversation_history=None, session_data=None):
+    """
+    Streaming variant of handle_chat_message
+    
+    Yields the events of QuizPasa.stream_chat_response.
+    """
+    if not session_data or (not session_data.get('mcqs') and not session_data.get('flashcards')):
+        if any(keyword in user_message.lower() for keyword in ['explain', 'question', 'answer', 'mcq', 'flashcard']):
+            yield from quiz_pasa._as_events({
+                "success": True,
+                "message": "No study materials found in your current session. Please upload a document to generate MCQs and flashcards first.",
+                "timestamp": datetime.now().isoformat()
+            })
+            return
+    
+    yield from quiz_pasa.stream_chat_response(user_message, conversation_history, session_data)
+
 def get_welcome_message():
     """Get welcome message for new sessions"""
     return quiz_pasa.get_welcome_message()
\ No newline at end of file
@@ -0,0 +1,316 @@
+import os
+import re
+import time
+import hashlib
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+import numpy as np
+from chunking import chunk_text
+from metrics import metrics
+
+# Bump when tokenization or the stored layout changes
+INDEX_VERSION = 1
+
+# Size of the passages the document is split into for retrieval
+RETRIEVAL_CHUNK_TOKENS = int(os.getenv('RETRIEVAL_CHUNK_TOKENS', 200))
+
+# Passages added to each chat prompt
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', 4))
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from further had
+has have having he her here hers herself him himself his how i if in into is it its itself just
+me more most my myself no nor not now of off on once only or other our ours ourselves out over
+own same she should so some such than that the their theirs them themselves then there these they
+this those through to too under until up very was we were what when where which while who whom
+why will with would you your yours yourself yourselves explain tell please question questions
+""".split())
+
+TOKEN = re.compile(r"[^\W_]+")
+
+
+def tokenize(text):
+    """Lowercased word tokens without stopwords, with plural 's' stripped"""
+    tokens = []
+    for token in TOKEN.findall(text.lower()):
+        if len(token) < 2 or token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def text_digest(text):
+    """Key of the index built from a text"""
+    return hashlib.sha256(f"{INDEX_VERSION}:{RETRIEVAL_CHUNK_TOKENS}:{text}".encode('utf-8')).hexdigest()
+
+
+class RetrievalIndex:
+    """BM25 index over a document's passages
+
+    Postings are stored term-major in flat NumPy arrays: the documents
+    and term frequencies of term t are docs[offsets[t]:offsets[t + 1]]
+    and freqs[...]. A query touches only the postings of its own terms.
+    """
+
+    k1 = 1.5
+    b = 0.75
+
+    def __init__(self, chunks, terms, offsets, docs, freqs, lengths):
+        self.chunks = chunks
+        self.terms = terms
+        self.vocabulary = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.docs = docs
+        self.freqs = freqs
+        self.lengths = lengths
+        self.avg_length = float(lengths.mean()) if len(lengths) else 0.0
+        doc_freq = np.diff(offsets).astype(np.float64)
+        self.idf = np.log1p((len(chunks) - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    @classmethod
+    def build(cls, text, chunk_tokens=None):
+        """Chunk a document and index its passages"""
+        chunks = chunk_text(text, chunk_tokens or RETRIEVAL_CHUNK_TOKENS)
+        vocabulary = {}
+        pair_docs, pair_terms, pair_freqs = [], [], []
+        lengths = np.zeros(len(chunks), dtype=np.int32)
+        for doc, chunk in enumerate(chunks):
+            tokens = tokenize(chunk)
+            lengths[doc] = len(tokens)
+            for token, count in Counter(tokens).items():
+                pair_docs.append(doc)
+                pair_terms.append(vocabulary.setdefault(token, len(vocabulary)))
+                pair_freqs.append(count)
+
+        pair_terms = np.array(pair_terms, dtype=np.int32)
+        order = np.argsort(pair_terms, kind='stable')  # term-major, docs ascending
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(pair_terms, minlength=len(vocabulary)), out=offsets[1:])
+        return cls(
+            chunks,
+            list(vocabulary),
+            offsets,
+            np.array(pair_docs, dtype=np.int32)[order],
+            np.array(pair_freqs, dtype=np.float32)[order],
+            lengths
+        )
+
+    def scores(self, query):
+        """BM25 score of every passage for a query"""
+        scores = np.zeros(len(self.chunks), dtype=np.float64)
+        if not self.chunks:
+            return scores
+        norm = self.k1 * (1 - self.b + self.b * self.lengths / max(self.avg_length, 1.0))
+        for token in set(tokenize(query)):
+            t = self.vocabulary.get(token)
+            if t is None:
+                continue
+            start, end = self.offsets[t], self.offsets[t + 1]
+            docs = self.docs[start:end]
+            freqs = self.freqs[start:end]
+            scores[docs] += self.idf[t] * freqs * (self.k1 + 1) / (freqs + norm[docs])
+        return scores
+
+    def search(self, query, k=None):
+        """Top-k passages as (chunk index, score, text), best first"""
+        k = k or RETRIEVAL_TOP_K
+        scores = self.scores(query)
+        hits = np.flatnonzero(scores > 0)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind='stable')]
+        return [(int(i), float(scores[i]), self.chunks[i]) for i in hits]
+
+    def arrays(self):
+        """Arrays for np.savez"""
+        return {
+            'chunks': np.array(self.chunks, dtype=str),
+            'terms': np.array(self.terms, dtype=str),
+            'offsets': self.offsets,
+            'docs': self.docs,
+            'freqs': self.freqs,
+            'lengths': self.lengths
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(
+            arrays['chunks'].tolist(),
+            arrays['terms'].tolist(),
+            arrays['offsets'],
+            arrays['docs'],
+            arrays['freqs'],
+            arrays['lengths']
+        )
+
+
+class LatencyStats:
+    """Count and timings (milliseconds) of one kind of operation"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        ms = seconds * 1000
+        with self._lock:
+            self.count += 1
+            self.total_ms += ms
+            self.max_ms = max(self.max_ms, ms)
+            self.last_ms = ms
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'count': self.count,
+                'mean_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+                'max_ms': round(self.max_ms, 3),
+                'last_ms': round(self.last_ms, 3)
+            }
+
+
+class RetrievalStore:
+    """Retrieval indexes of uploaded documents, keyed by text digest
+
+    Indexes are built once at upload time and saved as .npz files so every
+    web worker can load them; loaded indexes are kept in an in-process
+    LRU. Least recently used files are evicted past the size limit.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, max_loaded=None):
+        self.cache_dir = cache_dir or os.getenv('RETRIEVAL_CACHE_DIR', os.path.join('cache', 'retrieval'))
+        self.max_bytes = max_bytes or int(float(os.getenv('RETRIEVAL_CACHE_MAX_MB', 128)) * 1024 * 1024)
+        self.max_loaded = max_loaded or int(os.getenv('RETRIEVAL_LOADED_INDEXES', 32))
+        self.build_stats = LatencyStats()
+        self.query_stats = LatencyStats()
+        self._loaded = OrderedDict()  # index_id -> RetrievalIndex
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, index_id):
+        return os.path.join(self.cache_dir, f"{index_id}.npz")
+
+    def _remember(self, index_id, index):
+        with self._lock:
+            self._loaded[index_id] = index
+            self._loaded.move_to_end(index_id)
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+
+    def build(self, text):
+        """Index a document's text and return the index ID
+
+        Texts that were indexed before (e.g. repeat uploads) are not
+        indexed again.
+        """
+        index_id = text_digest(text)
+        path = self._path(index_id)
+        if os.path.exists(path):
+            os.utime(path, None)
+            return index_id
+
+        start = time.perf_counter()
+        index = RetrievalIndex.build(text)
+        elapsed = time.perf_counter() - start
+        self.build_stats.record(elapsed)
+        metrics.observe('stage_seconds', elapsed, stage='retrieval_build')
+        print(f"Built retrieval index: {len(index.chunks)} passages, {len(index.terms)} terms in {elapsed * 1000:.1f} ms")
+
+        try:
+            # Write atomically so other workers never load a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **index.arrays())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing retrieval index {path}: {e}")
+        self._remember(index_id, index)
+        self.evict()
+        return index_id
+
+    def get(self, index_id):
+        """Load an index by ID, or None if it is missing"""
+        if not index_id:
+            return None
+        with self._lock:
+            index = self._loaded.get(index_id)
+            if index is not None:
+                self._loaded.move_to_end(index_id)
+                return index
+        path = self._path(index_id)
+        try:
+            with np.load(path, allow_pickle=False) as arrays:
+                index = RetrievalIndex.from_arrays(arrays)
+            os.utime(path, None)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error loading retrieval index {path}: {e}")
+            return None
+        self._remember(index_id, index)
+        return index
+
+    def search(self, index_id, query, k=None):
+        """Top-k passages of an indexed document for a query"""
+        index = self.get(index_id)
+        if index is None:
+            return []
+        start = time.perf_counter()
+        hits = index.search(query, k)
+        elapsed = time.perf_counter() - start
+        self.query_stats.record(elapsed)
+        metrics.observe('stage_seconds', elapsed, stage='retrieval_query')
+        return hits
+
+    def stats(self):
+        """Build and query latency of this process"""
+        return {
+            'builds': self.build_stats.as_dict(),
+            'queries': self.query_stats.as_dict(),
+            'loaded_indexes': len(self._loaded)
+        }
+
+    def evict(self):
+        """Remove least recently used index files past the size limit"""
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith('.npz'):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+            entries.sort()
+            while total > self.max_bytes and entries:
+                _, size, path = entries.pop(0)
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    continue
+
+
+# Initialize the shared retrieval store
+retrieval_store = RetrievalStore()
+
+
+def relevant_passages(index_id, query, k=None):
+    """Prompt text with the passages of a document most relevant to a query"""
+    hits = retrieval_store.search(index_id, query, k)
+    if not hits:
+        return ""
+    passages = "\n\n".join(f"[Excerpt {n}]\n{text}" for n, (_, _, text) in enumerate(hits, 1))
+    return "\n\nRelevant excerpts from the uploaded document:\n" + passages + "\n"
@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class SessionStore:
+    """Server-side storage for per-browser session data
+
+    The cookie only carries an opaque session ID; the study material
+    (MCQs, flashcards, filename) lives in SQLite so every web worker can
+    read it. Decoded entries are kept in an in-process LRU, checked
+    against the row's updated_at so writes from other workers are seen.
+    Entries idle for longer than SESSION_TTL seconds expire.
+    """
+
+    # accessed_at is refreshed at most this often per entry (seconds)
+    TOUCH_INTERVAL = 60
+
+    def __init__(self, db_path=None, ttl=None, max_cached=None):
+        self.db_path = db_path or os.getenv('SESSION_STORE_PATH', os.path.join('cache', 'sessions.sqlite3'))
+        self.ttl = ttl or int(os.getenv('SESSION_TTL', 24 * 3600))
+        self.max_cached = max_cached or int(os.getenv('SESSION_CACHE_ENTRIES', 256))
+        self._cache = OrderedDict()  # session_id -> (updated_at, data)
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "id TEXT PRIMARY KEY, data TEXT NOT NULL, "
+                "updated_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS sessions_accessed_at ON sessions (accessed_at)")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with db:  # commits on success, rolls back on error
+                yield db
+        finally:
+            db.close()
+
+    def _remember(self, session_id, updated_at, data):
+        with self._lock:
+            self._cache[session_id] = (updated_at, data)
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+
+    def _forget(self, session_id):
+        with self._lock:
+            self._cache.pop(session_id, None)
+
+    def create(self, data):
+        """Store data under a new session ID and return the ID"""
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO sessions (id, data, updated_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (session_id, json.dumps(data), now, now)
+            )
+        self._remember(session_id, now, data)
+        self.purge_expired()
+        return session_id
+
+    def get(self, session_id):
+        """Get the data stored for a session ID, or None if missing or expired"""
+        if not session_id:
+            return None
+        now = time.time()
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT updated_at, accessed_at FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                self._forget(session_id)
+                return None
+            updated_at, accessed_at = row
+            if now - accessed_at > self.ttl:
+                db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+                self._forget(session_id)
+                return None
+            if now - accessed_at > self.TOUCH_INTERVAL:
+                db.execute("UPDATE sessions SET accessed_at = ? WHERE id = ?", (now, session_id))
+
+            with self._lock:
+                cached = self._cache.get(session_id)
+                if cached is not None and cached[0] == updated_at:
+                    self._cache.move_to_end(session_id)
+                    return cached[1]
+
+            # Not cached here, or changed by another worker
+            data = json.loads(db.execute("SELECT data FROM sessions WHERE id = ?", (session_id,)).fetchone()[0])
+        self._remember(session_id, updated_at, data)
+        return data
+
+    def update(self, session_id, **fields):
+        """Merge fields into a session's data; returns False if it no longer exists"""
+        data = self.get(session_id)
+        if data is None:
+            return False
+        data = dict(data, **fields)
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "UPDATE sessions SET data = ?, updated_at = ?, accessed_at = ? WHERE id = ?",
+                (json.dumps(data), now, now, session_id)
+            )
+        self._remember(session_id, now, data)
+        return True
+
+    def delete(self, session_id):
+        """Remove a session's data"""
+        if not session_id:
+            return
+        self._forget(session_id)
+        with self._connect() as db:
+            db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def purge_expired(self):
+        """Delete sessions idle for longer than ttl seconds"""
+        try:
+            with self._connect() as db:
+                db.execute("DELETE FROM sessions WHERE accessed_at < ?", (time.time() - self.ttl,))
+        except sqlite3.Error as e:
+            print(f"Error purging sessions: {e}")
+
+
+# Initialize the shared session store
+session_store = SessionStore()
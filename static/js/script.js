@@ -127,6 +127,11 @@
         }
 
         function addStudyPasaMessage(text, sender) {
+            createStudyPasaBubble(text, sender);
+            rememberStudyPasaMessage(text, sender);
+        }
+
+        function createStudyPasaBubble(text, sender) {
             const messagesContainer = document.getElementById('studypasa-conversation-area');
             const messageDiv = document.createElement('div');
             messageDiv.className = `studypasa-message-bubble studypasa-${sender}-message`;
@@ -134,7 +139,10 @@
             
             messagesContainer.appendChild(messageDiv);
             messagesContainer.scrollTop = messagesContainer.scrollHeight;
-            
+            return messageDiv;
+        }
+
+        function rememberStudyPasaMessage(text, sender) {
             // Store in conversation history
             studyPasaConversationHistory.push({
                 role: sender === 'user' ? 'user' : 'assistant',
@@ -192,26 +200,16 @@
             const typingIndicator = showStudyPasaTyping();
             
             try {
-                const response = await fetch('/quizpasa_chat', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({
-                        message: message,
-                        conversation_history: studyPasaConversationHistory
-                    })
+                // History is kept server-side; send only the new message
+                const body = JSON.stringify({
+                    message: message
                 });
                 
-                const data = await response.json();
-                
-                // Hide typing indicator
-                hideStudyPasaTyping();
-                
-                if (data.success) {
-                    addStudyPasaMessage(data.message, 'bot');
+                // Stream the reply when the browser can read response streams
+                if (window.ReadableStream && window.TextDecoder) {
+                    await streamStudyPasaReply(body);
                 } else {
-                    addStudyPasaMessage(data.message || 'Sorry, I encountered an error. Please try again!', 'bot');
+                    await fetchStudyPasaReply(body);
                 }
                 
             } catch (error) {
@@ -225,6 +223,105 @@
             }
         }
 
+        // Non-streaming request: waits for the whole reply
+        async function fetchStudyPasaReply(body) {
+            const response = await fetch('/quizpasa_chat', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: body
+            });
+            
+            const data = await response.json();
+            
+            // Hide typing indicator
+            hideStudyPasaTyping();
+            
+            if (data.success) {
+                addStudyPasaMessage(data.message, 'bot');
+            } else {
+                addStudyPasaMessage(data.message || 'Sorry, I encountered an error. Please try again!', 'bot');
+            }
+        }
+
+        // Streaming request: shows tokens as they arrive (server-sent events)
+        async function streamStudyPasaReply(body) {
+            const response = await fetch('/quizpasa_chat_stream', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream'
+                },
+                body: body
+            });
+            
+            if (!response.ok || !response.body) {
+                return fetchStudyPasaReply(body);
+            }
+            
+            const messagesContainer = document.getElementById('studypasa-conversation-area');
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let bubble = null;
+            let text = '';
+            
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                
+                // Events are separated by a blank line
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const event = parseStudyPasaEvent(buffer.slice(0, boundary));
+                    buffer = buffer.slice(boundary + 2);
+                    
+                    if (event.type === 'token') {
+                        if (!bubble) {
+                            hideStudyPasaTyping();
+                            bubble = createStudyPasaBubble('', 'bot');
+                        }
+                        text += event.data.content;
+                        bubble.textContent = text;
+                        messagesContainer.scrollTop = messagesContainer.scrollHeight;
+                    } else if (event.type === 'done') {
+                        hideStudyPasaTyping();
+                        const finalText = event.data.success
+                            ? (event.data.message || text)
+                            : (event.data.message || 'Sorry, I encountered an error. Please try again!');
+                        if (!bubble) {
+                            bubble = createStudyPasaBubble('', 'bot');
+                        }
+                        bubble.textContent = finalText;
+                        rememberStudyPasaMessage(finalText, 'bot');
+                        return;
+                    }
+                }
+            }
+            
+            // Stream ended without a final event
+            hideStudyPasaTyping();
+            if (text) {
+                rememberStudyPasaMessage(text, 'bot');
+            } else {
+                addStudyPasaMessage('Sorry, I\'m having trouble connecting right now. Please try again!', 'bot');
+            }
+        }
+
+        function parseStudyPasaEvent(rawEvent) {
+            const event = { type: 'message', data: {} };
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    event.type = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    event.data = JSON.parse(line.slice(5).trim());
+                }
+            });
+            return event;
+        }
+
         function toggleFlashcard(flashcardElement, indexStr) {
             const index = parseInt(indexStr);
             flashcardElement.classList.toggle('studypasa-flipped');
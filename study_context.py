@@ -0,0 +1,124 @@
+import os
+import re
+import json
+import hashlib
+
+# Bump when the rendered layout changes so stored blocks are rebuilt
+CONTEXT_VERSION = 1
+
+# Send only the questions/cards a message refers to ("explain question 3")
+CONTEXT_FILTER = os.getenv('STUDY_CONTEXT_FILTER', 'on').lower() not in ['0', 'off', 'false']
+
+# "question 3", "Q3", "mcq 2", "questions 2 and 5", "cards 1-3", "flashcard #4"
+ITEM_REFERENCE = re.compile(
+    r'\b(questions?|q|mcqs?|flashcards?|cards?)\s*#?\s*'
+    r'(\d+(?:\s*(?:-|to|,|and|&)\s*\d+)*)',
+    re.IGNORECASE
+)
+
+CONTEXT_HEADER = "\n\nYou have access to the following study materials. Use this context to provide relevant answers:\n"
+
+
+def render_mcq(number, mcq):
+    """One MCQ as it appears in the prompt"""
+    lines = [f"Question {number}: {mcq['question']}"]
+    for j, option in enumerate(mcq['options']):
+        lines.append(f"  {chr(65 + j)}) {option}")
+    lines.append(f"Correct Answer: {chr(65 + mcq['correct_answer'])}")
+    return "\n".join(lines) + "\n"
+
+
+def render_flashcard(number, card):
+    """One flashcard as it appears in the prompt"""
+    return f"Card {number}:\n  Front: {card['front']}\n  Back: {card['back']}\n"
+
+
+def material_digest(mcqs, flashcards):
+    """Digest of the material a context block was rendered from"""
+    payload = json.dumps([CONTEXT_VERSION, mcqs, flashcards], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def build_context(mcqs, flashcards):
+    """Render the study-material context once, for storing with the material
+
+    Returns a JSON-serialisable dict with the digest of the material, each
+    item's rendered text (for filtered prompts) and the full block.
+    """
+    mcqs = mcqs or []
+    flashcards = flashcards or []
+    rendered_mcqs = [render_mcq(i, mcq) for i, mcq in enumerate(mcqs, 1)]
+    rendered_cards = [render_flashcard(i, card) for i, card in enumerate(flashcards, 1)]
+    return {
+        'version': CONTEXT_VERSION,
+        'digest': material_digest(mcqs, flashcards),
+        'mcqs': rendered_mcqs,
+        'flashcards': rendered_cards,
+        'full': _assemble(rendered_mcqs, rendered_cards)
+    }
+
+
+def _assemble(rendered_mcqs, rendered_cards, note=""):
+    context = "\nCurrent study materials:\n" + note
+    if rendered_mcqs:
+        context += "\nMCQs:\n" + "".join(rendered_mcqs)
+    if rendered_cards:
+        context += "\nFlashcards:\n" + "".join(rendered_cards)
+    return context
+
+
+def _numbers(spec):
+    """Expand "2, 4-6 and 9" into {2, 4, 5, 6, 9}"""
+    numbers = set()
+    for part in re.split(r'\s*(?:,|and|&)\s*', spec):
+        bounds = re.split(r'\s*(?:-|to)\s*', part.strip())
+        if len(bounds) == 2 and bounds[0].isdigit() and bounds[1].isdigit():
+            low, high = sorted((int(bounds[0]), int(bounds[1])))
+            numbers.update(range(low, min(high, low + 50) + 1))
+        elif bounds[0].isdigit():
+            numbers.add(int(bounds[0]))
+    return numbers
+
+
+def referenced_items(message):
+    """MCQ and flashcard numbers a chat message refers to, as two sets"""
+    questions, cards = set(), set()
+    for kind, spec in ITEM_REFERENCE.findall(message or ""):
+        target = cards if kind.lower().endswith(('card', 'cards')) else questions
+        target.update(_numbers(spec))
+    return questions, cards
+
+
+def context_block(context, message=None, filtered=None):
+    """Context text for a chat turn
+
+    With filtering on and a message that names specific items, only those
+    items are included; otherwise the full precompiled block is returned.
+    """
+    filtered = CONTEXT_FILTER if filtered is None else filtered
+    if not filtered or not message:
+        return context['full']
+
+    questions, cards = referenced_items(message)
+    mcqs = [context['mcqs'][n - 1] for n in sorted(questions) if 0 < n <= len(context['mcqs'])]
+    flashcards = [context['flashcards'][n - 1] for n in sorted(cards) if 0 < n <= len(context['flashcards'])]
+    if not mcqs and not flashcards:
+        return context['full']
+
+    note = (f"(Only the items the student referred to are shown; the set has "
+            f"{len(context['mcqs'])} MCQs and {len(context['flashcards'])} flashcards.)\n")
+    return _assemble(mcqs, flashcards, note)
+
+
+def session_context(session_data):
+    """Precompiled context stored with session data
+
+    Material stored before contexts were precompiled (or with an older
+    layout) is rendered on the fly.
+    """
+    if not session_data or not (session_data.get('mcqs') or session_data.get('flashcards')):
+        return None
+    context = session_data.get('context')
+    if context and context.get('version') == CONTEXT_VERSION:
+        return context
+    return build_context(session_data.get('mcqs'), session_data.get('flashcards'))
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Tests for server-side chat history: the token window, summaries and the session store
+"""
+
+import conversation
+from conversation import append_turn, history_window, load_history, summarize
+from session_store import SessionStore
+
+
+def turn(question, answer="An answer."):
+    return [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+
+
+def test_window_keeps_newest_messages_within_budget():
+    messages = turn("Q1 " + "x" * 400) + turn("Q2 " + "y" * 400) + turn("Q3 short")
+
+    window = history_window(messages, budget=20)
+
+    assert window[-2:] == turn("Q3 short")
+    assert sum(conversation.estimate_tokens(m['content']) for m in window if m['role'] != 'system') <= 20
+
+
+def test_messages_outside_the_window_are_folded_into_the_summary():
+    messages = turn("What is osmosis?", "z" * 400) + turn("What is ATP?")
+
+    window = history_window(messages, "Earlier topic", budget=20)
+
+    assert window[0]['role'] == 'system'
+    assert "Earlier topic; What is osmosis?" in window[0]['content']
+    assert "What is ATP?" not in window[0]['content']
+    assert window[1:] == turn("What is ATP?")
+
+
+def test_no_summary_when_everything_fits():
+    messages = turn("Hi")
+
+    assert history_window(messages, budget=1000) == messages
+
+
+def test_summary_is_bounded(monkeypatch):
+    monkeypatch.setattr(conversation, 'CHAT_SUMMARY_CHARS', 50)
+
+    summary = summarize("", turn("first " * 30) + turn("latest question"))
+
+    assert len(summary) <= 50
+    assert summary.startswith("...")
+    assert summary.endswith("latest question")
+
+
+def test_append_turn_folds_old_turns_into_stored_summary(tmp_path, monkeypatch):
+    store = SessionStore(db_path=str(tmp_path / 'sessions.sqlite3'))
+    monkeypatch.setattr(conversation, 'session_store', store)
+    monkeypatch.setattr(conversation, 'CHAT_HISTORY_MAX_MESSAGES', 4)
+    session_id = store.create({'mcqs': []})
+
+    for n in range(1, 4):
+        append_turn(session_id, f"Question {n}", f"Answer {n}")
+
+    entry = store.get(session_id)
+    assert entry['history'] == turn("Question 2", "Answer 2") + turn("Question 3", "Answer 3")
+    assert entry['history_summary'] == "Question 1"
+    assert load_history(session_id)[0]['content'].endswith("Question 1")
+
+
+def test_session_store_sees_updates_and_deletes(tmp_path):
+    store = SessionStore(db_path=str(tmp_path / 'sessions.sqlite3'))
+    session_id = store.create({'filename': 'notes.pdf'})
+
+    assert store.update(session_id, history=turn("Hi"))
+    # A second store on the same file (another worker) reads the new data
+    other = SessionStore(db_path=str(tmp_path / 'sessions.sqlite3'))
+    assert other.get(session_id) == {'filename': 'notes.pdf', 'history': turn("Hi")}
+
+    store.delete(session_id)
+    assert store.get(session_id) is None
+    assert not store.update(session_id, history=[])
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Tests for chunked generation: chunk planning within the token budget and merging
+"""
+
+from chunking import chunk_text, estimate_tokens
+from generation import PROMPT_OVERHEAD_TOKENS, _max_output_tokens, plan_chunks, merge_results
+
+
+def paged_text(pages, chars_per_page=3000):
+    return "".join(f"[Page {i + 1}]\n" + (f"Topic {i} sentence. " * chars_per_page)[:chars_per_page] + "\n"
+                   for i in range(pages))
+
+
+def plan_cost(plan):
+    """Estimated tokens of a plan, as plan_chunks budgets them"""
+    return sum(estimate_tokens(chunk) + PROMPT_OVERHEAD_TOKENS + _max_output_tokens(n) for chunk, n in plan)
+
+
+def test_plan_keeps_within_token_budget():
+    text = paged_text(60)
+    budget = 12000
+
+    plan = plan_chunks(text, 10, budget=budget, chunk_tokens=1000)
+
+    assert 1 < len(plan) < len(chunk_text(text, 1000))
+    assert plan_cost(plan) <= budget
+    # Every chunk asks for its share of the count plus a spare
+    assert sum(n for _, n in plan) >= 10
+
+
+def test_plan_spreads_chunks_in_document_order():
+    text = paged_text(60)
+
+    plan = plan_chunks(text, 10, budget=12000, chunk_tokens=1000)
+
+    positions = [text.index(chunk[:40]) for chunk, _ in plan]
+    assert positions == sorted(positions)
+    assert plan[0][0].startswith("[Page 1]")
+    assert "[Page 60]" in plan[-1][0]
+
+
+def test_single_request_input_is_truncated_to_budget():
+    text = paged_text(60)
+    budget = 5000
+
+    plan = plan_chunks(text, 10, budget=budget, chunk_tokens=100000)
+
+    assert len(plan) == 1
+    chunk, n = plan[0]
+    assert n == 10
+    assert plan_cost(plan) <= budget + 1
+    assert text.startswith(chunk)
+
+
+def test_short_text_is_one_chunk():
+    assert plan_chunks("Short text.", 10) == [("Short text.", 10)]
+
+
+def test_merge_takes_items_round_robin():
+    results = [
+        [{'question': 'A1'}, {'question': 'A2'}, {'question': 'A3'}],
+        [{'question': 'B1'}, {'question': 'B2'}],
+        [{'question': 'C1'}]
+    ]
+
+    merged = merge_results(results, 5, 'question')
+
+    assert [item['question'] for item in merged] == ['A1', 'B1', 'C1', 'A2', 'B2']
+
+
+def test_merge_drops_duplicates_and_malformed_items():
+    results = [
+        [{'question': 'What is osmosis?'}, {'question': 'Where does photosynthesis take place in plant cells?'}],
+        [{'question': 'what is OSMOSIS'}, "not a dict", {'question': ''}],
+        [{'question': 'Where does photosynthesis take place in the plant cells?'}, {'question': 'What is ATP?'}]
+    ]
+
+    merged = merge_results(results, 10, 'question')
+
+    # Round robin reaches the third chunk's phrasing first; the first
+    # chunk's near-duplicate in the next round is dropped
+    assert [item['question'] for item in merged] == [
+        'What is osmosis?',
+        'Where does photosynthesis take place in the plant cells?',
+        'What is ATP?'
+    ]
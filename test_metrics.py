@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Smoke tests for the metrics layer on the LLM request path
+"""
+
+import json
+from llm_client import LLMClient
+from metrics import metrics, Metrics
+
+
+class FakeResponse:
+    status_code = 200
+
+    def json(self):
+        return {'choices': [{'message': {'content': 'ok'}}]}
+
+
+def test_llm_post_with_metrics_on(monkeypatch, capsys):
+    """A successful upstream call must come back with spans recorded and logged"""
+    monkeypatch.setattr(metrics, 'enabled', True)
+    monkeypatch.setattr(metrics, 'log_spans', True)
+    client = LLMClient(api_url='http://upstream.invalid/chat')
+    monkeypatch.setattr(client.session, 'post', lambda *args, **kwargs: FakeResponse())
+
+    response = client.post({'messages': []}, 'key')
+
+    assert response.status_code == 200
+    assert 'stage_seconds_count{stage="llm_request"}' in metrics.render()
+    spans = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{')]
+    llm_span = [span for span in spans if span.get('span') == 'llm_request'][-1]
+    assert llm_span['status'] == 'ok'
+    assert llm_span['http_status'] == 200
+
+
+def test_span_fields_cannot_shadow_span_keys(capsys):
+    """Fields named like the span's own keys are overwritten, not passed twice"""
+    local = Metrics(enabled=True, log_spans=True)
+    with local.span('stage', status='custom', ms=-1) as span:
+        span.set(span='other')
+    record = json.loads(capsys.readouterr().out.strip())
+    assert record['span'] == 'stage'
+    assert record['status'] == 'ok'
+    assert record['ms'] >= 0
+
+
+def test_disabled_metrics_are_no_ops():
+    local = Metrics(enabled=False)
+    with local.span('stage') as span:
+        span.set(pages=3)
+    local.inc('counter')
+    local.observe('histogram', 1.0)
+    assert local.render() == "\n"
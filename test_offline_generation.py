@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Tests for the offline MCQ/flashcard generator on real extractor output
+"""
+
+import fitz
+from documents import ParsedDocument
+from extraction import ExtractionPipeline
+from offline_generation import OfflineGenerator, FUNCTION_WORDS
+
+LECTURE = (
+    "The chloroplast contains chlorophyll, which absorbs light. Photosynthesis converts carbon dioxide "
+    "and water into glucose and oxygen inside the chloroplast. Osmosis is the movement of water across "
+    "a semi-permeable membrane. Mitochondria produce adenosine triphosphate for the cell during cellular "
+    "respiration. Enzymes are proteins that speed up chemical reactions in the cell without being used up. "
+)
+
+
+def extracted_pdf_text(text):
+    """Text of a one-page PDF as the upload pipeline extracts it
+
+    The text box is narrow, so PyMuPDF returns the sentences hard-wrapped
+    over many lines.
+    """
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_textbox(fitz.Rect(72, 72, 200, 800), text, fontsize=11)
+    with ParsedDocument(data=doc.tobytes(), file_ext='pdf', name='lecture.pdf') as document:
+        return ExtractionPipeline(document).extract()
+
+
+def test_wrapped_pdf_lines_are_joined_into_sentences():
+    text = extracted_pdf_text(LECTURE * 2)
+    assert "The chloroplast contains\nchlorophyll" in text  # the extractor really wraps
+
+    sentences = OfflineGenerator().sentences(text)
+
+    assert "The chloroplast contains chlorophyll, which absorbs light." in sentences
+    assert "The chloroplast" not in sentences
+
+
+def test_mcqs_from_wrapped_pdf_blank_whole_noun_phrases():
+    mcqs = OfflineGenerator().mcqs(extracted_pdf_text(LECTURE * 2))
+
+    assert mcqs
+    for mcq in mcqs:
+        stem = mcq['question'].replace("Fill in the blank: ", "")
+        # A question never starts mid-sentence ("contains _____, which ...")
+        assert stem[0].isupper() or stem.startswith("_____")
+        for option in mcq['options']:
+            assert not set(option.lower().split()) & FUNCTION_WORDS, option
+
+
+def test_bullets_and_slide_lines_stay_separate():
+    slides = (
+        "=== SLIDE 1 ===\nPhotosynthesis\n"
+        "• Takes place in chloroplasts\n"
+        "• Uses light energy to make glucose\n"
+        "=== SLIDE 2 ===\nLight reactions\nOccur in thylakoid membranes\nProduce ATP and NADPH\n"
+    )
+
+    paragraphs = OfflineGenerator().paragraphs(slides)
+
+    assert paragraphs == [
+        "Photosynthesis",
+        "Takes place in chloroplasts",
+        "Uses light energy to make glucose",
+        "Light reactions",
+        "Occur in thylakoid membranes",
+        "Produce ATP and NADPH"
+    ]
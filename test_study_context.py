@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Tests for the precompiled study context and item references in chat messages
+"""
+
+from study_context import build_context, context_block, referenced_items
+
+MCQS = [
+    {'question': f'Question text {i}?', 'options': ['a', 'b', 'c', 'd'], 'correct_answer': 0}
+    for i in range(1, 6)
+]
+FLASHCARDS = [{'front': f'Front {i}', 'back': f'Back {i}'} for i in range(1, 4)]
+
+
+def test_question_ranges_and_lists():
+    assert referenced_items("Explain questions 2-4") == ({2, 3, 4}, set())
+    assert referenced_items("questions 2 to 4") == ({2, 3, 4}, set())
+    assert referenced_items("What about questions 2, 5 and 7?") == ({2, 5, 7}, set())
+    assert referenced_items("Why is Q3 wrong?") == ({3}, set())
+    assert referenced_items("mcq #4 please") == ({4}, set())
+
+
+def test_card_references_are_kept_apart_from_questions():
+    assert referenced_items("Compare question 1 with flashcard 2") == ({1}, {2})
+    assert referenced_items("cards 1-3") == (set(), {1, 2, 3})
+
+
+def test_reversed_range_and_no_reference():
+    assert referenced_items("questions 4-2") == ({2, 3, 4}, set())
+    assert referenced_items("How do I study better?") == (set(), set())
+    assert referenced_items(None) == (set(), set())
+
+
+def test_context_block_filters_to_named_items():
+    context = build_context(MCQS, FLASHCARDS)
+
+    block = context_block(context, "explain questions 2-3", filtered=True)
+
+    assert "Question 2: Question text 2?" in block
+    assert "Question 3: Question text 3?" in block
+    assert "Question 1:" not in block
+    assert "Card 1:" not in block
+    assert "the set has 5 MCQs and 3 flashcards" in block
+
+
+def test_context_block_falls_back_to_full_block():
+    context = build_context(MCQS, FLASHCARDS)
+
+    assert context_block(context, "question 9", filtered=True) == context['full']
+    assert context_block(context, "explain question 2", filtered=False) == context['full']
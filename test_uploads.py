@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Tests for per-request upload storage: in-memory uploads and the spill to disk
+"""
+
+import io
+import os
+import hashlib
+from uploads import save_upload
+
+LIMIT = 1024
+
+
+def test_upload_at_limit_stays_in_memory(tmp_path):
+    data = os.urandom(LIMIT)
+
+    stored = save_upload(io.BytesIO(data), 'notes.pdf', str(tmp_path), memory_limit=LIMIT, chunk_size=100)
+
+    assert stored.in_memory
+    assert stored.data == data
+    assert stored.path is None
+    assert stored.size == LIMIT
+    assert stored.digest == hashlib.sha256(data).hexdigest()
+    assert os.listdir(tmp_path) == []
+
+
+def test_upload_past_limit_spills_to_its_own_directory(tmp_path):
+    data = os.urandom(LIMIT + 1)
+
+    stored = save_upload(io.BytesIO(data), 'notes.pdf', str(tmp_path), memory_limit=LIMIT, chunk_size=100)
+
+    assert not stored.in_memory
+    assert os.path.dirname(stored.path) == stored.directory
+    assert os.path.dirname(stored.directory) == str(tmp_path)
+    with open(stored.path, 'rb') as f:
+        assert f.read() == data
+    assert stored.size == LIMIT + 1
+    assert stored.digest == hashlib.sha256(data).hexdigest()
+    assert stored.file_ext == 'pdf'
+
+    stored.cleanup()
+    assert not os.path.exists(stored.directory)
+
+
+def test_same_name_uploads_do_not_collide(tmp_path):
+    first = save_upload(io.BytesIO(b'a' * (LIMIT + 1)), 'slides.pptx', str(tmp_path), memory_limit=LIMIT)
+    second = save_upload(io.BytesIO(b'b' * (LIMIT + 1)), 'slides.pptx', str(tmp_path), memory_limit=LIMIT)
+
+    assert first.path != second.path
+    with open(first.path, 'rb') as f:
+        assert f.read(1) == b'a'
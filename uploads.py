@@ -0,0 +1,87 @@
+import io
+import os
+import shutil
+import hashlib
+import tempfile
+from documents import ParsedDocument
+
+# Uploads are copied in chunks of this size
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_KB', 64)) * 1024
+
+# Uploads up to this size are kept in memory and never written to disk
+UPLOAD_MEMORY_LIMIT = int(os.getenv('UPLOAD_MEMORY_LIMIT_KB', 2048)) * 1024
+
+
+class StoredUpload:
+    """One request's uploaded file, in memory or in its own temp directory
+
+    `digest` is the SHA-256 of the bytes, computed while the upload was
+    stored, so the extraction cache never has to read the file again.
+    """
+
+    def __init__(self, filename, file_ext, digest, size, data=None, path=None, directory=None):
+        self.filename = filename
+        self.file_ext = file_ext
+        self.digest = digest
+        self.size = size
+        self.data = data
+        self.path = path
+        self.directory = directory
+
+    @property
+    def in_memory(self):
+        return self.data is not None
+
+    def open_document(self):
+        """Open the upload as a ParsedDocument"""
+        return ParsedDocument(self.path, self.file_ext, data=self.data, name=self.filename)
+
+    def cleanup(self):
+        """Delete the upload's temp directory, if it has one"""
+        self.data = None
+        if self.directory and os.path.isdir(self.directory):
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def save_upload(stream, filename, upload_dir, memory_limit=None, chunk_size=None):
+    """Copy an upload stream into per-request storage, hashing as it goes
+
+    Bytes are buffered in memory until they exceed `memory_limit`; larger
+    uploads are spilled to a file inside a fresh temp directory under
+    `upload_dir`, so concurrent uploads of the same name never collide.
+    """
+    memory_limit = UPLOAD_MEMORY_LIMIT if memory_limit is None else memory_limit
+    chunk_size = chunk_size or UPLOAD_CHUNK_SIZE
+    file_ext = filename.rsplit('.', 1)[1].lower()
+
+    sha = hashlib.sha256()
+    buffer = io.BytesIO()
+    size = 0
+    directory = None
+    path = None
+    out = None
+
+    try:
+        for chunk in iter(lambda: stream.read(chunk_size), b''):
+            sha.update(chunk)
+            size += len(chunk)
+            if out is None and size > memory_limit:
+                # Too big to keep in memory: move what we have to disk
+                directory = tempfile.mkdtemp(prefix='upload-', dir=upload_dir)
+                path = os.path.join(directory, filename)
+                out = open(path, 'wb')
+                out.write(buffer.getvalue())
+                buffer = None
+            (out or buffer).write(chunk)
+    except Exception:
+        if out is not None:
+            out.close()
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
+        raise
+    if out is not None:
+        out.close()
+
+    data = buffer.getvalue() if buffer is not None else None
+    print(f"Stored upload {filename}: {size / 1024:.2f} KB {'in memory' if data is not None else 'on disk'}")
+    return StoredUpload(filename, file_ext, sha.hexdigest(), size, data=data, path=path, directory=directory)